@@ -0,0 +1,116 @@
+"""
+Benchmark of TermFinder.split_compound on the German vocabulary of the bundled challenge sets.
+
+Compares the current scorer with the original implementation (kept below as the reference),
+checks that both return the same ranked splits and reports words per second.
+
+Run from the repository root, with ngram_probs.json in the working directory or the repository root:
+
+    python -m benchmarks.split_compound --repeat 5
+"""
+import argparse
+import glob
+import re
+import time
+
+from utils.term_finder_utils import TermFinder, get_resources
+
+resources = get_resources("de")
+
+
+def reference_split_compound(word):
+    """Original split_compound scorer, used as the baseline"""
+    ngram_probs = resources.ngram_probs
+    word = word.lower()
+
+    if '-' in word:
+        return [(1., re.search('(.*)-', word.title()).group(1), re.sub('.*-', '', word.title()))]
+
+    scores = list()
+
+    for n in range(3, len(word)-2):
+        pre_slice = word[:n]
+
+        if pre_slice.endswith('ts') or pre_slice.endswith('gs') or pre_slice.endswith('ks') \
+                or pre_slice.endswith('hls') or pre_slice.endswith('ns'):
+            if len(word[:n-1]) > 2: pre_slice = word[:n-1]
+
+        pre_slice_prob = list()
+        in_slice_prob = list()
+        start_slice_prob = list()
+
+        for k in range(len(word)+1, 2, -1):
+
+            if not pre_slice_prob and k <= len(pre_slice):
+                end_ngram = pre_slice[-k:]
+                pre_slice_prob.append(ngram_probs["suffix"].get(end_ngram, -1))
+
+            in_ngram = word[n:n+k]
+            in_slice_prob.append(ngram_probs["infix"].get(in_ngram, 1))
+
+            if not start_slice_prob:
+                ngram = word[n:n+k]
+                if ngram.endswith('ts') or ngram.endswith('gs') or ngram.endswith('ks') \
+                        or ngram.endswith('hls') or ngram.endswith('ns'):
+                    if len(ngram[:-1]) > 2:
+                        ngram = ngram[:-1]
+
+                start_slice_prob.append(ngram_probs["prefix"].get(ngram, -1))
+
+        if not pre_slice_prob or not start_slice_prob:
+            continue
+
+        start_slice_prob = max(start_slice_prob)
+        pre_slice_prob = max(pre_slice_prob)
+        in_slice_prob = min(in_slice_prob)
+        score = start_slice_prob - in_slice_prob + pre_slice_prob
+        scores.append((score, word[:n].title(), word[n:].title()))
+
+    scores.sort(reverse=True)
+
+    if not scores:
+        scores = [[0, word.title(), word.title()]]
+
+    return sorted(scores, reverse = True)
+
+
+def legal_vocabulary():
+    """German words from the bundled test sets and translations"""
+    words = set()
+    for path in glob.glob("data/*/*.txt") + glob.glob("data/*/*.csv"):
+        with open(path, encoding="ISO-8859-1") as f:
+            words.update(re.findall(r"[^\W\d_]{3,}(?:-[^\W\d_]+)*", f.read()))
+    return sorted(words)
+
+
+def words_per_second(split_function, words, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for word in words:
+            split_function(word)
+    return repeat * len(words) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compound splitting.")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the vocabulary. Default is 5.")
+    args = parser.parse_args()
+
+    words = legal_vocabulary()
+    # Uncached scorer, so every call does the full work
+    split_compound = TermFinder(None, [], resources=resources)._split_compound
+
+    mismatches = [word for word in words if list(map(tuple, split_compound(word))) != list(map(tuple, reference_split_compound(word)))]
+    if mismatches:
+        raise AssertionError(f"Scorer differs from the reference on {len(mismatches)} words, e.g. {mismatches[:5]}")
+
+    print(f"{len(words)} words, identical splits")
+    # Long words are the compounds the fallback actually has to split
+    for label, subset in (("all words", words), ("words of 12+ letters", [word for word in words if len(word) >= 12])):
+        before = words_per_second(reference_split_compound, subset, args.repeat)
+        after = words_per_second(split_compound, subset, args.repeat)
+        print(f"{label} ({len(subset)}): before {before:,.0f} words/s, after {after:,.0f} words/s ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Benchmarks of the preprocessing and term-finding hot paths on synthetic challenge sets.
+
+Every benchmark runs once for the throughput and, unless --no-memory is given, a second time under
+tracemalloc for the peak memory it allocates (Python and numpy allocations). Results are written as
+JSON; pass the JSON of a previous version with --baseline to flag throughput regressions.
+
+Run from the repository root (the German compound splitter needs ngram_probs.json, see --ngram-path):
+
+    python -m benchmarks.suite --lang de --sizes 1000,10000
+    python -m benchmarks.suite --scale full --output bench_full.json
+    python -m benchmarks.suite --baseline bench_old.json --tolerance 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import spacy
+
+from utils.preproc_utils import fill_nan_values, lemmatize_sentence, lemmatize_sentences, load_pipeline, SPACY_MODELS
+from utils.term_finder_utils import create_entries, TermFinder, get_resources, DOMAINS
+from utils.results_utils import save_term_results
+from benchmarks.synthetic import synthetic_testset, filled_testset, TRANSLATION_COLUMN
+
+SCALES = {
+    "small": [1000, 10000],
+    "full": [1000, 10000, 100000, 1000000],
+}
+
+# name -> setup function, see benchmark()
+BENCHMARKS = {}
+
+
+def benchmark(name, german_only=False, needs_model=False):
+    """
+    Register a benchmark.
+
+    The decorated setup function receives the Workload and returns (run, items): run() is the timed
+    call without arguments and items the number of rows or words it processes. Setup is not timed and
+    is called again before the memory run, so caches start cold both times.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, german_only, needs_model)
+        return setup
+    return decorator
+
+
+# Data and shared objects of one benchmark size
+class Workload:
+
+    def __init__(self, n_rows, lang, seed, resources, model):
+        """
+        Initialize the Workload class.
+
+        Args:
+            n_rows: Number of synthetic rows.
+            lang: "de" or "it".
+            seed: Seed of the synthetic generator.
+            resources: TermFinderResources of the language.
+            model: Loaded spaCy pipeline for the lemmatization benchmarks, or None.
+        """
+        self.n_rows = n_rows
+        self.lang = lang
+        self.resources = resources
+        self.model = model
+        self.raw = synthetic_testset(n_rows, lang, seed)
+        self.df = filled_testset(self.raw)
+        self.sentences = self.df[TRANSLATION_COLUMN].tolist()
+        self.entries = create_entries(self.df, [TRANSLATION_COLUMN], homonym=True)[TRANSLATION_COLUMN]
+
+
+    def term_finder(self):
+        """TermFinder over the synthetic entries, with cold matcher and split caches"""
+        return TermFinder(self.resources.nlp, self.entries, resources=self.resources)
+
+
+@benchmark("lemmatize_sentence", needs_model=True)
+def _lemmatize_sentence(work):
+    def run():
+        for sentence in work.sentences:
+            lemmatize_sentence(sentence, work.model)
+    return run, work.n_rows
+
+
+@benchmark("lemmatize_sentences", needs_model=True)
+def _lemmatize_sentences(work):
+    return (lambda: lemmatize_sentences(work.df[TRANSLATION_COLUMN], work.model)), work.n_rows
+
+
+@benchmark("fill_nan_values")
+def _fill_nan_values(work):
+    df = work.raw.copy()
+
+    def run():
+        for column in ("TARGET HYPOTHESIS ", "N. TERMINE"):
+            fill_nan_values(df, column)
+    return run, work.n_rows
+
+
+@benchmark("phrase_matcher")
+def _phrase_matcher(work):
+    tf = work.term_finder()
+    targets = work.df["TARGET HYPOTHESIS "].tolist()
+
+    def run():
+        for sentence, target in zip(work.sentences, targets):
+            tf.phrase_matcher(sentence, [target])
+    return run, work.n_rows
+
+
+@benchmark("split_compound", german_only=True)
+def _split_compound(work):
+    tf = work.term_finder()
+    words = [word for sentence in work.sentences for word in sentence.split()]
+
+    def run():
+        for word in words:
+            tf.split_compound(word)
+    return run, len(words)
+
+
+@benchmark("_compound_split_matcher", german_only=True)
+def _compound_split_matcher(work):
+    tf = work.term_finder()
+    targets = work.df["TARGET HYPOTHESIS "].tolist()
+
+    def run():
+        for sentence, target in zip(work.sentences, targets):
+            tf._compound_split_matcher(sentence, [target])
+    return run, work.n_rows
+
+
+def _find_terms_setup(domain):
+    def setup(work):
+        tf = work.term_finder()
+        return (lambda: tf.find_terms(domain)), work.n_rows
+    return setup
+
+
+for _domain in DOMAINS:
+    benchmark(f"find_terms[{_domain}]")(_find_terms_setup(_domain))
+
+
+@benchmark("save_term_results")
+def _save_term_results(work):
+    results = {TRANSLATION_COLUMN: work.term_finder().find_terms("South-Tyrol")}
+    # Removed once run is garbage collected
+    output_dir = tempfile.TemporaryDirectory(prefix="bench_results_")
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            save_term_results(results, "bench_terms", output_dir=output_dir.name)
+    return run, work.n_rows
+
+
+def measure(setup, work, memory=True):
+    """
+    Run a benchmark, returning its measurements.
+
+    Returns:
+        dict with items, seconds, items_per_s and peak_mb (None without the memory run)
+    """
+    run, items = setup(work)
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+
+    peak_mb = None
+    if memory:
+        run, _ = setup(work)
+        tracemalloc.start()
+        try:
+            run()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "items": items,
+        "seconds": round(seconds, 6),
+        "items_per_s": round(items / seconds, 2) if seconds else None,
+        "peak_mb": None if peak_mb is None else round(peak_mb, 3),
+    }
+
+
+def environment(args):
+    """Versions and settings the results depend on"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "spacy": spacy.__version__,
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "lang": args.lang,
+        "seed": args.seed,
+        "model": args.model,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare throughputs with a previous run.
+
+    Returns:
+        List of (benchmark, rows, ratio) where the throughput fell below (1 - tolerance) of the baseline
+    """
+    previous = {(r["benchmark"], r["rows"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["benchmark"], result["rows"]))
+        if not old or not old.get("items_per_s") or not result.get("items_per_s"):
+            continue
+        ratio = result["items_per_s"] / old["items_per_s"]
+        print(f"{result['benchmark']:<28} {result['rows']:>9}  {ratio:6.2f}x of baseline")
+        if ratio < 1 - tolerance:
+            regressions.append((result["benchmark"], result["rows"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing and term-finding hot paths.")
+    parser.add_argument("--lang", choices=["de", "it"], default="de", help='Language of the synthetic data. Default is "de".')
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small",
+                        help='"small" (1k and 10k rows, default) or "full" (1k to 1M rows).')
+    parser.add_argument("--sizes", default=None, help="Comma-separated row counts, overrides --scale.")
+    parser.add_argument("--only", default=None, help="Comma-separated benchmark names to run. Default is all.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data. Default is 0.")
+    parser.add_argument("--model", default=None, help="spaCy model for the lemmatization benchmarks. Default is the model of --lang.")
+    parser.add_argument("--ngram-path", default=None, help="ngram_probs.json or its converted store (German only).")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of every benchmark.")
+    parser.add_argument("--output", default="data/results_analysis/benchmark_results.json",
+                        help='JSON file of the results. Default is "data/results_analysis/benchmark_results.json".')
+    parser.add_argument("--baseline", default=None, help="JSON of a previous run to compare throughputs with.")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed throughput drop against --baseline before exiting with an error. Default is 0.1.")
+    args = parser.parse_args()
+
+    args.model = args.model or SPACY_MODELS[args.lang]
+    sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else SCALES[args.scale]
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks {unknown}, choose among {list(BENCHMARKS)}")
+
+    resources = get_resources(args.lang, args.ngram_path)
+
+    model, skip_reason = None, None
+    if any(BENCHMARKS[name][2] for name in names):
+        try:
+            model = load_pipeline(args.model)
+        except OSError as e:
+            skip_reason = f"spaCy model {args.model} not available: {e}"
+            print(f"Skipping the lemmatization benchmarks, {skip_reason}")
+
+    results = []
+    print(f"{'benchmark':<28} {'rows':>9} {'items/s':>12} {'seconds':>9} {'peak MB':>9}")
+    for n_rows in sizes:
+        work = Workload(n_rows, args.lang, args.seed, resources, model)
+        for name in names:
+            setup, german_only, needs_model = BENCHMARKS[name]
+            if german_only and args.lang != "de":
+                continue
+            if needs_model and model is None:
+                results.append({"benchmark": name, "rows": n_rows, "skipped": skip_reason})
+                continue
+
+            result = {"benchmark": name, "rows": n_rows, **measure(setup, work, memory=not args.no_memory)}
+            results.append(result)
+            peak = "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+            print(f"{name:<28} {n_rows:>9} {result['items_per_s']:>12,.0f} {result['seconds']:>9.3f} {peak:>9}")
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(args), "results": results}, f, indent=2)
+    print(f"Results saved to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            for name, n_rows, ratio in regressions:
+                print(f"Regression: {name} on {n_rows} rows runs at {ratio:.2f}x of the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Synthetic challenge sets for the benchmarks.
+
+Rows have the columns of the bundled homonym test set and one translation column. As in the real
+data, every term has a block of example sentences and the term fields are only filled on the first
+row of the block, so fill_nan_values has work to do. Translations contain the target term as is, as
+part of a compound (found only by the compound-split fallback), a term of another domain, or no term.
+
+The output only depends on the language, the number of rows and the seed.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+from utils.preproc_utils import fill_nan_values, conditional_fill_nan_values
+
+TRANSLATION_COLUMN = "synthetic_mt"
+
+# (target term, alternative South-Tyrolean terms, terms of other legal systems, homonym options)
+TERMS = {
+    "de": [
+        ("Hausmeister", ["Schulwart"], ["Hauswart"], ["Hausmeister", "Verwahrer"]),
+        ("gesetzesvertretendes Dekret", ["Legislativdekret", "GvD"], [], ["Dekret", "Verordnung"]),
+        ("Landesgesetz", [], ["Landesverordnung"], ["Gesetz", "Satzung"]),
+        ("Gemeindeausschuss", ["Stadtrat"], ["Gemeinderat"], ["Ausschuss", "Rat"]),
+        ("Rechtsanwalt", [], ["Advokat"], ["Anwalt", "Vertreter"]),
+        ("Unterschiebung eines Kindes", [], ["Kindesunterschiebung"], ["Unterschiebung", "Vertauschung"]),
+        ("Vergabeverfahren", ["Ausschreibung"], [], ["Verfahren", "Vergabe"]),
+        ("Verwaltungsgericht", ["Regionales Verwaltungsgericht"], ["Landesverwaltungsgericht"], ["Gericht", "Kammer"]),
+        ("Grundbuch", [], ["Liegenschaftsbuch"], ["Buch", "Register"]),
+        ("Bürgermeister", [], ["Gemeindevorsteher"], ["Meister", "Vorsteher"]),
+        ("Mehrwertsteuer", ["MwSt"], ["Umsatzsteuer"], ["Steuer", "Abgabe"]),
+        ("Beschluss", ["Entscheidung"], [], ["Beschluss", "Verfügung"]),
+    ],
+    "it": [
+        ("custode", ["bidello"], ["portiere"], ["custode", "guardiano"]),
+        ("decreto legislativo", ["d.lgs."], [], ["decreto", "regolamento"]),
+        ("legge provinciale", [], ["legge regionale"], ["legge", "statuto"]),
+        ("giunta comunale", ["giunta"], ["consiglio comunale"], ["giunta", "consiglio"]),
+        ("avvocato", [], ["procuratore legale"], ["avvocato", "difensore"]),
+        ("appalto pubblico", ["gara d'appalto"], [], ["appalto", "gara"]),
+        ("tribunale amministrativo", ["TAR"], ["consiglio di stato"], ["tribunale", "corte"]),
+        ("libro fondiario", [], ["catasto"], ["libro", "registro"]),
+        ("sindaco", [], ["primo cittadino"], ["sindaco", "podestà"]),
+        ("imposta sul valore aggiunto", ["IVA"], [], ["imposta", "tassa"]),
+        ("delibera", ["deliberazione"], [], ["delibera", "decisione"]),
+        ("ricorso", ["impugnazione"], ["reclamo"], ["ricorso", "istanza"]),
+    ],
+}
+
+# Sentence frames, {} is replaced by the term (or by nothing relevant)
+TEMPLATES = {
+    "de": [
+        "Der {} ist gemäß Artikel {} des Gesetzes für die Verwaltung der Schule zuständig.",
+        "Nach Anhörung des zuständigen Amtes entscheidet die Behörde über den {} innerhalb von {} Tagen.",
+        "Die Bestimmungen über den {} finden ab dem Jahr {} Anwendung.",
+        "Im Sinne des Landesgesetzes ist der {} verpflichtet, die Unterlagen binnen {} Monaten vorzulegen.",
+        "Der Antrag auf {} ist bei der Gemeinde einzureichen, die ihn innerhalb von {} Tagen prüft.",
+    ],
+    "it": [
+        "Il {} è competente ai sensi dell'articolo {} della legge per l'amministrazione della scuola.",
+        "Sentito l'ufficio competente, l'autorità decide sul {} entro {} giorni.",
+        "Le disposizioni relative al {} trovano applicazione a decorrere dall'anno {}.",
+        "Ai sensi della legge provinciale il {} è tenuto a presentare la documentazione entro {} mesi.",
+        "La domanda di {} va presentata al comune, che la esamina entro {} giorni.",
+    ],
+}
+
+# Filler nouns for sentences without any term of the row
+FILLERS = {
+    "de": ["Antrag", "Frist", "Behörde", "Verfahren", "Bescheid"],
+    "it": ["domanda", "termine", "autorità", "procedura", "provvedimento"],
+}
+
+# Compound heads, so the target term only appears inside a longer word
+COMPOUND_HEADS = {
+    "de": ["stelle", "pflicht", "verfahren", "ordnung"],
+    "it": [],
+}
+
+ROWS_PER_TERM = 5
+
+
+def _translation(rng, lang, target, other_tyrol, other_systems):
+    """One translated sentence: the target term, a compound with it, another domain's term or none"""
+    template = rng.choice(TEMPLATES[lang])
+    number = rng.randint(1, 120)
+    kind = rng.random()
+
+    if kind < 0.5:
+        term = target
+    elif kind < 0.65 and COMPOUND_HEADS[lang] and " " not in target:
+        # e.g. Hausmeisterstelle, found by the compound splitter only
+        term = target + rng.choice(COMPOUND_HEADS[lang])
+    elif kind < 0.8 and (other_tyrol or other_systems):
+        term = rng.choice(other_tyrol + other_systems)
+    else:
+        term = rng.choice(FILLERS[lang])
+
+    return template.format(term, number)
+
+
+def synthetic_testset(n_rows, lang="de", seed=0):
+    """
+    Generates a synthetic challenge set, already in the shape of the preprocessed data.
+
+    Parameters:
+    - n_rows: int, number of rows
+    - lang: "de" or "it", language of the terms and translations
+    - seed: int, seed of the random generator
+
+    Returns:
+    - pandas DataFrame with the test set columns (term fields only on the first row of every block)
+      and the TRANSLATION_COLUMN
+    """
+    rng = random.Random(seed)
+    terms = TERMS[lang]
+
+    term_ids = np.empty(n_rows)
+    targets, other_tyrols, other_systems_col, options, translations = [], [], [], [], []
+
+    for row in range(n_rows):
+        term_number = row // ROWS_PER_TERM
+        target, other_tyrol, other_systems, homonyms = terms[term_number % len(terms)]
+        first_row = row % ROWS_PER_TERM == 0
+
+        term_ids[row] = term_number + 1 if first_row else np.nan
+        targets.append(target if first_row else np.nan)
+        other_tyrols.append(", ".join(other_tyrol) if first_row and other_tyrol else np.nan)
+        other_systems_col.append(", ".join(other_systems) if first_row and other_systems else np.nan)
+        options.append(", ".join(homonyms))
+        translations.append(_translation(rng, lang, target, other_tyrol, other_systems))
+
+    return pd.DataFrame({
+        "N. TERMINE": term_ids,
+        "TARGET HYPOTHESIS ": targets,
+        "ALTRE OPZIONI STAA (CSV)": other_tyrols,
+        "TERMINI ALTRI ORDINAMENTI (CSV)": other_systems_col,
+        "OPTIONS": options,
+        TRANSLATION_COLUMN: translations,
+    })
+
+
+def filled_testset(df):
+    """The synthetic set after the preprocessing fills, as find_terms_2.py reads it"""
+    df = df.copy()
+    for column in ("TARGET HYPOTHESIS ", "N. TERMINE"):
+        df = fill_nan_values(df, column)
+    for column in ("ALTRE OPZIONI STAA (CSV)", "TERMINI ALTRI ORDINAMENTI (CSV)"):
+        df = conditional_fill_nan_values(df, column, "N. TERMINE")
+    return df
@@ -1,12 +1,20 @@
 from configparser import ConfigParser
 import argparse
+import os
 
-import pandas as pd
-import spacy
+import numpy as np
 
-from spacy.lang.de import German
-from spacy.lang.it import Italian
-from spacy.matcher import PhraseMatcher
+from utils.config.config import set_lang
+from utils.term_finder_utils import create_entries, MatcherCache, SplitCache, TermIndex, get_resources
+from utils.results_utils import save_term_results, find_terms_multi_over_models, print_success_rate, RESULT_FILES, \
+    CATEGORY_NAMES
+from utils.stream_utils import stream_find_terms, write_stream_success_rates
+from utils.model_cache import ModelCache, frame_hash, term_index_key, TERM_COLUMNS
+from utils.table_io import OUTPUT_FORMATS, check_format, read_preprocessed, with_format
+from utils.profiling import Profiler
+from utils.doc_store import docs_path
+from utils.analytics import hit_matrix, read_group_columns, analyze, write_analytics, GROUP_COLUMNS, TERM_COLUMN
+from utils.shard_utils import parse_shard, shard_path, read_preprocessed_shard, save_shard_counts
 
 #reading model names
 config = ConfigParser()
@@ -23,31 +31,147 @@ parser.add_argument('--lang', choices=['de', 'it'], default='de',
     help='Choose your target language: "de" (Deutsch) or "it" (Italian). Default is "de".'
 )
 
+parser.add_argument('--split-cache', default=None,
+    help='Directory where compound splits are cached between runs (German only). Omit to keep them in memory only.'
+)
+
+parser.add_argument('--ngram-path', default=None,
+    help='Path of ngram_probs.json or of its converted store (German only). Default: looked up in the working directory, then in the repository root.'
+)
+
+parser.add_argument('--workers', type=int, default=1,
+    help='Number of worker processes used for matching. Default is 1 (no process pool). Not used with --stream.'
+)
+
+parser.add_argument('--stream', action="store_true",
+    help='Read, match and write the preprocessed data chunk by chunk, so memory is bounded by --chunk-size.'
+)
+
+parser.add_argument('--chunk-size', type=int, default=10000,
+    help='Number of rows per chunk with --stream. Default is 10000.'
+)
+
+parser.add_argument('--cache-dir', default=None,
+    help='Directory where the matches of every model are cached, keyed by its preprocessed translations, the test set '
+         'terms and the ngram table. Only new or changed models are matched. Not used with --stream.'
+)
+
+parser.add_argument('--term-index-cache', default=None,
+    help='Directory where the compiled index of all test set terms (pattern Docs and split, lemmatized terms) is kept '
+         'between runs, keyed by the test set terms and the ngram table. Omit to build it on every run.'
+)
+
+parser.add_argument('--docs', action="store_true",
+    help='Match the Docs written by preproc_2.py --save-docs instead of tokenizing the lemmatized sentences again. '
+         'Not used with --stream.'
+)
+
+parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+    help='Format of the preprocessed data and of the results: "csv" (default) or "parquet" (matches stored as list '
+         'columns, needs pyarrow). Use the same format as preproc_2.py.'
+)
+
+parser.add_argument('--analytics', action="store_true",
+    help='Also write success rates with bootstrap confidence intervals, rates by term (N. TERMINE) and by AMBITO, and '
+         'paired significance tests between models, as CSV and JSON to --analytics-dir.'
+)
+
+parser.add_argument('--analytics-dir', default='data/results_analysis/analytics',
+    help='Output directory of --analytics. Default is data/results_analysis/analytics.'
+)
+
+parser.add_argument('--bootstrap', type=int, default=10000,
+    help='Number of bootstrap resamples of --analytics. Default is 10000.'
+)
+
+parser.add_argument('--bootstrap-unit', choices=['row', 'term'], default='row',
+    help='Resample single rows ("row", default) or all rows of a term number together ("term") with --analytics.'
+)
+
+parser.add_argument('--confidence', type=float, default=0.95,
+    help='Level of the confidence intervals of --analytics. Default is 0.95.'
+)
+
+parser.add_argument('--seed', type=int, default=0,
+    help='Seed of the bootstrap of --analytics. Default is 0.'
+)
+
+parser.add_argument('--shard', default=None,
+    help='Match only shard i of N (i/N, counting from 0, e.g. $SLURM_ARRAY_TASK_ID/8): the .shard-i-of-N file of '
+         'preproc_2.py --shard if it exists, otherwise the same rows of the preprocessed data. Results and the counts '
+         'of the success rates go to .shard-i-of-N files, join them with merge_shards.py. Not used with --stream or '
+         '--analytics.'
+)
+
+parser.add_argument('--profile', action="store_true",
+    help='Time every stage (model and ngram loading, tokenization, matchers, exact matching, compound-split fallback per '
+         'domain) and count hits, print a summary table and write it as JSON to --profile-output.'
+)
+
+parser.add_argument('--profile-output', default='data/results_analysis/profile_find_terms.json',
+    help='JSON file of --profile. Default is data/results_analysis/profile_find_terms.json.'
+)
+
 args = parser.parse_args()
 
-#Load model and matcher
-if args.lang == 'de':
-    nlp_lang = German()
-    print("German model and matcher loaded.")
-elif args.lang == 'it':   
-    nlp_lang = Italian()
-    print("Italian model and matcher loaded.")
-else:
-    raise ValueError("Unsupported language. Please choose 'de' or 'it'.")
+if args.stream and args.cache_dir:
+    parser.error('--cache-dir cannot be combined with --stream')
+if args.stream and args.docs:
+    parser.error('--docs cannot be combined with --stream')
+
+check_format(args.format)
+if not 0 < args.confidence < 1:
+    parser.error('--confidence must be between 0 and 1')
+if args.bootstrap < 1:
+    parser.error('--bootstrap must be at least 1')
+if args.shard and (args.stream or args.analytics):
+    parser.error('--shard cannot be combined with --stream or --analytics')
+shard = None
+if args.shard:
+    try:
+        shard = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
 
 #Setting lang argument as global
-from utils.config.config import set_lang
 set_lang(args.lang)
 
-#Finally importing utils that depend on the language setting
-from utils.term_finder_utils import create_entries, TermFinder
-from utils.results_utils import save_term_results, find_terms_over_models, print_success_rate
+# Records nothing without --profile
+profiler = Profiler(enabled=args.profile)
+
+#Language objects and ngram probabilities, loaded on first use and shared by all term finders
+resources = get_resources(args.lang, args.ngram_path)
+with profiler.stage("load language model"):
+    nlp_lang = resources.nlp
+if profiler.enabled and args.lang == 'de':
+    # Loaded up front when profiling, so the first compound-split fallback is not charged for it
+    with profiler.stage("load ngram probabilities"):
+        resources.ngram_probs
+print(f"{'German' if args.lang == 'de' else 'Italian'} model loaded.")
 
 #import data
 if args.hom:
-    df = pd.read_csv('data/preprocessed_data_homs.csv', delimiter=';', encoding='utf-8-sig')
+    preprocessed_file = 'data/preprocessed_data_homs.csv'
 else:
-    df = pd.read_csv('data/preprocessed_data_2.csv', delimiter=';', encoding='utf-8-sig')
+    preprocessed_file = 'data/preprocessed_data_2.csv'
+
+# A shard reads its own file written by preproc_2.py --shard, or its rows of the whole preprocessed data
+shard_rows = None
+if shard is not None:
+    if os.path.exists(with_format(shard_path(preprocessed_file, *shard), args.format)):
+        preprocessed_file = shard_path(preprocessed_file, *shard)
+    else:
+        shard_rows = shard
+        if args.docs:
+            parser.error('--docs with --shard needs the shard file of preproc_2.py --shard --save-docs')
+    print(f"Shard {shard[0]} of {shard[1]}: reading {preprocessed_file}{' (shard rows)' if shard_rows else ''}")
+
+def read_input(columns=None):
+    """Preprocessed data of this run, only the rows of the shard with --shard"""
+    if shard_rows is None:
+        return read_preprocessed(preprocessed_file, args.format, columns=columns)
+    df = read_preprocessed_shard(preprocessed_file, args.format, *shard_rows)
+    return df if columns is None else df[columns]
 
 #Read translation by models
 models_str = config.get('main', 'models')
@@ -55,65 +179,139 @@ models_list = [item.strip() for item in models_str.split(',')]
 
 print(models_list)
 
-entries_dict = create_entries(df, models_list, homonym=args.hom)
+#Now find terms
+
+# Compiled matchers, the index of all terms and compound splits are shared across models and domains
+matcher_cache = MatcherCache(nlp_lang)
+if args.term_index_cache:
+    # Only the term columns are read here, so the index can be loaded in --stream mode too
+    term_columns = TERM_COLUMNS + (['OPTIONS'] if args.hom else [])
+    with profiler.stage("load term index"):
+        index_key = term_index_key(read_input(columns=term_columns)[term_columns],
+                                   resources.ngram_hash if args.lang == 'de' else '', args.lang, nlp_lang)
+        term_index = TermIndex.for_test_set(nlp_lang, args.term_index_cache, index_key)
+    print(f"Loaded {len(term_index)} indexed term patterns from {term_index.path}")
+else:
+    term_index = TermIndex(nlp_lang)
+if args.split_cache and args.lang == 'de':
+    split_cache = SplitCache.for_ngrams(args.split_cache, resources.ngram_hash)
+    print(f"Loaded {len(split_cache)} cached compound splits from {split_cache.path}")
+else:
+    split_cache = SplitCache()
 
-#CHECK WHAT WE HAVE
-# After creating entries_dict, check what you have:
-#print("\n=== CHECKING ENTRY DATA ===")
-#for col in models_list:
-#    entry_list = entries_dict[col]
-#    print(f"\n{col}: {len(entry_list)} entries")
-    
-    # Check first few entries
-#    for i, (sent, term, other_term, other_sys, *homonym) in enumerate(entry_list[:4]):
-#        print(f"  Entry {i}:")
-#        print(f"    Sentence: {sent[5:8]}...")
-#        print(f"    Term: {term}")
-#        print(f"    Type of term: {type(term)}")
+# Output file and heading of the success rate of each domain
+domains = ["South-Tyrol", "other_tyrol", "other_systems"]
+if args.hom:
+    domains.append("homonym")
 
+result_files = RESULT_FILES
+category_names = CATEGORY_NAMES
 
+if args.stream:
+    # Match and append to the result files chunk by chunk, keeping only the counts for the success rates
+    # (and the rows with a match for --analytics)
+    hit_rows = {} if args.analytics else None
+    counts = stream_find_terms(preprocessed_file, models_list, domains, result_files, nlp=nlp_lang, homonym=args.hom,
+                               chunk_size=args.chunk_size, matcher_cache=matcher_cache, split_cache=split_cache,
+                               resources=resources, fmt=args.format, profiler=profiler, term_index=term_index,
+                               hit_rows=hit_rows)
+    write_stream_success_rates(counts, category_names)
 
-#TO DO: optimize this iteration
-#Now find terms
+    if args.analytics:
+        hit_rows = {domain: {col: np.concatenate(chunks) for col, chunks in model_hits.items()}
+                    for domain, model_hits in hit_rows.items()}
+        groups = read_group_columns(preprocessed_file, args.format)
 
-# Find terms in the sentences. Returns a dictionary where the key is the model name, the values is a dict {"sentence": [term_matches]}
-st_term_results = find_terms_over_models(nlp_lang, entries_dict, models_list, "South-Tyrol")
-#print("HAVE A LOOK HERE")
-#print(type(st_term_results))
-#print(st_term_results)
-other_st_term_results = find_terms_over_models(nlp_lang, entries_dict, models_list, "other_tyrol")
-other_legal_system_results = find_terms_over_models(nlp_lang, entries_dict, models_list, "other_systems")
-if args.hom:
-    wrong_homonym_results = find_terms_over_models(nlp_lang, entries_dict, models_list, "homonym")
+else:
+    with profiler.stage("read preprocessed data"):
+        df = read_input()
+    with profiler.stage("create entries", items=len(df) * len(models_list)):
+        entries_dict = create_entries(df, models_list, homonym=args.hom)
 
+    # Reuse the matches of models whose preprocessed translations and terms did not change
+    models_to_match = models_list
+    if args.cache_dir:
+        model_cache = ModelCache(args.cache_dir)
+        ngram_id = resources.ngram_hash if args.lang == 'de' else ''
+        terms_id = frame_hash(df[TERM_COLUMNS + (['OPTIONS'] if args.hom else [])])
+        # Matches on the stored Docs can differ slightly from matches on the re-tokenized sentences
+        match_keys = {col: ModelCache.key(frame_hash(df[col]), terms_id, ngram_id, args.lang, ','.join(domains),
+                                          *(['docs'] if args.docs else []))
+                      for col in models_list}
 
-### SAVE AS CSV TO VISUALIZE RESULTS
-get_st_results = save_term_results(st_term_results, filename="South_Tyrol_terms")
-get_other_st_results = save_term_results(other_st_term_results, filename="other_south_tyrol_terms")
-get_other_legal_system_results = save_term_results(other_legal_system_results, filename="other_legal_systems_terms")
-if args.hom:
-    get_other_legal_system_results = save_term_results(wrong_homonym_results, filename="wrong_homonyms")
+        cached_results = {}
+        with profiler.stage("match cache lookup"):
+            for col, key in match_keys.items():
+                model_results = model_cache.load_matches(key)
+                if model_results is not None:
+                    cached_results[col] = model_results
+        profiler.count("cached models", len(cached_results))
 
+        models_to_match = [col for col in models_list if col not in cached_results]
+        print(f"Cached matches for {len(cached_results)} models, matching {len(models_to_match)}")
 
-###SAVE RESULTS OF SUCCESS RATE
-print_success_rate(
-    st_term_results,
-    category_name="Success rate of target South-Tyrolean terms",
-    clear_file=True
-)
+    # Find terms of all domains in one pass over the sentences. Returns a dictionary where the key is the domain,
+    # the value is a dict where the key is the model name, the value is the TermResults of the model
+    doc_paths = {col: docs_path(preprocessed_file, col) for col in models_list} if args.docs else None
+    domain_results = find_terms_multi_over_models(nlp_lang, entries_dict, models_to_match, domains, matcher_cache, split_cache,
+                                                  resources, workers=args.workers, profiler=profiler, term_index=term_index,
+                                                  doc_paths=doc_paths)
 
-print_success_rate(
-    other_st_term_results,
-    category_name="Success rate of alternative South-Tyrolean terms"
-)
+    if args.cache_dir:
+        for col in models_to_match:
+            model_cache.save_matches(match_keys[col], {domain: domain_results[domain][col] for domain in domains})
+        # Back to the order of the models list
+        domain_results = {domain: {col: cached_results[col][domain] if col in cached_results else domain_results[domain][col]
+                                   for col in models_list}
+                          for domain in domains}
 
-print_success_rate(
-    other_legal_system_results,
-    category_name="Success rate of terms from extraneous legal systems"
-)
+    ### SAVE AS CSV TO VISUALIZE RESULTS
+    with profiler.stage("save term results"):
+        for domain in domains:
+            filename = result_files[domain] if shard is None else shard_path(result_files[domain], *shard)
+            save_term_results(domain_results[domain], filename=filename, fmt=args.format)
 
-if args.hom:
-    print_success_rate(
-        wrong_homonym_results,
-        category_name="Percentage of incorrect homonym insertion"
-    )
\ No newline at end of file
+    ###SAVE RESULTS OF SUCCESS RATE
+    with profiler.stage("success rates"):
+        if shard is not None:
+            # merge_shards.py adds up the counts of all shards and writes the rates
+            counts = {domain: {col: (int(result.hit_rows().sum()), len(result)) for col, result in domain_results[domain].items()}
+                      for domain in domains}
+            counts_path = shard_path('data/results_analysis/term_counts.json', *shard)
+            save_shard_counts(counts, counts_path)
+            print(f"Success rate counts saved to: {counts_path}")
+        else:
+            for i, domain in enumerate(domains):
+                print_success_rate(
+                    domain_results[domain],
+                    category_name=category_names[domain],
+                    clear_file=(i == 0)
+                )
+
+    if args.analytics:
+        hit_rows = domain_results
+        groups = df[[column for column in GROUP_COLUMNS if column in df.columns]]
+
+if args.analytics:
+    with profiler.stage("analytics", items=args.bootstrap):
+        hits = hit_matrix(hit_rows, models_list, domains)
+        clusters = groups[TERM_COLUMN] if args.bootstrap_unit == 'term' and TERM_COLUMN in groups else None
+        tables = analyze(hits, models_list, domains, groups={column: groups[column] for column in groups.columns},
+                         n_resamples=args.bootstrap, confidence=args.confidence, seed=args.seed, clusters=clusters)
+        analytics_path = write_analytics(tables, args.analytics_dir,
+                                         settings={'resamples': args.bootstrap, 'unit': args.bootstrap_unit,
+                                                   'confidence': args.confidence, 'seed': args.seed,
+                                                   'rows': int(hits.shape[0])})
+    print(f"Analytics saved to: {analytics_path}")
+
+split_cache.save()
+term_index.save()
+print(f"Compound split cache: {split_cache.hits} hits, {split_cache.misses} misses")
+
+if profiler.enabled:
+    profiler.count("compound split cache hits", split_cache.hits)
+    profiler.count("compound split cache misses", split_cache.misses)
+    profiler.count("indexed term patterns", len(term_index))
+    print(profiler.summary())
+    profiler.save(args.profile_output)
+    print(f"Profile saved to: {args.profile_output}")
@@ -0,0 +1,84 @@
+import argparse
+import os
+
+from utils.results_utils import RESULT_FILES, CATEGORY_NAMES
+from utils.stream_utils import write_stream_success_rates
+from utils.shard_utils import shard_path, merge_tables, merge_shard_counts, missing_shards
+from utils.table_io import OUTPUT_FORMATS, check_format, with_format
+
+
+parser = argparse.ArgumentParser(description='Join the shards of preproc_2.py --shard and find_terms_2.py --shard.')
+
+parser.add_argument('--shards', type=int, required=True,
+    help='Number of shards N the scripts were run with (--shard i/N).'
+)
+
+parser.add_argument('--hom', action="store_true",
+    help='Include if you are testing on the honomym subset'
+)
+
+parser.add_argument('--stages', default='preprocess,find_terms',
+    help='Comma-separated outputs to join: "preprocess" (preprocessed data), "find_terms" (results and success rates). '
+         'Default is both.'
+)
+
+parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+    help='Format the scripts were run with: "csv" (default) or "parquet".'
+)
+
+parser.add_argument('--remove-shards', action="store_true",
+    help='Delete the shard files once they are joined.'
+)
+
+args = parser.parse_args()
+
+stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+unknown = [stage for stage in stages if stage not in ('preprocess', 'find_terms')]
+if unknown:
+    parser.error(f'unknown stages {unknown}, choose among preprocess and find_terms')
+if args.shards < 1:
+    parser.error('--shards must be at least 1')
+check_format(args.format)
+
+# Same files as a single-node run of the scripts
+if args.hom:
+    preprocessed_file = 'data/preprocessed_data_homs.csv'
+else:
+    preprocessed_file = 'data/preprocessed_data_simple_terms.csv'
+domains = ["South-Tyrol", "other_tyrol", "other_systems"] + (["homonym"] if args.hom else [])
+results_dir = 'data/results'
+counts_file = 'data/results_analysis/term_counts.json'
+
+# Every output with its shard files, all checked before anything is written
+merges = []
+if 'preprocess' in stages:
+    output_path = with_format(preprocessed_file, args.format)
+    merges.append((output_path, [shard_path(output_path, i, args.shards) for i in range(args.shards)]))
+if 'find_terms' in stages:
+    for domain in domains:
+        output_path = os.path.join(results_dir, f"{RESULT_FILES[domain]}.{args.format}")
+        merges.append((output_path, [shard_path(output_path, i, args.shards) for i in range(args.shards)]))
+    count_paths = [shard_path(counts_file, i, args.shards) for i in range(args.shards)]
+
+missing = [path for _, paths in merges for path in missing_shards(paths)]
+if 'find_terms' in stages:
+    missing += missing_shards(count_paths)
+if missing:
+    raise FileNotFoundError(f"Missing shard files: {', '.join(missing)}")
+
+for output_path, paths in merges:
+    merge_tables(paths, output_path, args.format)
+    print(f"Joined {len(paths)} shards into: {output_path}")
+
+if 'find_terms' in stages:
+    counts = merge_shard_counts(count_paths)
+    write_stream_success_rates(counts, CATEGORY_NAMES)
+    print("Success rates saved to: data/results_analysis/term_accuracy_rates")
+
+if args.remove_shards:
+    for _, paths in merges:
+        for path in paths:
+            os.remove(path)
+    if 'find_terms' in stages:
+        for path in count_paths:
+            os.remove(path)
@@ -3,12 +3,19 @@ import os
 import glob
 from configparser import ConfigParser
 import argparse
+import itertools
 
-import pandas as pd
-import spacy
 #import spacy_transformers
 
-from utils.preproc_utils import fill_nan_values, conditional_fill_nan_values, lemmatize_sentence
+from utils.preproc_utils import fill_nan_values, conditional_fill_nan_values, lemmatize_translations, \
+    load_pipeline, check_lemma_pipeline, read_translations, SPACY_MODELS
+from utils.stream_utils import iter_translation_chunks, stream_preprocess
+from utils.model_cache import ModelCache, file_hash, spacy_model_id
+from utils.table_io import OUTPUT_FORMATS, check_format, write_preprocessed
+from utils.profiling import Profiler
+from utils.doc_store import docs_path
+from utils.lemma_cache import TokenLemmaCache
+from utils.shard_utils import parse_shard, shard_path, read_translation_shard
 
 
 config = ConfigParser()
@@ -31,24 +38,127 @@ parser.add_argument(
     default='de',
     help='Choose your target language: "de" (Deutsch) or "it" (Italian). Default is "de".'
 )
+
+parser.add_argument('--batch-size',
+                    type=int,
+                    default=1000,
+                    help='Number of sentences lemmatized together with nlp.pipe. Default is 1000.')
+
+parser.add_argument('--n-process',
+                    type=int,
+                    default=1,
+                    help='Number of processes used for lemmatization. Default is 1.')
+
+parser.add_argument('--pipeline',
+                    choices=['full', 'lemma'],
+                    default='full',
+                    help='"full" loads every component of the spaCy model, "lemma" leaves out parser, NER and '
+                         'other components not needed for lemmas. Default is "full".')
+
+parser.add_argument('--check-sample',
+                    type=int,
+                    default=50,
+                    help='With --pipeline lemma, number of sentences checked against the full pipeline '
+                         'at startup (0 disables the check). Default is 50.')
+
+parser.add_argument('--stream',
+                    action="store_true",
+                    help='Read, lemmatize and write the test set chunk by chunk, so memory is bounded by --chunk-size.')
+
+parser.add_argument('--chunk-size',
+                    type=int,
+                    default=10000,
+                    help='Number of rows per chunk with --stream. Default is 10000.')
+
+parser.add_argument('--cache-dir',
+                    default=None,
+                    help='Directory where lemmatized translations are cached, keyed by the translation file and the '
+                         'spaCy model. Only new or changed translation files are lemmatized. Not used with --stream.')
+
+parser.add_argument('--format',
+                    choices=OUTPUT_FORMATS,
+                    default='csv',
+                    help='Format of the preprocessed data: "csv" (default) or "parquet" (typed and columnar, needs pyarrow).')
+
+parser.add_argument('--lemma-cache',
+                    default=None,
+                    help='Directory where the lemma of every token is cached per spaCy model, shared by all translation '
+                         'files and kept between runs. Sentences made of known words are not sent through the pipeline.')
+
+parser.add_argument('--lemma-cache-min-count',
+                    type=int,
+                    default=3,
+                    help='With --lemma-cache, number of times a word must get the same lemma (and never another one) '
+                         'before the cached lemma is used. Ignored for lookup lemmatizers, whose lemmas never depend on '
+                         'the context. Default is 3.')
+
+parser.add_argument('--lemma-cache-verify',
+                    type=int,
+                    default=100,
+                    help='With --lemma-cache, number of sentences answered from the cache that are checked against the '
+                         'pipeline; words lemmatized differently are no longer cached. Default is 100.')
+
+parser.add_argument('--save-docs',
+                    action="store_true",
+                    help='Also write the Docs of the lemmas of every model with DocBin, next to the preprocessed data, so '
+                         'find_terms_2.py --docs matches them without tokenizing again. Not used with --stream or --cache-dir.')
+
+parser.add_argument('--shard',
+                    default=None,
+                    help='Preprocess only shard i of N (i/N, counting from 0, e.g. $SLURM_ARRAY_TASK_ID/8), a contiguous '
+                         'range of rows, into a .shard-i-of-N file. Join the shards with merge_shards.py. Not used with '
+                         '--stream or --cache-dir.')
+
+parser.add_argument('--profile',
+                    action="store_true",
+                    help='Time every stage (model load, reading, lemmatization per model, writing), print a summary '
+                         'table and write it as JSON to --profile-output.')
+
+parser.add_argument('--profile-output',
+                    default='data/results_analysis/profile_preproc.json',
+                    help='JSON file of --profile. Default is data/results_analysis/profile_preproc.json.')
     
 args = parser.parse_args()
 
+if args.stream and args.cache_dir:
+    parser.error('--cache-dir cannot be combined with --stream')
+if args.save_docs and (args.stream or args.cache_dir):
+    parser.error('--save-docs cannot be combined with --stream or --cache-dir')
+if args.shard and (args.stream or args.cache_dir):
+    parser.error('--shard cannot be combined with --stream or --cache-dir')
+shard = None
+if args.shard:
+    try:
+        shard = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+
+check_format(args.format)
+
+# Records nothing without --profile
+profiler = Profiler(enabled=args.profile)
+
 print('I am alive!')
 
 #Load model
-if args.lang == 'de':
-    model = spacy.load('de_core_news_sm')
-elif args.lang == 'it':   
-    model = spacy.load('it_core_news_sm')
-else:
+if args.lang not in SPACY_MODELS:
     raise ValueError("Unsupported language. Please choose 'de' or 'it'.")
 
+with profiler.stage("load spaCy model"):
+    model = load_pipeline(SPACY_MODELS[args.lang], profile=args.pipeline)
+print(f"Loaded {SPACY_MODELS[args.lang]} with components: {model.pipe_names}")
+
+lemma_cache = None
+if args.lemma_cache:
+    lemma_cache = TokenLemmaCache.for_model(args.lemma_cache, model, spacy_model_id(model),
+                                            min_count=args.lemma_cache_min_count, verify_sample=args.lemma_cache_verify)
+    print(f"Loaded {len(lemma_cache)} cached token lemmas from {lemma_cache.path}")
+
 #import testset
 if args.hom:
-    df = pd.read_csv('./data/homonyms/1_testset_omonimi.csv', delimiter=';', encoding='utf-8-sig')
+    testset_file = './data/homonyms/1_testset_omonimi.csv'
 else:
-    df = pd.read_csv('./data/simple_terms/testset_simple_terms.csv', delimiter=';', encoding='utf-8-sig')
+    testset_file = './data/simple_terms/testset_simple_terms.csv'
 
 
 # Folder containing the translation files
@@ -65,50 +175,104 @@ print("using source folder " + folder_path)
 translation_files = glob.glob(os.path.join(folder_path, file_pattern))
 
 # Keep track of added columns
-new_columns = []
-
-for file_path in translation_files:
-    # Get file name without extension to use as column name
-    column_name = os.path.splitext(os.path.basename(file_path))[0]
+new_columns = [os.path.splitext(os.path.basename(file_path))[0] for file_path in translation_files]
 
-    # Read the file
-    with open(file_path, 'r', encoding="ISO-8859-1") as f:
-        translations = f.readlines()
+if args.stream:
+    # Chunks of the test set with the translations of every model, read lazily
+    chunks = iter_translation_chunks(testset_file, translation_files, args.chunk_size)
+    df = next(chunks)
+    chunks = itertools.chain([df], chunks)
 
-    # Clean newline characters
-    translations = [line.strip() for line in translations]
+elif shard is not None:
+    # Only the lines of the shard are read from the translation files
+    with profiler.stage("read test set and translations"):
+        df = read_translation_shard(testset_file, translation_files, *shard)
+    print(f"Shard {shard[0]} of {shard[1]}: {len(df)} rows")
 
-    # Add column
-    df[column_name] = translations
-    new_columns.append(column_name)
-
-# Replace any leftover newlines (in case)
-df = df.replace(to_replace=r'\n', value='', regex=True)
+else:
+    with profiler.stage("read test set and translations"):
+        df = read_translations(testset_file, translation_files)
 
 #save model names as env variable
+# Every shard writes the same content to its own temporary file renamed over config.ini, so the find_terms_2.py
+# shard that follows a preproc_2.py shard finds it even if the first shard is not done, and never half-written
 config.set('main', 'models', ','.join(new_columns))
-with open('config.ini', 'w') as configfile:
+config_tmp = f'config.ini.{os.getpid()}.tmp'
+with open(config_tmp, 'w') as configfile:
     config.write(configfile)
+os.replace(config_tmp, 'config.ini')
 
 
-    # Apply lemmatization to new translation columns
-for col in new_columns:
-    df[col] = df[col].apply(lambda sentence: lemmatize_sentence(sentence, model))
+# Reuse the lemmas of translation files that were already lemmatized with the same spaCy model
+columns_to_lemmatize = new_columns
+if args.cache_dir:
+    model_cache = ModelCache(args.cache_dir)
+    model_id = spacy_model_id(model)
+    lemma_keys = {column_name: ModelCache.key(file_hash(file_path), model_id)
+                  for file_path, column_name in zip(translation_files, new_columns)}
 
-# Eliminate boilerplate from lemmatization of punctuation from translations
-df[new_columns] = df[new_columns].apply(lambda col: col.str.replace(r' --', ' ', regex=True))
+    cached_columns = {}
+    with profiler.stage("lemma cache lookup"):
+        for column_name, key in lemma_keys.items():
+            lemmas = model_cache.load_lemmas(key)
+            if lemmas is not None:
+                cached_columns[column_name] = lemmas
+    profiler.count("cached lemma columns", len(cached_columns))
 
-#clean text in other columns
-df[['ALTRE OPZIONI STAA (CSV)', 'TERMINI ALTRI ORDINAMENTI (CSV)']] = df[['ALTRE OPZIONI STAA (CSV)', 'TERMINI ALTRI ORDINAMENTI (CSV)']].replace(r' -- ', ', ', regex=True)
+    columns_to_lemmatize = [column_name for column_name in new_columns if column_name not in cached_columns]
+    print(f"Cached lemmas for {len(cached_columns)} models, lemmatizing {len(columns_to_lemmatize)}")
+
+
+# Make sure the trimmed pipeline gives the same lemmas as the full one
+if args.pipeline == 'lemma' and args.check_sample > 0 and columns_to_lemmatize:
+    with profiler.stage("lemma pipeline check"):
+        full_model = load_pipeline(SPACY_MODELS[args.lang], profile='full')
+        sample = df[columns_to_lemmatize[0]].head(args.check_sample)
+        checked = check_lemma_pipeline(model, full_model, sample)
+        del full_model
+    print(f"Lemma pipeline matches the full pipeline on {checked} sentences")
 
 
 if args.hom:
     preprocessed_file = 'data/preprocessed_data_homs.csv'
 else:
     preprocessed_file = 'data/preprocessed_data_simple_terms.csv'
+if shard is not None:
+    preprocessed_file = shard_path(preprocessed_file, *shard)
+
+if args.stream:
+    # Lemmatize and append to the preprocessed file chunk by chunk
+    n_rows = stream_preprocess(chunks, model, new_columns, preprocessed_file, batch_size=args.batch_size,
+                               n_process=args.n_process, fmt=args.format, profiler=profiler, lemma_cache=lemma_cache)
+    profiler.count("rows", n_rows)
+
+else:
+    doc_paths = {column_name: docs_path(preprocessed_file, column_name) for column_name in new_columns} if args.save_docs else None
+    df = lemmatize_translations(df, model, columns_to_lemmatize, batch_size=args.batch_size, n_process=args.n_process,
+                                profiler=profiler, doc_paths=doc_paths, lemma_cache=lemma_cache)
+    profiler.count("rows", len(df))
+
+    if args.cache_dir:
+        for column_name, lemmas in cached_columns.items():
+            df[column_name] = lemmas.values
+        with profiler.stage("lemma cache save"):
+            for column_name in columns_to_lemmatize:
+                model_cache.save_lemmas(lemma_keys[column_name], df[column_name])
+
+    # Save the preprocessed DataFrame to a new CSV (or parquet) file
+    with profiler.stage("write preprocessed data", items=len(df)):
+        write_preprocessed(df, preprocessed_file, args.format)
+
+if lemma_cache is not None:
+    lemma_cache.save()
+    print(f"Token lemma cache: {lemma_cache.cached_sentences} sentences from the cache, {lemma_cache.piped_sentences} "
+          f"through the pipeline, {lemma_cache.mismatches} of {lemma_cache.verified} checked sentences differed")
+    profiler.count("sentences lemmatized from the token cache", lemma_cache.cached_sentences)
+    profiler.count("sentences through the pipeline", lemma_cache.piped_sentences)
 
-# Save the preprocessed DataFrame to a new CSV file
-with open(preprocessed_file, 'w', encoding='utf-8-sig') as f:
-    df.to_csv(f, index=False, sep=";")
+if profiler.enabled:
+    print(profiler.summary())
+    profiler.save(args.profile_output)
+    print(f"Profile saved to: {args.profile_output}")
 
 print("I'm done")
\ No newline at end of file
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import time
+
+from utils.suite_utils import load_manifest, run_suites
+
+
+parser = argparse.ArgumentParser(description='Preprocess and evaluate several challenge sets in one process.')
+
+parser.add_argument('manifest',
+    help='INI file with one section per suite (lang, hom, testset, translations, output_dir, stages, format, ...), '
+         'see suites.ini.'
+)
+
+parser.add_argument('--only', default=None,
+    help='Comma-separated names of the suites to run. Default is all suites of the manifest.'
+)
+
+parser.add_argument('--jobs', type=int, default=1,
+    help='Number of processes. Suites of different languages run concurrently, each language loads its models once, '
+         'so with a single-language manifest like suites.ini this has no effect (use --workers). Default is 1.'
+)
+
+parser.add_argument('--workers', type=int, default=1,
+    help='Number of worker processes used for matching each suite. Default is 1.'
+)
+
+parser.add_argument('--ngram-path', default=None,
+    help='Path of ngram_probs.json or of its converted store (German only). Default: looked up in the working directory, then in the repository root.'
+)
+
+parser.add_argument('--split-cache', default=None,
+    help='Directory where compound splits are cached between runs (German only), shared by all German suites.'
+)
+
+parser.add_argument('--summary', default='data/suites/summary.json',
+    help='JSON file with the time of every stage and the success rates of every suite. Default is data/suites/summary.json.'
+)
+
+args = parser.parse_args()
+
+suites = load_manifest(args.manifest)
+if args.only:
+    names = args.only.split(',')
+    unknown = [name for name in names if name not in {suite.name for suite in suites}]
+    if unknown:
+        parser.error(f'unknown suites {unknown}')
+    suites = [suite for suite in suites if suite.name in names]
+
+start = time.perf_counter()
+summaries = run_suites(suites, jobs=args.jobs, workers=args.workers, ngram_path=args.ngram_path,
+                       split_cache_dir=args.split_cache)
+total = time.perf_counter() - start
+
+for name, summary in summaries.items():
+    stages = ', '.join(f'{stage} {seconds:.1f}s' for stage, seconds in summary['seconds'].items())
+    print(f'{name}: {stages}')
+print(f'{len(summaries)} suites in {total:.1f}s')
+
+directory = os.path.dirname(args.summary)
+if directory:
+    os.makedirs(directory, exist_ok=True)
+with open(args.summary, 'w', encoding='utf-8') as f:
+    json.dump({'seconds': round(total, 3), 'suites': summaries}, f, indent=2)
+print(f'Summary saved to: {args.summary}')
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+
+from utils.service_utils import EvaluationService
+
+
+parser = argparse.ArgumentParser(description='Serve term accuracy evaluations with the models kept in memory.')
+
+parser.add_argument('--hom', action="store_true",
+    help='Include if you are testing on the honomym subset'
+)
+
+parser.add_argument('--lang', choices=['de', 'it'], default='de',
+    help='Choose your target language: "de" (Deutsch) or "it" (Italian). Default is "de".'
+)
+
+parser.add_argument('--testset', default=None,
+    help='Test set CSV (";"-separated). Default is the bundled test set of the homonym or simple term subset.'
+)
+
+parser.add_argument('--pipeline', choices=['full', 'lemma'], default='full',
+    help='spaCy pipeline used for lemmatization: "full" or "lemma" (without parser, NER and other components not '
+         'needed for lemmas). Default is "full".'
+)
+
+parser.add_argument('--batch-size', type=int, default=1000,
+    help='Number of sentences lemmatized together. Default is 1000.'
+)
+
+parser.add_argument('--ngram-path', default=None,
+    help='Path of ngram_probs.json or of its converted store (German only). Default: looked up in the working directory, then in the repository root.'
+)
+
+parser.add_argument('--split-cache', default=None,
+    help='Directory where compound splits are cached between runs (German only), written when the service stops.'
+)
+
+parser.add_argument('--lemma-cache', default=None,
+    help='Directory of the token lemma cache of the spaCy model, see preproc_2.py --lemma-cache.'
+)
+
+parser.add_argument('--data-dir', default=None,
+    help='Directory requests may name translation files in ("file", relative to it). Files outside it are rejected. '
+         'Without it requests must send their sentences.'
+)
+
+parser.add_argument('--host', default='127.0.0.1',
+    help='Address the HTTP server listens on. Default is 127.0.0.1.'
+)
+
+parser.add_argument('--port', type=int, default=8765,
+    help='Port of the HTTP server. Default is 8765.'
+)
+
+parser.add_argument('--socket', default=None,
+    help='Listen on this Unix socket instead of --host and --port.'
+)
+
+parser.add_argument('--max-batch', type=int, default=32,
+    help='Maximum number of concurrent requests evaluated together. Default is 32.'
+)
+
+parser.add_argument('--batch-wait', type=float, default=0.01,
+    help='Seconds a batch waits for concurrent requests to join it. Default is 0.01.'
+)
+
+args = parser.parse_args()
+
+service = EvaluationService(lang=args.lang, hom=args.hom, testset=args.testset, pipeline=args.pipeline,
+                            batch_size=args.batch_size, ngram_path=args.ngram_path, split_cache_dir=args.split_cache,
+                            lemma_cache_dir=args.lemma_cache, max_batch=args.max_batch, batch_wait=args.batch_wait,
+                            data_dir=args.data_dir)
+address = args.socket if args.socket else f'http://{args.host}:{args.port}'
+print(f'Loaded {service.n_rows} test set rows and {len(service.term_index)} term patterns, listening on {address}')
+
+try:
+    asyncio.run(service.serve(args.host, args.port, args.socket))
+except KeyboardInterrupt:
+    pass
+finally:
+    service.close()
+    print(f'Served {service.requests} requests in {service.batches} batches')
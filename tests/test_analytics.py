@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analytics import analyze, bootstrap_rates, group_hits, hit_matrix, mcnemar_p
+from utils.term_finder_utils import TermResults, TermMatch
+
+
+def random_hits(seed, n_rows=500, n_models=3, n_domains=2):
+    rng = np.random.default_rng(seed)
+    return rng.random((n_rows, n_models, n_domains)) < rng.uniform(0.2, 0.8, size=(1, n_models, n_domains))
+
+
+def test_hit_matrix_stacks_models_and_domains():
+    results = TermResults()
+    results.add_row([TermMatch(0, 1, "Gemeinde", 0)])
+    results.add_row([])
+    domain_results = {"South-Tyrol": {"a": results, "b": [False, True]}, "homonym": {"a": [True, True], "b": results}}
+    hits = hit_matrix(domain_results, ["a", "b"], ["South-Tyrol", "homonym"])
+    assert hits.shape == (2, 2, 2)
+    assert hits[:, 0, 0].tolist() == [True, False] and hits[:, 1, 0].tolist() == [False, True]
+    assert hits[:, 1, 1].tolist() == [True, False]
+
+
+def test_group_hits_matches_groupby():
+    hits = random_hits(1)
+    groups = np.random.default_rng(2).choice([3.0, 1.0, 2.0, np.nan], size=len(hits))
+    labels, counts, sizes = group_hits(hits, groups)
+
+    frame = pd.DataFrame(hits.reshape(len(hits), -1)).assign(group=groups).dropna(subset=["group"])
+    expected = frame.groupby("group").sum()
+    assert list(labels) == [1.0, 2.0, 3.0]
+    assert np.array_equal(counts.reshape(len(labels), -1), expected.to_numpy())
+    assert sizes.tolist() == frame.groupby("group").size().tolist()
+
+
+@pytest.mark.parametrize("only_a, only_b", [(1, 9), (3, 12), (20, 20), (0, 7)])
+def test_mcnemar_p_is_the_exact_binomial_test(only_a, only_b):
+    n = only_a + only_b
+    # Two-sided binomial test of min(only_a, only_b) successes in n trials with p = 1/2
+    tail = sum(math.comb(n, x) for x in range(min(only_a, only_b) + 1)) / 2 ** n
+    assert mcnemar_p(np.array([only_a]), np.array([only_b]))[0] == pytest.approx(min(1.0, 2 * tail))
+
+
+def test_mcnemar_p_known_values():
+    # 1 vs 9 discordant rows: 2 * (1 + 10) / 1024
+    assert mcnemar_p(np.array([1]), np.array([9]))[0] == pytest.approx(22 / 1024)
+    assert mcnemar_p(np.array([[0, 5]]), np.array([[0, 5]])).tolist() == [[1.0, 1.0]]
+    # Above 1000 discordant rows the chi-square approximation is used, close to the exact value
+    exact = 2 * sum(math.comb(1200, x) for x in range(571)) / 2 ** 1200
+    assert mcnemar_p(np.array([570]), np.array([630]))[0] == pytest.approx(exact, rel=0.05)
+
+
+def test_bootstrap_interval_covers_the_rate():
+    hits = random_hits(3)
+    tables = analyze(hits, ["a", "b", "c"], ["South-Tyrol", "other_tyrol"], n_resamples=2000, seed=7)
+    rates = tables["rates"]
+    assert ((rates["ci_low"] <= rates["rate"]) & (rates["rate"] <= rates["ci_high"])).all()
+    assert (rates["ci_high"] - rates["ci_low"] > 0).all()
+    pairwise = tables["pairwise"]
+    assert ((pairwise["ci_low"] <= pairwise["difference"]) & (pairwise["difference"] <= pairwise["ci_high"])).all()
+
+    # The same seed gives the same intervals
+    again = analyze(hits, ["a", "b", "c"], ["South-Tyrol", "other_tyrol"], n_resamples=2000, seed=7)
+    pd.testing.assert_frame_equal(again["rates"], rates)
+
+
+@pytest.mark.parametrize("n_rows", [40, 1000])
+def test_bootstrap_draws_match_the_row_sampling(n_rows):
+    # Both the multinomial and the per-row draw paths give rates centered on the observed one
+    hits = random_hits(4, n_rows=n_rows, n_models=2, n_domains=1)
+    boot = bootstrap_rates(hits, n_resamples=4000, seed=0)
+    assert boot.shape == (4000, 2, 1)
+    observed = hits.mean(axis=0) * 100
+    assert np.allclose(boot.mean(axis=0), observed, atol=1.5)
+
+
+def test_bootstrap_unit_term_resamples_whole_terms():
+    # Term 1 has one matched row, term 2 three rows without a match
+    hits = np.array([True, False, False, False]).reshape(4, 1, 1)
+    terms = [1, 2, 2, 2]
+
+    by_term = bootstrap_rates(hits, n_resamples=500, seed=0, clusters=terms).ravel()
+    # Two terms are drawn: both term 1 (100%), one of each (25%) or both term 2 (0%)
+    assert set(by_term.astype(np.float64).round(4).tolist()) == {0.0, 25.0, 100.0}
+
+    by_row = bootstrap_rates(hits, n_resamples=500, seed=0).ravel()
+    assert {50.0, 75.0} & set(by_row.astype(np.float64).round(4).tolist())
+
+
+def test_rows_without_a_term_are_their_own_cluster():
+    hits = np.array([True, True, False]).reshape(3, 1, 1)
+    boot = bootstrap_rates(hits, n_resamples=300, seed=0, clusters=[np.nan, np.nan, 5]).ravel()
+    # Three clusters of one row each, like row resampling
+    assert set(np.rint(boot * 3 / 100).tolist()) <= {0.0, 1.0, 2.0, 3.0}
+    assert np.allclose(boot * 3 / 100, np.rint(boot * 3 / 100), atol=1e-4)
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+from spacy.lang.it import Italian
+
+from utils.doc_store import docs_path, lemma_words, load_lemma_docs, save_lemma_docs
+from utils.preproc_utils import lemmatize_translations
+from utils.results_utils import find_terms_multi_over_models
+from utils.table_io import read_preprocessed, write_preprocessed
+from utils.term_finder_utils import create_entries, get_resources
+
+
+def test_lemma_docs_round_trip(tmp_path):
+    vocab = Italian().vocab
+    rows = [["il", "comune", "approvare"], [], ["legge"], ["decreto", "legislativo", "n.", "118"]]
+    path = docs_path(str(tmp_path / "preprocessed.csv"), "model_a")
+    assert save_lemma_docs(rows, vocab, path) == len(rows)
+
+    spans = load_lemma_docs(path, vocab, n_rows=len(rows))
+    assert [[token.text for token in span] for span in spans] == rows
+    # Words of a row are separated by a space, like in the lemmatized sentence
+    assert spans[3].text == "decreto legislativo n. 118"
+
+    with pytest.raises(ValueError):
+        load_lemma_docs(path, vocab, n_rows=len(rows) + 1)
+
+
+def test_docs_match_like_the_csv_without_punctuation(tmp_path):
+    pytest.importorskip("spacy_lookups_data")
+    model = Italian()
+    model.add_pipe("lemmatizer", config={"mode": "lookup"})
+    model.initialize()
+
+    df = pd.DataFrame({
+        "TARGET HYPOTHESIS ": ["comune", "legge provinciale", "decreto", "assessore"],
+        "ALTRE OPZIONI STAA (CSV)": ["municipio", None, None, "consigliere"],
+        "TERMINI ALTRI ORDINAMENTI (CSV)": [None, "legge regionale", "ordinanza", None],
+        "model_a": ["I comuni approvano il bilancio", "Le leggi provinciali sono state approvate", None,
+                    "Gli assessori e i consiglieri votano"],
+        "model_b": ["Il municipio decide", "Una legge regionale nuova", "I decreti del sindaco", "Nessun termine qui"],
+    })
+    models = ["model_a", "model_b"]
+    preprocessed_file = str(tmp_path / "preprocessed.csv")
+    doc_paths = {col: docs_path(preprocessed_file, col) for col in models}
+    df = lemmatize_translations(df, model, models, doc_paths=doc_paths)
+    write_preprocessed(df, preprocessed_file)
+
+    resources = get_resources("it")
+    entries_dict = create_entries(read_preprocessed(preprocessed_file), models)
+    domains = ["South-Tyrol", "other_tyrol", "other_systems"]
+    from_csv = find_terms_multi_over_models(resources.nlp, entries_dict, models, domains, resources=resources)
+    from_docs = find_terms_multi_over_models(resources.nlp, entries_dict, models, domains, resources=resources,
+                                             doc_paths=doc_paths)
+
+    for domain in domains:
+        for col in models:
+            assert from_docs[domain][col].to_dict() == from_csv[domain][col].to_dict()
+    assert sum(result.hit_rows().sum() for results in from_csv.values() for result in results.values()) >= 4
+
+
+def test_lemma_words_keep_the_text_of_punctuation():
+    model = Italian()
+    doc = model("Il comune, la legge")
+    for token in doc:
+        token.lemma_ = "--" if token.is_punct else token.text.lower()
+    assert lemma_words(doc) == ["il", "comune", ",", "la", "legge"]
@@ -0,0 +1,106 @@
+import pytest
+from spacy.lang.de import German
+from spacy.language import Language
+
+from utils.lemma_cache import TokenLemmaCache, _context_free_pipeline
+
+
+@Language.component("test_context_lemmas", assigns=["token.lemma"])
+def context_lemmas(doc):
+    """Lemma of the lowercase text, except that "Bank" depends on the previous word like in a tagger"""
+    for token in doc:
+        if token.text == "Bank":
+            token.lemma_ = "Bank (Sitz)" if token.i and doc[token.i - 1].lower_ == "die" else "Bank (Geld)"
+        else:
+            token.lemma_ = token.lower_
+    return doc
+
+
+def context_pipeline():
+    nlp = German()
+    nlp.add_pipe("test_context_lemmas")
+    return nlp
+
+
+def lemmas(docs):
+    return [[token.lemma_ for token in doc] for doc in docs]
+
+
+def test_context_pipeline_is_not_context_free():
+    assert not _context_free_pipeline(context_pipeline())
+    assert _context_free_pipeline(German())
+
+
+def test_words_are_trusted_after_min_count_agreeing_lemmas():
+    nlp = context_pipeline()
+    cache = TokenLemmaCache(nlp, "test", min_count=2, verify_sample=0)
+
+    list(cache.pipe(["Der Rat tagt"]))
+    list(cache.pipe(["Der Rat tagt"]))
+    assert cache.piped_sentences == 2
+    list(cache.pipe(["Der Rat tagt"]))
+    assert cache.piped_sentences == 2 and cache.cached_sentences == 1
+
+
+def test_words_with_different_lemmas_are_dropped():
+    nlp = context_pipeline()
+    cache = TokenLemmaCache(nlp, "test", min_count=2, verify_sample=0)
+    texts = ["die Bank hält", "eine Bank hält", "die Bank hält", "eine Bank hält"]
+
+    docs = list(cache.pipe(texts, batch_size=1))
+    assert "Bank" not in cache._lemmas and "Bank" in cache._ambiguous
+    assert cache.model.vocab.strings["Bank"] not in cache._trusted
+    # Sentences with the ambiguous word always go through the pipeline
+    assert cache.piped_sentences == len(texts)
+    assert lemmas(docs) == lemmas(nlp.pipe(texts))
+
+
+def test_cached_lemmas_equal_the_pipeline():
+    nlp = context_pipeline()
+    cache = TokenLemmaCache(nlp, "test", min_count=3, verify_sample=0)
+    words = ["der", "die", "eine", "Bank", "Rat", "tagt", "hält", "Gemeinde", "Amt"]
+    sample = [" ".join(words[(i * 7 + j * 3) % len(words)] for j in range(2 + i % 4)) for i in range(300)]
+
+    docs = list(cache.pipe(sample, batch_size=20))
+    assert cache.cached_sentences > 0
+    assert lemmas(docs) == lemmas(nlp.pipe(sample))
+
+
+def test_verify_drops_a_wrong_cached_lemma():
+    nlp = context_pipeline()
+    # One observation is not enough for a contextual pipeline, but it is what min_count=1 trusts
+    cache = TokenLemmaCache(nlp, "test", min_count=1, verify_sample=10)
+    list(cache.pipe(["eine Bank", "die Rat"]))
+    assert cache._lemmas["Bank"] == ["Bank (Geld)", 1]
+
+    docs = list(cache.pipe(["die Bank"]))
+    assert lemmas(docs) == [["die", "Bank (Sitz)"]]
+    assert cache.verified == 1 and cache.mismatches == 1
+    assert "Bank" in cache._ambiguous
+
+
+def test_cache_file_round_trip(tmp_path):
+    nlp = context_pipeline()
+    cache = TokenLemmaCache.for_model(tmp_path, nlp, "test", min_count=1, verify_sample=0)
+    list(cache.pipe(["Der Rat tagt", "die Bank", "eine Bank"]))
+    cache.save()
+
+    loaded = TokenLemmaCache.for_model(tmp_path, nlp, "test", min_count=1, verify_sample=0)
+    assert loaded._lemmas == cache._lemmas and loaded._ambiguous == {"Bank"}
+    docs = list(loaded.pipe(["Der Rat tagt"]))
+    assert loaded.cached_sentences == 1 and lemmas(docs) == [["der", "rat", "tagt"]]
+    assert TokenLemmaCache.for_model(tmp_path, nlp, "other model").path != cache.path
+
+
+@pytest.mark.parametrize("min_count", [1, 5])
+def test_lookup_lemmas_are_trusted_at_once(min_count):
+    pytest.importorskip("spacy_lookups_data")
+    nlp = German()
+    nlp.add_pipe("lemmatizer", config={"mode": "lookup"})
+    nlp.initialize()
+    cache = TokenLemmaCache(nlp, "test", min_count=min_count, verify_sample=5)
+    sample = ["Die Gemeinden erlassen Dekrete", "Die Gemeinden erlassen Dekrete", "Dekrete erlassen"]
+
+    docs = list(cache.pipe(sample, batch_size=1))
+    assert cache.min_count == 1 and cache.cached_sentences == 2 and cache.mismatches == 0
+    assert lemmas(docs) == lemmas(nlp.pipe(sample))
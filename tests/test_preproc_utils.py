@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.preproc_utils import fill_nan_values, conditional_fill_nan_values
+
+
+# Row loops of fill_nan_values and conditional_fill_nan_values before they were vectorized, kept as the reference
+def loop_fill_nan_values(df, column_name):
+    last_valid_value = None
+
+    for idx in range(len(df)):
+        if pd.notna(df.loc[idx, column_name]):
+            last_valid_value = df.loc[idx, column_name]
+        elif last_valid_value is not None:
+            df.loc[idx, column_name] = last_valid_value
+
+    return df
+
+
+def loop_conditional_fill_nan_values(df, target_column, reference_column):
+    last_valid_value = None
+    last_reference_value = None
+
+    for idx in range(len(df)):
+        current_reference_value = df.loc[idx, reference_column]
+
+        if pd.notna(df.loc[idx, target_column]):
+            last_valid_value = df.loc[idx, target_column]
+            last_reference_value = current_reference_value
+        elif last_reference_value == current_reference_value:
+            if last_valid_value is not None:
+                df.loc[idx, target_column] = last_valid_value
+        else:
+            last_valid_value = None
+            last_reference_value = current_reference_value
+
+    return df
+
+
+def loop_on_positions(loop, df, *columns):
+    """Run a reference loop, which reads rows by label 0..n-1, on a frame with any index"""
+    result = loop(df.reset_index(drop=True), *columns)
+    result.index = df.index
+    return result
+
+
+def random_frame(rng, n_rows):
+    """
+    Test set-like frame: term numbers with NaN runs (the rows after the first of a term), target terms
+    and alternative terms with NaN runs, and references that change or are missing inside a NaN run.
+    """
+    term_ids = np.cumsum(rng.random(n_rows) < 0.3).astype(float)
+    term_ids[rng.random(n_rows) < 0.25] = np.nan
+    words = np.array(["Gemeinde", "Landesgesetz", "Dekret", "Amt", "Steuer"], dtype=object)
+    targets = rng.choice(words, n_rows)
+    targets[rng.random(n_rows) < 0.6] = np.nan
+    alternatives = rng.choice(words, n_rows) + ", " + rng.choice(words, n_rows)
+    alternatives[rng.random(n_rows) < 0.7] = np.nan
+    return pd.DataFrame({
+        "N. TERMINE": term_ids,
+        "TARGET HYPOTHESIS ": pd.Series(targets, dtype=object),
+        "ALTRE OPZIONI STAA (CSV)": pd.Series(alternatives, dtype=object),
+    })
+
+
+def chunk_index(kind, n_rows):
+    # A chunk of pd.read_csv(chunksize=...), as --stream reads it, starts at the rows before it
+    if kind == "chunk":
+        return pd.RangeIndex(10000, 10000 + n_rows)
+    if kind == "labels":
+        return pd.Index([f"row {i}" for i in range(n_rows)])
+    return pd.RangeIndex(n_rows)
+
+
+@pytest.mark.parametrize("index", ["range", "chunk", "labels"])
+@pytest.mark.parametrize("seed", range(50))
+def test_fill_nan_values_matches_loop(seed, index):
+    rng = np.random.default_rng(seed)
+    df = random_frame(rng, int(rng.integers(0, 60)))
+    df.index = chunk_index(index, len(df))
+
+    for column in ["TARGET HYPOTHESIS ", "N. TERMINE"]:
+        expected = loop_on_positions(loop_fill_nan_values, df.copy(), column)
+        pd.testing.assert_frame_equal(fill_nan_values(df.copy(), column), expected)
+
+
+@pytest.mark.parametrize("index", ["range", "chunk", "labels"])
+@pytest.mark.parametrize("seed", range(50))
+def test_conditional_fill_nan_values_matches_loop(seed, index):
+    rng = np.random.default_rng(seed)
+    df = random_frame(rng, int(rng.integers(0, 60)))
+    df.index = chunk_index(index, len(df))
+
+    for column in ["TARGET HYPOTHESIS ", "ALTRE OPZIONI STAA (CSV)"]:
+        expected = loop_on_positions(loop_conditional_fill_nan_values, df.copy(), column, "N. TERMINE")
+        pd.testing.assert_frame_equal(conditional_fill_nan_values(df.copy(), column, "N. TERMINE"), expected)
+
+
+def test_conditional_fill_stops_at_reference_changes():
+    df = pd.DataFrame({
+        "N. TERMINE": [1.0, 1.0, 2.0, 2.0, np.nan, np.nan, 3.0],
+        "ALTRE OPZIONI STAA (CSV)": ["a", np.nan, np.nan, "b", np.nan, np.nan, np.nan],
+    })
+    filled = conditional_fill_nan_values(df.copy(), "ALTRE OPZIONI STAA (CSV)", "N. TERMINE")
+    # The drag stops where the term changes and never continues over a missing term number
+    assert filled["ALTRE OPZIONI STAA (CSV)"].fillna("-").tolist() == ["a", "a", "-", "b", "-", "-", "-"]
+    expected = loop_conditional_fill_nan_values(df.copy(), "ALTRE OPZIONI STAA (CSV)", "N. TERMINE")
+    pd.testing.assert_frame_equal(filled, expected)
+
+
+def test_fill_nan_values_keeps_empty_text_columns():
+    df = pd.DataFrame({"TARGET HYPOTHESIS ": pd.Series([np.nan, np.nan], dtype=object)})
+    assert fill_nan_values(df, "TARGET HYPOTHESIS ")["TARGET HYPOTHESIS "].dtype == object
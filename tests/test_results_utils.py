@@ -0,0 +1,55 @@
+import pandas as pd
+
+from utils.profiling import Profiler
+from utils.results_utils import find_terms_over_models, find_terms_multi_over_models
+from utils.term_finder_utils import create_entries, get_resources, MatcherCache, TermIndex
+
+
+def italian_entries():
+    # Italian has no compound-split fallback, so no ngram table is needed
+    table = pd.DataFrame({
+        "TARGET HYPOTHESIS ": ["comune", "decreto", "legge provinciale", "comune"],
+        "ALTRE OPZIONI STAA (CSV)": ["municipio", None, "legge", None],
+        "TERMINI ALTRI ORDINAMENTI (CSV)": [None, "ordinanza", None, "città, paese"],
+        "model_a": ["il comune approva", "una ordinanza nuova", "la legge provinciale", "nel paese"],
+        "model_b": ["il municipio approva", "il decreto", None, "la città e il comune"],
+    })
+    return create_entries(table, ["model_a", "model_b"])
+
+
+def match_texts(domain_results):
+    return {domain: {col: result.match_texts() for col, result in results.items()}
+            for domain, results in domain_results.items()}
+
+
+def test_workers_use_the_given_term_index_and_profiler():
+    resources = get_resources("it")
+    nlp = resources.nlp
+    entries = italian_entries()
+    domains = ["South-Tyrol", "other_tyrol", "other_systems"]
+    expected = find_terms_multi_over_models(nlp, entries, ["model_a", "model_b"], domains, resources=resources)
+
+    term_index = TermIndex(nlp)
+    term_index.add(["comune"])
+    matcher_cache = MatcherCache(nlp, maxsize=16)
+    profiler = Profiler()
+    results = find_terms_multi_over_models(nlp, entries, ["model_a", "model_b"], domains, matcher_cache=matcher_cache,
+                                           resources=resources, workers=2, profiler=profiler, term_index=term_index)
+
+    assert match_texts(results) == match_texts(expected)
+    # The index is completed with every term the workers matched
+    assert len(term_index) == len(TermIndex(nlp).from_bytes(term_index.to_bytes())) >= 7
+    assert any(name.startswith("match [model_a]") for name in profiler.stages)
+
+
+def test_find_terms_over_models_passes_the_term_index_to_workers():
+    resources = get_resources("it")
+    nlp = resources.nlp
+    entries = italian_entries()
+    term_index = TermIndex(nlp)
+    profiler = Profiler()
+    results = find_terms_over_models(nlp, entries, ["model_a", "model_b"], "South-Tyrol", resources=resources, workers=2,
+                                     term_index=term_index, profiler=profiler)
+
+    assert results["model_b"].match_texts() == [[], ["decreto"], [], ["comune"]]
+    assert len(term_index) > 0 and profiler.stages
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from utils.service_utils import data_file_path
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    (tmp_path / "data" / "simple_terms").mkdir(parents=True)
+    (tmp_path / "data" / "simple_terms" / "model.txt").write_text("eins\nzwei\n")
+    (tmp_path / "secret.txt").write_text("secret\n")
+    os.symlink(tmp_path / "secret.txt", tmp_path / "data" / "link.txt")
+    return os.path.realpath(tmp_path / "data")
+
+
+def test_files_inside_the_data_dir_are_read(data_dir):
+    assert data_file_path(data_dir, "simple_terms/model.txt") == os.path.join(data_dir, "simple_terms", "model.txt")
+    assert data_file_path(data_dir, "simple_terms/../simple_terms/model.txt").endswith("model.txt")
+
+
+@pytest.mark.parametrize("file", ["../secret.txt", "simple_terms/../../secret.txt", "link.txt", "/etc/passwd"])
+def test_files_outside_the_data_dir_are_rejected(data_dir, file):
+    with pytest.raises(ValueError, match="outside"):
+        data_file_path(data_dir, file)
+
+
+def test_files_are_rejected_without_a_data_dir():
+    with pytest.raises(ValueError, match="disabled"):
+        data_file_path(None, "simple_terms/model.txt")
+    with pytest.raises(ValueError):
+        data_file_path("/tmp", ["model.txt"])
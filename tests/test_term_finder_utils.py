@@ -0,0 +1,137 @@
+from pathlib import Path
+
+import pytest
+from spacy.lang.de import German
+
+from utils.model_cache import term_index_key, TERM_COLUMNS
+from utils.profiling import Profiler
+from utils.table_io import read_preprocessed
+from utils.term_finder_utils import create_entries, MatcherCache, TermFinder, TermFinderResources, TermIndex, \
+    to_term_matches
+
+DATA = Path(__file__).resolve().parent.parent / "data"
+
+# Bundled preprocessed data with its translation columns and domains
+BUNDLED_SETS = {
+    "homonyms": ("preprocessed_data_homs.csv", "homonyms", True),
+    "simple_terms": ("preprocessed_data_2.csv", "simple_terms", False),
+}
+
+
+@pytest.fixture(scope="module")
+def german():
+    resources = TermFinderResources("de")
+    try:
+        resources.ngram_probs
+    except FileNotFoundError:
+        pytest.skip("ngram_probs.json not found, the compound-split fallback cannot run")
+    return resources
+
+
+def german_pipeline(kind):
+    """Blank German pipeline, or one with a lookup lemmatizer"""
+    nlp = German()
+    if kind == "lookup":
+        pytest.importorskip("spacy_lookups_data")
+        nlp.add_pipe("lemmatizer", config={"mode": "lookup"})
+        nlp.initialize()
+    return nlp
+
+
+def bundled_entries(name, with_table=False):
+    file_name, folder, homonym = BUNDLED_SETS[name]
+    models = sorted(path.stem for path in (DATA / folder).glob("*.txt"))
+    df = read_preprocessed(DATA / file_name)
+    domains = ["South-Tyrol", "other_tyrol", "other_systems"] + (["homonym"] if homonym else [])
+    entries_dict = create_entries(df, models, homonym=homonym)
+    return (entries_dict, domains, df) if with_table else (entries_dict, domains)
+
+
+def find_all(nlp, entries_dict, domains, resources, term_index):
+    """to_dict of the TermResults of every model and domain, all models sharing term_index"""
+    return {col: {domain: result.to_dict() for domain, result in
+                  TermFinder(nlp, entries, resources=resources, term_index=term_index).find_terms_multi(domains).items()}
+            for col, entries in entries_dict.items()}
+
+
+def test_matcher_cache_evicts_labels_with_matchers():
+    nlp = German()
+    cache = MatcherCache(nlp, maxsize=2)
+    term_lists = [["Gemeinde"], ["Landesgesetz", "Dekret"], ["Amt"]]
+    for terms in term_lists:
+        cache.get(terms)
+
+    assert len(cache) == 2
+    assert sum(len(labels) for _, labels in cache._matchers.values()) == 3
+
+    # An evicted term list is compiled again and keeps matching
+    doc = nlp("Die Gemeinde erlässt ein Dekret")
+    spans = cache.get(term_lists[0])(doc, as_spans=True)
+    assert to_term_matches(spans, cache.label_ids(term_lists[0]))[0].text == "Gemeinde"
+    assert len(cache) == 2 and cache.misses == 4
+
+
+def test_matcher_cache_label_ids_share_labels_of_equal_patterns():
+    cache = MatcherCache(German())
+    terms = ["Landesgesetz", "landesgesetz", None, "Dekret"]
+    label_ids = cache.label_ids(terms)
+    assert sorted(label_ids.values()) == [0, 3]
+
+
+@pytest.mark.parametrize("kind", ["blank", "lookup"])
+@pytest.mark.parametrize("name", sorted(BUNDLED_SETS))
+def test_fallback_precheck_keeps_every_match(german, name, kind):
+    nlp = german_pipeline(kind)
+    entries_dict, domains = bundled_entries(name)
+    skipped = 0
+    for col, entries in entries_dict.items():
+        profiler = Profiler()
+        with_precheck = TermFinder(nlp, entries, resources=german, profiler=profiler).find_terms_multi(domains)
+        without_precheck = TermFinder(nlp, entries, resources=german, fallback_precheck=False).find_terms_multi(domains)
+        for domain in domains:
+            assert with_precheck[domain].to_dict() == without_precheck[domain].to_dict(), (col, domain)
+        skipped += profiler.counters.get("fallback skipped by precheck", 0)
+
+    # With the lookup lemmatizer the precheck left out sentences and still no match was lost. A blank pipeline has
+    # empty lemmas, whose whitespace tokens always send the sentence to the fallback
+    if kind == "lookup":
+        assert skipped > 0
+
+
+def test_term_index_round_trip(german, tmp_path):
+    nlp = german.nlp
+    entries_dict, domains, df = bundled_entries("homonyms", with_table=True)
+    key = term_index_key(df[TERM_COLUMNS + ["OPTIONS"]], german.ngram_hash, "de", nlp)
+
+    built = TermIndex.for_test_set(nlp, tmp_path, key)
+    expected = find_all(nlp, entries_dict, domains, german, built)
+    assert len(built) and built.lemmas
+    built.save()
+
+    loaded = TermIndex.for_test_set(nlp, tmp_path, key)
+    assert len(loaded) == len(built) and loaded.lemmas == built.lemmas
+    assert find_all(nlp, entries_dict, domains, german, loaded) == expected
+    # Nothing was added to the loaded index, so there is nothing to write
+    assert loaded._state() == loaded._saved
+
+
+def test_term_index_key_changes_with_its_inputs(tmp_path):
+    nlp = German()
+    _, _, df = bundled_entries("simple_terms", with_table=True)
+    terms = df[TERM_COLUMNS]
+    key = term_index_key(terms, "ngrams-a", "de", nlp)
+    index = TermIndex.for_test_set(nlp, tmp_path, key)
+    index.add(terms["TARGET HYPOTHESIS "].dropna().tolist())
+    index.save()
+
+    assert len(TermIndex.for_test_set(nlp, tmp_path, term_index_key(terms, "ngrams-a", "de", nlp))) == len(index)
+    changed_terms = terms.copy()
+    changed_terms.iloc[0, 0] = "Landesgesetz"
+    other_nlp = German()
+    other_nlp.add_pipe("sentencizer")
+    for changed_key in [term_index_key(terms, "ngrams-b", "de", nlp),
+                        term_index_key(changed_terms, "ngrams-a", "de", nlp),
+                        term_index_key(terms, "ngrams-a", "de", other_nlp)]:
+        assert changed_key != key
+        # A new ngram table, new terms or another pipeline start an empty index that is built again
+        assert len(TermIndex.for_test_set(nlp, tmp_path, changed_key)) == 0
@@ -1,5 +1,7 @@
 #from utils.preproc_utils import fill_nan_values, conditional_fill_nan_values, lemmatize_sentence
 #from .term_finder_utils import create_entries, TermFinder
-from .preproc_utils import fill_nan_values, conditional_fill_nan_values, lemmatize_sentence
+from .preproc_utils import fill_nan_values, conditional_fill_nan_values, lemmatize_sentence, lemmatize_sentences, \
+    load_pipeline, check_lemma_pipeline
 
-__all__ = ["fill_nan_values", "conditional_fill_nan_values", "lemmatize_sentence"]
+__all__ = ["fill_nan_values", "conditional_fill_nan_values", "lemmatize_sentence", "lemmatize_sentences",
+           "load_pipeline", "check_lemma_pipeline"]
@@ -0,0 +1,288 @@
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from .term_finder_utils import TermResults
+from .table_io import with_format, _import_pyarrow
+
+# Test set columns the rates are broken down by, when present
+GROUP_COLUMNS = ["N. TERMINE", "AMBITO"]
+
+# Column whose rows are resampled together with --bootstrap-unit term
+TERM_COLUMN = "N. TERMINE"
+
+
+def hit_matrix(domain_results, models, domains):
+    """
+    Stacks the rows with a match of every model and domain.
+
+    Parameters:
+    - domain_results: {domain: {model: TermResults or boolean array}}, e.g. from find_terms_multi_over_models
+    - models: list of model names, the order of the second axis
+    - domains: list of domains, the order of the third axis
+
+    Returns:
+    - boolean array of shape (rows, models, domains), True where the row has a match
+    """
+    columns = []
+    for model in models:
+        for domain in domains:
+            result = domain_results[domain][model]
+            columns.append(result.hit_rows() if isinstance(result, TermResults) else np.asarray(result, dtype=bool))
+    n_rows = len(columns[0]) if columns else 0
+    if any(len(column) != n_rows for column in columns):
+        raise ValueError("All models and domains must have the same number of rows")
+    return np.stack(columns, axis=1).reshape(n_rows, len(models), len(domains))
+
+
+def read_group_columns(preprocessed_file, fmt="csv"):
+    """
+    Reads the GROUP_COLUMNS present in the preprocessed data, without the translations.
+
+    Parameters:
+    - preprocessed_file: preprocessed file, the extension is replaced by the one of the format
+    - fmt: "csv" or "parquet"
+
+    Returns:
+    - pandas DataFrame
+    """
+    path = with_format(preprocessed_file, fmt)
+    if fmt == "parquet":
+        pa = _import_pyarrow()
+        names = pa.parquet.read_schema(path).names
+        return pd.read_parquet(path, columns=[column for column in GROUP_COLUMNS if column in names])
+    return pd.read_csv(path, delimiter=';', encoding='utf-8-sig', usecols=lambda column: column in GROUP_COLUMNS)
+
+
+def group_hits(hits, groups):
+    """
+    Counts the rows with a match in every group of rows.
+
+    Parameters:
+    - hits: boolean array (rows, models, domains), see hit_matrix
+    - groups: sequence with the group of every row, rows with a missing group are left out
+
+    Returns:
+    - (labels, hit counts of shape (groups, models, domains), rows per group)
+    """
+    codes, labels = pd.factorize(pd.Series(groups), sort=True)
+    valid = codes >= 0
+    if not valid.any():
+        return labels, np.zeros((0,) + hits.shape[1:], dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # Sorting by group makes every group a contiguous block, summed at once by reduceat
+    order = np.argsort(codes[valid], kind="stable")
+    sorted_codes = codes[valid][order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    counts = np.add.reduceat(hits[valid][order].astype(np.int64), starts, axis=0)
+    sizes = np.diff(np.r_[starts, len(sorted_codes)])
+    return labels, counts, sizes
+
+
+def bootstrap_rates(hits, n_resamples=10000, seed=0, clusters=None):
+    """
+    Success rates of paired bootstrap resamples: every resample draws the same rows for all models and domains.
+
+    Rows with the same hits in every model and domain are interchangeable, so the resamples count how often
+    each distinct hit pattern is drawn, and the rates are the matrix product of these counts with the patterns.
+    With a few models there are far fewer patterns than rows and no row is drawn one by one.
+
+    Parameters:
+    - hits: boolean array (rows, models, domains), see hit_matrix
+    - n_resamples: int, number of resamples
+    - seed: int, seed of the random generator
+    - clusters: optional sequence with the cluster of every row (e.g. the term number), clusters are drawn
+      instead of rows and keep all their rows
+
+    Returns:
+    - float array of shape (resamples, models, domains), rates in percent
+    """
+    n_rows = hits.shape[0]
+    rng = np.random.default_rng(seed)
+
+    # Units drawn by the bootstrap, each with its number of rows and its hits summed over them
+    if clusters is None:
+        units = np.column_stack([np.ones(n_rows, dtype=np.int64), hits.reshape(n_rows, -1)])
+    else:
+        codes = pd.factorize(pd.Series(clusters))[0]
+        # A row without a cluster is a cluster of its own
+        missing = codes < 0
+        codes[missing] = codes.max(initial=-1) + 1 + np.arange(missing.sum())
+        _, counts, sizes = group_hits(hits, codes)
+        units = np.column_stack([sizes, counts.reshape(len(sizes), -1)])
+    n_units = len(units)
+
+    rates = np.zeros((n_resamples, units.shape[1] - 1), dtype=np.float32)
+    if n_units == 0:
+        return rates.reshape(n_resamples, *hits.shape[1:])
+
+    patterns, unit_patterns, multiplicity = np.unique(units, axis=0, return_inverse=True, return_counts=True)
+    unit_patterns = unit_patterns.ravel()
+    patterns = patterns.astype(np.float32)
+    n_patterns = len(patterns)
+    few_patterns = n_patterns * 4 <= n_units
+
+    # Blocks of about 8M draws, so memory does not grow with the number of resamples
+    block = max(1, min(n_resamples, (1 << 23) // (n_patterns if few_patterns else n_units)))
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        if few_patterns:
+            drawn = rng.multinomial(n_units, multiplicity / n_units, size=size)
+        else:
+            draws = unit_patterns[rng.integers(0, n_units, size=(size, n_units))]
+            draws += np.arange(size)[:, None] * n_patterns
+            drawn = np.bincount(draws.ravel(), minlength=size * n_patterns).reshape(size, n_patterns)
+        totals = drawn.astype(np.float32) @ patterns
+        rates[start:start + size] = totals[:, 1:] / np.maximum(totals[:, :1], 1) * 100
+
+    return rates.reshape(n_resamples, *hits.shape[1:])
+
+
+def mcnemar_p(only_a, only_b):
+    """
+    Two-sided McNemar test on the rows matched by only one of two models.
+
+    Exact binomial test up to 1000 discordant rows, chi-square with continuity correction above.
+
+    Parameters:
+    - only_a, only_b: integer arrays of the same shape, rows matched only by the first or only by the second model
+
+    Returns:
+    - float array of p-values
+    """
+    p_values = np.ones(np.shape(only_a))
+    for index, (a, b) in enumerate(zip(np.ravel(only_a).tolist(), np.ravel(only_b).tolist())):
+        n = a + b
+        if n == 0:
+            continue
+        if n <= 1000:
+            tail = sum(math.comb(n, x) for x in range(min(a, b) + 1)) / 2 ** n
+            p_values.flat[index] = min(1.0, 2 * tail)
+        else:
+            statistic = (abs(a - b) - 1) ** 2 / n
+            p_values.flat[index] = math.erfc(math.sqrt(statistic / 2))
+    return p_values
+
+
+def _label(value):
+    """Group label as a plain Python value, term numbers read as floats become integers"""
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _confidence_bounds(confidence):
+    tail = (1 - confidence) / 2 * 100
+    return [tail, 100 - tail]
+
+
+def analyze(hits, models, domains, groups=None, n_resamples=10000, confidence=0.95, seed=0, clusters=None):
+    """
+    Success rates with bootstrap confidence intervals, breakdowns by group and paired tests between models.
+
+    Parameters:
+    - hits: boolean array (rows, models, domains), see hit_matrix
+    - models, domains: names of the second and third axis of hits
+    - groups: optional {column: values of every row}, e.g. the GROUP_COLUMNS of the test set
+    - n_resamples: int, number of bootstrap resamples
+    - confidence: float, level of the confidence intervals
+    - seed: int, seed of the bootstrap
+    - clusters: optional cluster of every row, see bootstrap_rates
+
+    Returns:
+    - dict of pandas DataFrames: "rates", "pairwise" and "by <column>" for every group column
+    """
+    n_rows = hits.shape[0]
+    hit_counts = hits.sum(axis=0)
+    observed = hit_counts / n_rows * 100 if n_rows else np.zeros(hits.shape[1:])
+    boot = bootstrap_rates(hits, n_resamples, seed, clusters)
+    bounds = _confidence_bounds(confidence)
+
+    ci_low, ci_high = np.percentile(boot, bounds, axis=0)
+    # One row per domain and model, domains first
+    domain_index, model_index = (index.ravel() for index in np.meshgrid(np.arange(len(domains)), np.arange(len(models)),
+                                                                          indexing="ij"))
+    tables = {"rates": pd.DataFrame({
+        "domain": np.asarray(domains, dtype=object)[domain_index],
+        "model": np.asarray(models, dtype=object)[model_index],
+        "hits": hit_counts[model_index, domain_index],
+        "rows": n_rows,
+        "rate": observed[model_index, domain_index].round(4),
+        "ci_low": ci_low[model_index, domain_index].round(4),
+        "ci_high": ci_high[model_index, domain_index].round(4),
+    })}
+
+    # Every pair of models, compared on the same resamples
+    first, second = np.triu_indices(len(models), k=1)
+    difference = observed[first] - observed[second]
+    boot_difference = boot[:, first] - boot[:, second]
+    diff_low, diff_high = np.percentile(boot_difference, bounds, axis=0)
+    # Share of centered resample differences at least as far from zero as the observed one
+    extreme = np.abs(boot_difference - difference) >= np.abs(difference) - 1e-6
+    p_bootstrap = (extreme.sum(axis=0) + 1) / (n_resamples + 1)
+    only_first = (hits[:, first] & ~hits[:, second]).sum(axis=0)
+    only_second = (~hits[:, first] & hits[:, second]).sum(axis=0)
+    p_mcnemar = mcnemar_p(only_first, only_second)
+
+    domain_index, pair_index = (index.ravel() for index in np.meshgrid(np.arange(len(domains)), np.arange(len(first)),
+                                                                         indexing="ij"))
+    tables["pairwise"] = pd.DataFrame({
+        "domain": np.asarray(domains, dtype=object)[domain_index],
+        "model_a": np.asarray(models, dtype=object)[first[pair_index]],
+        "model_b": np.asarray(models, dtype=object)[second[pair_index]],
+        "rate_a": observed[first[pair_index], domain_index].round(4),
+        "rate_b": observed[second[pair_index], domain_index].round(4),
+        "difference": difference[pair_index, domain_index].round(4),
+        "ci_low": diff_low[pair_index, domain_index].round(4),
+        "ci_high": diff_high[pair_index, domain_index].round(4),
+        "only_a": only_first[pair_index, domain_index],
+        "only_b": only_second[pair_index, domain_index],
+        "p_bootstrap": p_bootstrap[pair_index, domain_index].round(6),
+        "p_mcnemar": p_mcnemar[pair_index, domain_index].round(6),
+    })
+
+    for column, values in (groups or {}).items():
+        labels, counts, sizes = group_hits(hits, values)
+        group_index, model_index, domain_index = np.meshgrid(np.arange(len(labels)), np.arange(len(models)),
+                                                             np.arange(len(domains)), indexing="ij")
+        rows = sizes[group_index.ravel()]
+        tables[f"by {column}"] = pd.DataFrame({
+            "group": [_label(label) for label in np.asarray(labels, dtype=object)[group_index.ravel()]],
+            "model": np.asarray(models, dtype=object)[model_index.ravel()],
+            "domain": np.asarray(domains, dtype=object)[domain_index.ravel()],
+            "hits": counts.ravel(),
+            "rows": rows,
+            "rate": (counts.ravel() / np.maximum(rows, 1) * 100).round(4),
+        })
+
+    return tables
+
+
+def write_analytics(tables, output_dir="./data/results_analysis/analytics", settings=None):
+    """
+    Writes the tables of analyze as CSV files and all of them together as analytics.json.
+
+    Parameters:
+    - tables: dict of pandas DataFrames from analyze
+    - output_dir: directory of the files
+    - settings: optional dict saved in the JSON, e.g. the number of resamples
+
+    Returns:
+    - path of the JSON file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for name, table in tables.items():
+        table.to_csv(os.path.join(output_dir, f"{name.replace(' ', '_').replace('.', '')}.csv"), index=False,
+                     encoding="utf-8")
+
+    output_path = os.path.join(output_dir, "analytics.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings or {},
+                   **{name: json.loads(table.to_json(orient="records", force_ascii=False))
+                      for name, table in tables.items()}},
+                  f, ensure_ascii=False, indent=2)
+    return output_path
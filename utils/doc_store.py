@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+from spacy.tokens import Doc, DocBin
+
+# Placeholder lemma of punctuation in older spaCy German models, removed from the CSV by lemmatize_translations
+PUNCT_LEMMA = "--"
+
+
+def docs_path(preprocessed_file, column):
+    """File of the lemmatized Docs of a translation column, next to the preprocessed data"""
+    return os.path.join(f"{os.path.splitext(preprocessed_file)[0]}_docs", f"{column}.spacy")
+
+
+def lemma_words(doc):
+    """
+    Tokens of the lemmatized sentence of a processed Doc, as TermFinder matches them.
+
+    Every lemma stays one token, so nothing is tokenized again. Punctuation keeps its text instead
+    of the PUNCT_LEMMA placeholder, and a token without a lemma keeps its text too.
+
+    Parameters:
+    - doc: Doc processed by the lemmatization pipeline
+
+    Returns:
+    - list of strings
+    """
+    return [token.text if token.lemma_ in ("", PUNCT_LEMMA) else token.lemma_ for token in doc]
+
+
+def save_lemma_docs(rows, vocab, path):
+    """
+    Writes the lemmatized sentences of a column with DocBin.
+
+    All rows are stored as one Doc with the number of tokens of every row in its user data, which
+    loads much faster than one Doc per row.
+
+    Parameters:
+    - rows: list with the lemma_words of every row, empty for rows without a translation
+    - vocab: Vocab of the lemmatization pipeline
+    - path: output file, see docs_path
+
+    Returns:
+    - Number of rows written
+    """
+    words = [word for row in rows for word in row]
+    # Words are separated by a space within a row, like in the lemmatized sentence
+    spaces = [True] * len(words)
+    end = 0
+    for row in rows:
+        end += len(row)
+        if row:
+            spaces[end - 1] = False
+
+    doc = Doc(vocab, words=words, spaces=spaces)
+    doc.user_data["row_lengths"] = [len(row) for row in rows]
+
+    doc_bin = DocBin(attrs=["ORTH"], store_user_data=True)
+    doc_bin.add(doc)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    doc_bin.to_disk(path)
+    return len(rows)
+
+
+def load_lemma_docs(path, vocab, n_rows=None):
+    """
+    Reads the lemmatized sentences written by save_lemma_docs.
+
+    Parameters:
+    - path: file written by save_lemma_docs
+    - vocab: Vocab of the pipeline the sentences are matched with
+    - n_rows: optional number of rows of the preprocessed data, checked so stale Docs are not used
+
+    Returns:
+    - list with one Span per row
+    """
+    doc = next(DocBin(store_user_data=True).from_disk(path).get_docs(vocab))
+    row_lengths = doc.user_data["row_lengths"]
+    if n_rows is not None and len(row_lengths) != n_rows:
+        raise ValueError(f"{path} has {len(row_lengths)} rows but the preprocessed data has {n_rows}, "
+                         f"run preproc_2.py with --save-docs again")
+    ends = np.cumsum(row_lengths, dtype=np.int64).tolist()
+    return [doc[end - length:end] for length, end in zip(row_lengths, ends)]
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from spacy.attrs import LEMMA, ORTH
+from spacy.pipeline import AttributeRuler, Lemmatizer
+
+
+def _context_free_pipeline(model):
+    """
+    Whether the lemma of a token only depends on its text: every lemmatizer works in lookup mode
+    and no attribute ruler sets lemmas from patterns.
+    """
+    for name, pipe in model.pipeline:
+        if isinstance(pipe, Lemmatizer):
+            if pipe.mode != "lookup":
+                return False
+        elif isinstance(pipe, AttributeRuler):
+            if any("LEMMA" in pattern.get("attrs", {}) for pattern in pipe.patterns):
+                return False
+        elif "token.lemma" in model.get_pipe_meta(name).assigns:
+            # e.g. the trainable lemmatizer
+            return False
+    return True
+
+
+# Lemmas of single tokens of one spaCy pipeline, so sentences made of known words skip the pipeline
+class TokenLemmaCache:
+
+    def __init__(self, model, model_id, path=None, min_count=3, verify_sample=100):
+        """
+        Initialize the TokenLemmaCache class.
+
+        A token text is trusted once the pipeline gave it the same lemma min_count times and never
+        another one. Texts seen with different lemmas depend on their context and are always left
+        to the pipeline. With a context-free pipeline (lookup lemmatizer) one observation is enough.
+        A sentence is answered from the cache only if all its tokens are trusted.
+
+        Args:
+            model: Loaded spaCy pipeline.
+            model_id: Name, version and components of the pipeline (see model_cache.spacy_model_id), part of the key
+                      of every cached lemma together with the token text.
+            path: Optional JSON file the cache is loaded from and saved to.
+            min_count: Number of agreeing observations before a token text is trusted.
+            verify_sample: Number of sentences answered from the cache that are also run through the pipeline,
+                           every token with a different lemma is no longer trusted.
+        """
+        self.model = model
+        self.model_id = model_id
+        self.path = Path(path) if path is not None else None
+        self.context_free = _context_free_pipeline(model)
+        self.min_count = 1 if self.context_free else max(1, min_count)
+        self.verify_sample = verify_sample
+        # text -> [lemma, agreeing observations]
+        self._lemmas = {}
+        self._ambiguous = set()
+        # Trusted lemmas as string hashes, ORTH -> LEMMA, so Docs are filled without creating Token objects
+        self._trusted = {}
+        self.cached_sentences = 0
+        self.piped_sentences = 0
+        self.verified = 0
+        self.mismatches = 0
+
+        if self.path is not None and self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._lemmas = data["lemmas"]
+            self._ambiguous = set(data["ambiguous"])
+            for text, (lemma, count) in self._lemmas.items():
+                if count >= self.min_count:
+                    self._trust(text, lemma)
+
+
+    @classmethod
+    def for_model(cls, cache_dir, model, model_id, **kwargs):
+        """Return a cache persisted in cache_dir under a file name tied to the pipeline"""
+        key = hashlib.sha1(model_id.encode("utf-8")).hexdigest()
+        return cls(model, model_id, path=Path(cache_dir) / f"token_lemmas_{key}.json", **kwargs)
+
+
+    def _trust(self, text, lemma):
+        strings = self.model.vocab.strings
+        self._trusted[strings.add(text)] = strings.add(lemma)
+
+
+    def _distrust(self, text):
+        self._lemmas.pop(text, None)
+        self._ambiguous.add(text)
+        self._trusted.pop(self.model.vocab.strings[text], None)
+
+
+    def _fill(self, doc):
+        """Set the lemmas of a tokenized Doc from the cache, if every token is trusted"""
+        trusted = self._trusted
+        lemmas = [trusted.get(orth) for orth in doc.to_array(ORTH).tolist()]
+        if None in lemmas:
+            return False
+        if lemmas:
+            doc.from_array([LEMMA], np.array(lemmas, dtype=np.uint64).reshape(-1, 1))
+        return True
+
+
+    def _learn(self, doc):
+        """Record the lemmas the pipeline gave to the tokens of a Doc"""
+        for token in doc:
+            text = token.text
+            if text in self._ambiguous:
+                continue
+            lemma = token.lemma_
+            cached = self._lemmas.get(text)
+            if cached is None:
+                cached = self._lemmas[text] = [lemma, 0]
+            elif cached[0] != lemma:
+                self._distrust(text)
+                continue
+            cached[1] += 1
+            if cached[1] == self.min_count:
+                self._trust(text, lemma)
+
+
+    def _verify(self, doc, piped):
+        """Compare a Doc filled from the cache with the pipeline, returning the Doc to keep"""
+        self.verified += 1
+        differs = False
+        for token, piped_token in zip(doc, piped):
+            if token.lemma_ != piped_token.lemma_:
+                differs = True
+                self._distrust(token.text)
+        if differs:
+            self.mismatches += 1
+            return piped
+        return doc
+
+
+    def pipe(self, texts, batch_size=1000, n_process=1):
+        """
+        Lemmatize texts like model.pipe, sending only the sentences with new or ambiguous tokens through the pipeline.
+
+        Args:
+            texts: Iterable of strings
+            batch_size: Number of sentences per batch, the cache learns from each batch before the next one
+            n_process: Number of processes used by model.pipe
+
+        Yields:
+            Docs in the order of texts, with the tokens of the pipeline's tokenizer and their lemmas
+        """
+        texts = list(texts)
+        for start in range(0, len(texts), batch_size):
+            docs = [self.model.make_doc(text) for text in texts[start:start + batch_size]]
+
+            pending, check = [], []
+            for i, doc in enumerate(docs):
+                if not self._fill(doc):
+                    pending.append(i)
+                elif self.verified + len(check) < self.verify_sample:
+                    check.append(i)
+
+            if pending or check:
+                # Pending Docs are already tokenized, checked ones go in as text so their cached lemmas stay
+                inputs = [docs[i] for i in pending] + [docs[i].text for i in check]
+                piped = self.model.pipe(inputs, batch_size=batch_size, n_process=n_process)
+                for n, (i, doc) in enumerate(zip(pending + check, piped)):
+                    if n < len(pending):
+                        docs[i] = doc
+                        self._learn(doc)
+                    else:
+                        docs[i] = self._verify(docs[i], doc)
+
+            self.piped_sentences += len(pending)
+            self.cached_sentences += len(docs) - len(pending)
+            yield from docs
+
+
+    def save(self):
+        """Write the cached lemmas to the cache file, if there is one"""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_id, "lemmas": self._lemmas, "ambiguous": sorted(self._ambiguous)},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+    def __len__(self):
+        return len(self._lemmas)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .term_finder_utils import TermResults
+
+# Test set columns the term lists are read from, see create_entries
+TERM_COLUMNS = ['TARGET HYPOTHESIS ', 'ALTRE OPZIONI STAA (CSV)', 'TERMINI ALTRI ORDINAMENTI (CSV)']
+
+
+def file_hash(path):
+    """SHA-1 of the content of a file"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_hash(data):
+    """SHA-1 of the values of a Series or DataFrame, independent of its index"""
+    values = pd.util.hash_pandas_object(data, index=False).values
+    return hashlib.sha1(values.tobytes()).hexdigest()
+
+
+def spacy_model_id(model):
+    """Name, version and components of a spaCy pipeline, which together decide its lemmas"""
+    return f"{model.meta.get('lang')}_{model.meta.get('name')}-{model.meta.get('version')}:{','.join(model.pipe_names)}"
+
+
+def term_index_key(term_table, ngram_hash, lang, nlp_model):
+    """
+    Key of a persisted TermIndex (see TermIndex.for_test_set), so a change of the test set terms, the ngram table
+    or the language pipeline builds a new index instead of loading a stale one.
+
+    Parameters:
+    - term_table: pandas DataFrame of the term columns of the test set
+    - ngram_hash: hash of the ngram probabilities, empty for Italian
+    - lang: target language
+    - nlp_model: spaCy pipeline the patterns are built with
+    """
+    return ModelCache.key(frame_hash(term_table), ngram_hash, lang, spacy_model_id(nlp_model))
+
+
+# Content-addressed cache of per-model outputs, so only models whose inputs changed are recomputed
+class ModelCache:
+
+    def __init__(self, cache_dir):
+        """
+        Initialize the ModelCache class.
+
+        Args:
+            cache_dir: Directory of the cache, with one file per cached output.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def key(*parts):
+        """Combine the hashes and identifiers of all inputs of an output into its cache key"""
+        return hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+    def _path(self, kind, key):
+        return self.cache_dir / kind / f"{key}.json"
+
+
+    def _load(self, kind, key):
+        path = self._path(kind, key)
+        if not path.exists():
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+    def _save(self, kind, key, data):
+        path = self._path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so an interrupted run never leaves a truncated entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+    def load_lemmas(self, key):
+        """Return the cached lemmatized column, or None"""
+        data = self._load("lemmas", key)
+        if data is None:
+            return None
+        return pd.Series([np.nan if value is None else value for value in data], dtype=object)
+
+
+    def save_lemmas(self, key, column):
+        """Cache a lemmatized column"""
+        self._save("lemmas", key, [None if pd.isna(value) else value for value in column])
+
+
+    def load_matches(self, key):
+        """Return the cached {domain: TermResults} of a model, or None"""
+        data = self._load("matches", key)
+        if data is None:
+            return None
+        return {domain: TermResults.from_dict(results) for domain, results in data.items()}
+
+
+    def save_matches(self, key, domain_results):
+        """Cache the {domain: TermResults} of a model"""
+        self._save("matches", key, {domain: results.to_dict() for domain, results in domain_results.items()})
@@ -0,0 +1,136 @@
+import argparse
+import hashlib
+import json
+from pathlib import Path
+
+import marisa_trie
+import numpy as np
+
+# Tables of the compound splitter probabilities
+NGRAM_TABLES = ("prefix", "infix", "suffix")
+
+
+# Read-only view of one ngram table, with the same get() as the dict loaded from JSON
+class NgramTable:
+
+    def __init__(self, trie, probs, max_len):
+        """
+        Initialize the NgramTable class.
+
+        Args:
+            trie: marisa_trie.Trie mapping each ngram to a row of probs.
+            probs: Array of float64 probabilities, usually memory-mapped.
+            max_len: Length of the longest ngram in the table.
+        """
+        self._trie = trie
+        self._probs = probs
+        self.max_len = max_len
+
+
+    def get(self, ngram, default=None):
+        """Return the probability of an ngram, or default if it is not in the table"""
+        idx = self._trie.get(ngram)
+        if idx is None:
+            return default
+        return float(self._probs[idx])
+
+
+    def __contains__(self, ngram):
+        return ngram in self._trie
+
+
+    def __iter__(self):
+        return iter(self._trie)
+
+
+    def __len__(self):
+        return len(self._trie)
+
+
+def ngram_max_len(table):
+    """Length of the longest key of an ngram table, either a dict or an NgramTable"""
+    if isinstance(table, NgramTable):
+        return table.max_len
+    return max(map(len, table), default=0)
+
+
+def convert_ngram_probs(json_path, store_path):
+    """
+    Converts ngram_probs.json to a directory of marisa tries and float64 arrays.
+
+    Parameters:
+    - json_path: path of the JSON file with "prefix", "infix" and "suffix" tables
+    - store_path: directory the store is written to
+
+    Returns:
+    - Path of the store
+    """
+    json_path = Path(json_path)
+    store_path = Path(store_path)
+    store_path.mkdir(parents=True, exist_ok=True)
+
+    with open(json_path, "rb") as f:
+        ngram_bytes = f.read()
+    ngram_probs = json.loads(ngram_bytes)
+
+    meta = {
+        # Same hash as the JSON source, so caches keyed on the table stay valid after conversion
+        "source_hash": hashlib.sha1(ngram_bytes).hexdigest()[:16],
+        "max_len": {},
+    }
+    del ngram_bytes
+
+    for name in NGRAM_TABLES:
+        table = ngram_probs[name]
+        trie = marisa_trie.Trie(table.keys())
+
+        # The trie decides the row of every key
+        probs = np.empty(len(trie), dtype=np.float64)
+        for ngram, prob in table.items():
+            probs[trie[ngram]] = prob
+
+        trie.save(str(store_path / f"{name}.marisa"))
+        np.save(store_path / f"{name}.npy", probs)
+        meta["max_len"][name] = max(map(len, table), default=0)
+
+    with open(store_path / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    return store_path
+
+
+def load_ngram_store(store_path):
+    """
+    Memory-maps a store written by convert_ngram_probs.
+
+    Parameters:
+    - store_path: directory of the store
+
+    Returns:
+    - tuple: (ngram_probs, source_hash)
+        - ngram_probs: dict of NgramTable, keyed by table name
+        - source_hash: hash of the JSON file the store was converted from
+    """
+    store_path = Path(store_path)
+    with open(store_path / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    ngram_probs = {}
+    for name in NGRAM_TABLES:
+        trie = marisa_trie.Trie().mmap(str(store_path / f"{name}.marisa"))
+        probs = np.load(store_path / f"{name}.npy", mmap_mode="r")
+        ngram_probs[name] = NgramTable(trie, probs, meta["max_len"][name])
+
+    return ngram_probs, meta["source_hash"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ngram_probs.json to a compact memory-mapped store.")
+    parser.add_argument("json_path", nargs="?", default="ngram_probs.json",
+                        help='JSON file with the ngram probabilities. Default is "ngram_probs.json".')
+    parser.add_argument("store_path", nargs="?", default="ngram_probs.marisa",
+                        help='Output directory. Default is "ngram_probs.marisa".')
+    args = parser.parse_args()
+
+    convert_ngram_probs(args.json_path, args.store_path)
+    print(f"Converted {args.json_path} to {args.store_path}")
@@ -1,6 +1,18 @@
+import os
+
 import pandas as pd
 import spacy
 
+from .profiling import Profiler
+from .doc_store import lemma_words, save_lemma_docs
+
+# spaCy models used for lemmatization, by target language
+SPACY_MODELS = {"de": "de_core_news_sm", "it": "it_core_news_sm"}
+
+# Components that never contribute to token.lemma_ and can be left out when only lemmas are needed
+LEMMA_EXCLUDE = ["parser", "ner", "senter", "sentencizer", "entity_ruler", "entity_linker",
+                 "textcat", "textcat_multilabel", "spancat"]
+
 # drag term id and target term fields
 def fill_nan_values(df, column_name):
     """
@@ -13,14 +25,10 @@ def fill_nan_values(df, column_name):
     Returns:
     - Modified DataFrame with NaN values filled
     """
-    last_valid_value = None
-    
-    for idx in range(len(df)):
-        if pd.notna(df.loc[idx, column_name]):
-            last_valid_value = df.loc[idx, column_name]
-        elif last_valid_value is not None:
-            df.loc[idx, column_name] = last_valid_value
-            
+    # Without any valid value there is nothing to drag, and ffill would turn an empty text column into floats
+    if df[column_name].notna().any():
+        df[column_name] = df[column_name].ffill()
+
     return df
 
 
@@ -39,28 +47,60 @@ def conditional_fill_nan_values(df, target_column, reference_column):
     Returns:
     - Modified DataFrame with NaN values in the target column filled conditionally
     """
-    last_valid_value = None
-    last_reference_value = None
-
-    for idx in range(len(df)):
-        current_reference_value = df.loc[idx, reference_column]
-        
-        if pd.notna(df.loc[idx, target_column]):
-            # Update last valid value and reference value when target is not NaN
-            last_valid_value = df.loc[idx, target_column]
-            last_reference_value = current_reference_value
-        elif last_reference_value == current_reference_value:
-            # Drag down the last valid value if the reference column hasn't changed
-            if last_valid_value is not None:
-                df.loc[idx, target_column] = last_valid_value
-        else:
-            # Stop dragging if the reference column value changes
-            last_valid_value = None
-            last_reference_value = current_reference_value
-    
+    target = df[target_column]
+    reference = df[reference_column]
+
+    # A new block starts at every valid target value and wherever the reference value changes
+    # (NaN never equals the previous value, so a NaN reference always starts a block).
+    # Forward filling inside each block stops the drag exactly where the reference column changes.
+    new_block = target.notna() | (reference != reference.shift())
+    df[target_column] = target.groupby(new_block.cumsum()).ffill()
+
     return df
 
 
+# Function to read the test set together with the translations of every model
+def read_translations(testset_file, translation_files):
+    """
+    Reads the test set and adds one column per translation file.
+
+    Parameters:
+    - testset_file: string, ';'-separated test set CSV
+    - translation_files: list of .txt files with one translation per line, the column is named after the file
+
+    Returns:
+    - pandas DataFrame of the test set with the translation columns
+    """
+    df = pd.read_csv(testset_file, delimiter=';', encoding='utf-8-sig')
+
+    for file_path in translation_files:
+        column_name = os.path.splitext(os.path.basename(file_path))[0]
+        # Add column
+        df[column_name] = read_translation_file(file_path)
+
+    # Replace any leftover newlines (in case)
+    return df.replace(to_replace=r'\n', value='', regex=True)
+
+
+# Function to read the translations of one model
+def read_translation_file(file_path):
+    """
+    Reads a translation file, one translation per line.
+
+    Parameters:
+    - file_path: string, .txt file of one model
+
+    Returns:
+    - list of strings without surrounding whitespace
+    """
+    # Read the file
+    with open(file_path, 'r', encoding="ISO-8859-1") as f:
+        translations = f.readlines()
+
+    # Clean newline characters
+    return [line.strip() for line in translations]
+
+
 # Function to lemmatize sentences
 def lemmatize_sentence(sentence, model):
 
@@ -70,4 +110,150 @@ def lemmatize_sentence(sentence, model):
         return sentence
     else:
         doc = nlp(sentence)
-        return ' '.join([token.lemma_ for token in doc])
\ No newline at end of file
+        return ' '.join([token.lemma_ for token in doc])
+
+
+# Function to lemmatize a whole column of sentences in batches
+def lemmatize_sentences(sentences, model, batch_size=1000, n_process=1, lemma_rows=None, lemma_cache=None):
+    """
+    Lemmatizes a sequence of sentences with nlp.pipe, giving the same output as
+    applying lemmatize_sentence to every element.
+
+    Parameters:
+    - sentences: pandas Series (or iterable) of sentences, may contain NaN
+    - model: loaded spaCy pipeline
+    - batch_size: int, number of sentences sent to the pipeline at once
+    - n_process: int, number of worker processes used by nlp.pipe
+    - lemma_rows: optional list, gets the lemma tokens of every sentence (see doc_store.lemma_words),
+      an empty list for NaN
+    - lemma_cache: optional TokenLemmaCache of the model, sentences of known words are not sent through the pipeline
+
+    Returns:
+    - pandas Series aligned with the input, NaN values left untouched
+    """
+    sentences = pd.Series(sentences, dtype=object)
+    valid = sentences.notna()
+
+    lemmatized = sentences.copy()
+    rows = [[] for _ in range(len(sentences))] if lemma_rows is not None else None
+
+    if valid.any():
+        pipe = lemma_cache.pipe if lemma_cache is not None else model.pipe
+        docs = pipe(sentences[valid].tolist(), batch_size=batch_size, n_process=n_process)
+        if rows is None:
+            lemmatized[valid] = [' '.join([token.lemma_ for token in doc]) for doc in docs]
+        else:
+            lemmas = []
+            for position, doc in zip(valid.to_numpy().nonzero()[0], docs):
+                lemmas.append(' '.join([token.lemma_ for token in doc]))
+                rows[position] = lemma_words(doc)
+            lemmatized[valid] = lemmas
+
+    if rows is not None:
+        lemma_rows.extend(rows)
+
+    return lemmatized
+
+
+# Function to lemmatize the translation columns and clean up the term columns
+def lemmatize_translations(df, model, translation_columns, batch_size=1000, n_process=1, profiler=None, doc_paths=None,
+                           lemma_cache=None):
+    """
+    Lemmatizes the translation columns of the test set and cleans the alternative term columns.
+
+    Parameters:
+    - df: pandas DataFrame with the test set and one column per translation model
+    - model: loaded spaCy pipeline
+    - translation_columns: list of the translation column names
+    - batch_size, n_process, lemma_cache: passed to lemmatize_sentences
+    - profiler: optional Profiler, gets the lemmatization time of every column
+    - doc_paths: optional {column: file}, the lemmas of each column are also written there as a Doc with DocBin
+      (see doc_store), so find_terms_2.py can match them without tokenizing the lemmatized sentences again
+
+    Returns:
+    - Modified DataFrame
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    # Apply lemmatization to new translation columns
+    for col in translation_columns:
+        lemma_rows = [] if doc_paths is not None else None
+        with profiler.stage(f"lemmatize [{col}]", items=int(df[col].notna().sum())):
+            df[col] = lemmatize_sentences(df[col], model, batch_size=batch_size, n_process=n_process,
+                                          lemma_rows=lemma_rows, lemma_cache=lemma_cache)
+        if lemma_rows is not None:
+            with profiler.stage(f"save docs [{col}]", items=len(lemma_rows)):
+                save_lemma_docs(lemma_rows, model.vocab, doc_paths[col])
+
+    return clean_translations(df, translation_columns)
+
+
+# Function to remove the lemmatization boilerplate from translations and term columns
+def clean_translations(df, translation_columns):
+    """
+    Removes the ' --' lemma of punctuation from the lemmatized translation columns and turns the ' -- '
+    separators of the alternative term columns into ', '.
+
+    Parameters:
+    - df: pandas DataFrame with the test set and the lemmatized translation columns
+    - translation_columns: list of the translation column names
+
+    Returns:
+    - Modified DataFrame
+    """
+    # Eliminate boilerplate from lemmatization of punctuation from translations
+    df[translation_columns] = df[translation_columns].apply(lambda col: col.str.replace(r' --', ' ', regex=True))
+
+    #clean text in other columns
+    df[['ALTRE OPZIONI STAA (CSV)', 'TERMINI ALTRI ORDINAMENTI (CSV)']] = df[['ALTRE OPZIONI STAA (CSV)', 'TERMINI ALTRI ORDINAMENTI (CSV)']].replace(r' -- ', ', ', regex=True)
+
+    return df
+
+
+# Function to load the spaCy pipeline for lemmatization
+def load_pipeline(model_name, profile="full"):
+    """
+    Loads a spaCy pipeline, optionally trimmed down to what lemmatization needs.
+
+    Parameters:
+    - model_name: string, name or path of the spaCy model
+    - profile: string, "full" loads every component, "lemma" excludes the components in LEMMA_EXCLUDE
+
+    Returns:
+    - Loaded spaCy pipeline
+    """
+    if profile == "full":
+        return spacy.load(model_name)
+    elif profile == "lemma":
+        return spacy.load(model_name, exclude=LEMMA_EXCLUDE)
+    else:
+        raise ValueError("Unsupported pipeline profile. Choose 'full' or 'lemma'.")
+
+
+# Function to make sure a trimmed pipeline lemmatizes like the full one
+def check_lemma_pipeline(trimmed_model, full_model, sentences):
+    """
+    Compares the lemmas produced by a trimmed pipeline with those of the full pipeline.
+
+    Parameters:
+    - trimmed_model: spaCy pipeline loaded with the "lemma" profile
+    - full_model: spaCy pipeline with all components
+    - sentences: iterable of sample sentences, NaN values are skipped
+
+    Returns:
+    - Number of sentences compared. Raises ValueError on the first mismatch.
+    """
+    sample = [sentence for sentence in sentences if not pd.isna(sentence)]
+
+    for sentence, trimmed_doc, full_doc in zip(sample, trimmed_model.pipe(sample), full_model.pipe(sample)):
+        trimmed_lemmas = [token.lemma_ for token in trimmed_doc]
+        full_lemmas = [token.lemma_ for token in full_doc]
+        if trimmed_lemmas != full_lemmas:
+            raise ValueError(
+                f"Lemma pipeline differs from the full pipeline on: {sentence!r}\n"
+                f"  full:    {' '.join(full_lemmas)}\n"
+                f"  trimmed: {' '.join(trimmed_lemmas)}"
+            )
+
+    return len(sample)
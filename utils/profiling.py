@@ -0,0 +1,124 @@
+import json
+import os
+from contextlib import nullcontext
+from time import perf_counter
+
+# Shared no-op context of a disabled Profiler
+_NO_STAGE = nullcontext()
+
+
+# Wall time, calls and items per stage plus named counters of a run, enabled by --profile
+class Profiler:
+
+    def __init__(self, enabled=True):
+        """
+        Initialize the Profiler class.
+
+        Args:
+            enabled: A disabled profiler records nothing. TermFinder only keeps enabled profilers,
+                     so its hot loop does no work at all without --profile.
+        """
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self._last = None
+
+
+    def add(self, name, seconds, items=0, calls=1):
+        """Add the time, calls and items (rows, sentences, ...) of a stage"""
+        if not self.enabled:
+            return
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {"seconds": 0.0, "calls": 0, "items": 0}
+        stage["seconds"] += seconds
+        stage["calls"] += calls
+        stage["items"] += items
+
+
+    def stage(self, name, items=0):
+        """Context manager timing a block as one call of a stage"""
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name, items)
+
+
+    def lap(self, name=None):
+        """
+        Add the time since the previous lap to a stage, so consecutive steps of a loop can be timed
+        with one call each. Without a name the clock is only restarted.
+        """
+        now = perf_counter()
+        if name is not None and self._last is not None:
+            self.add(name, now - self._last)
+        self._last = now
+
+
+    def count(self, name, n=1):
+        """Increase a counter"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def merge(self, data):
+        """Add the stages and counters of another profiler, e.g. of a worker process (see to_dict)"""
+        for name, stage in data["stages"].items():
+            self.add(name, stage["seconds"], stage["items"], stage["calls"])
+        for name, n in data["counters"].items():
+            self.count(name, n)
+
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self._last = None
+
+
+    def to_dict(self):
+        """Stages with their items per second, and the counters"""
+        stages = {}
+        for name, stage in self.stages.items():
+            rate = stage["items"] / stage["seconds"] if stage["items"] and stage["seconds"] else None
+            stages[name] = {**stage, "items_per_s": rate}
+        return {"stages": stages, "counters": dict(self.counters)}
+
+
+    def summary(self):
+        """Table of the stages and counters"""
+        lines = [f"{'stage':<45} {'seconds':>10} {'calls':>10} {'items':>10} {'items/s':>12}"]
+        for name, stage in self.to_dict()["stages"].items():
+            rate = "" if stage["items_per_s"] is None else f"{stage['items_per_s']:,.0f}"
+            items = stage["items"] or ""
+            lines.append(f"{name:<45} {stage['seconds']:>10.3f} {stage['calls']:>10} {items:>10} {rate:>12}")
+        if self.counters:
+            lines.append("")
+            lines.append(f"{'counter':<45} {'value':>10}")
+            for name, n in self.counters.items():
+                lines.append(f"{name:<45} {n:>10}")
+        return "\n".join(lines)
+
+
+    def save(self, path):
+        """Write to_dict as JSON"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class _Stage:
+
+    def __init__(self, profiler, name, items):
+        self.profiler = profiler
+        self.name = name
+        self.items = items
+
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, perf_counter() - self.start, self.items)
@@ -1,9 +1,31 @@
 import pandas as pd
 import os
+import math
+from concurrent.futures import ProcessPoolExecutor
 
 from .term_finder_utils import *
+from .table_io import write_match_lists
+from .doc_store import load_lemma_docs
+from .profiling import Profiler
 
-def find_terms_over_models(nlp, entries_dict, models_list, domain):
+# Output file and heading of the success rate of each domain
+RESULT_FILES = {
+    "South-Tyrol": "South_Tyrol_terms",
+    "other_tyrol": "other_south_tyrol_terms",
+    "other_systems": "other_legal_systems_terms",
+    "homonym": "wrong_homonyms",
+}
+
+CATEGORY_NAMES = {
+    "South-Tyrol": "Success rate of target South-Tyrolean terms",
+    "other_tyrol": "Success rate of alternative South-Tyrolean terms",
+    "other_systems": "Success rate of terms from extraneous legal systems",
+    "homonym": "Percentage of incorrect homonym insertion",
+}
+
+
+def find_terms_over_models(nlp, entries_dict, models_list, domain, matcher_cache=None, split_cache=None, resources=None, workers=1,
+                           term_index=None, profiler=None):
     """
     Find terms across all translation models using the specified domain.
     
@@ -12,73 +34,242 @@ def find_terms_over_models(nlp, entries_dict, models_list, domain):
     - entries_dict (dict): Dictionary mapping model names to entry lists
     - models_list (list): List of model/column names to process
     - domain (str): Domain to search in ("South-Tyrol", "other_tyrol", "other_systems", "homonym")
+    - matcher_cache (MatcherCache): Optional cache of compiled matchers, shared across calls
+    - split_cache (SplitCache): Optional cache of compound splits, shared across calls
+    - resources (TermFinderResources): Optional language resources, defaults to the shared ones of the current language
+    - workers (int): Number of worker processes, see find_terms_multi_over_models
+    - term_index (TermIndex): Optional index of all terms, shared across calls
+    - profiler (Profiler): Optional profiler, see find_terms_multi_over_models
     
     Returns:
-    - tuple: (term_finders dict, term_results dict)
-        - term_finders: TermFinder instances for each model
-        - term_results: Matched terms for each model
+    - dict: {model: TermResults}, the matched terms of every row for each model
     """
     
+    if workers > 1:
+        return find_terms_multi_over_models(nlp, entries_dict, models_list, [domain], matcher_cache, split_cache,
+                                            resources, workers, profiler=profiler, term_index=term_index)[domain]
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
     term_finders = {}
     term_results = {}
+
+    # One matcher cache for all models, since they share the same term lists
+    if matcher_cache is None:
+        matcher_cache = MatcherCache(nlp)
+    if split_cache is None:
+        split_cache = SplitCache()
+    # One index for all models, since they share the same terms
+    if term_index is None:
+        term_index = TermIndex(nlp)
     
     for col in models_list:
         entry_list = entries_dict[col]
         
-        tf = TermFinder(nlp, entry_list)
+        tf = TermFinder(nlp, entry_list, matcher_cache=matcher_cache, split_cache=split_cache, resources=resources,
+                        profiler=profiler, term_index=term_index)
         # Store the instance if you want to reuse it
         term_finders[col] = tf
         
         # Find terms matching the specified domain
         print(f"Matching {domain} terms for model: {col}")
-        term_match = tf.find_terms(domain=domain)
+        with profiler.stage(f"match [{col}]", items=len(entry_list)):
+            term_match = tf.find_terms(domain=domain)
         term_results[col] = term_match
     
     return term_results
 
 
 
-def save_term_results(term_results, filename, output_dir="./data/results"):
+def find_terms_multi_over_models(nlp, entries_dict, models_list, domains, matcher_cache=None, split_cache=None, resources=None, workers=1,
+                                 profiler=None, term_index=None, doc_paths=None):
+    """
+    Find terms of several domains across all translation models, in one pass per model.
+    
+    Parameters:
+    - nlp: spaCy NLP model
+    - entries_dict (dict): Dictionary mapping model names to entry lists
+    - models_list (list): List of model/column names to process
+    - domains (list): Domains to search in ("South-Tyrol", "other_tyrol", "other_systems", "homonym")
+    - matcher_cache (MatcherCache): Optional cache of compiled matchers, shared across calls (compiled matchers cannot
+      be sent to other processes, so workers compile their own with its size and their counters are added to it)
+    - split_cache (SplitCache): Optional cache of compound splits, shared across calls
+    - resources (TermFinderResources): Optional language resources, defaults to the shared ones of the current language
+    - workers (int): Number of worker processes, 1 runs everything in this process
+    - profiler (Profiler): Optional profiler, gets the matching time of every model and the TermFinder stages
+    - term_index (TermIndex): Optional index of all terms, shared across calls (workers start from a copy of it and
+      send back their lemmatized terms)
+    - doc_paths (dict): Optional {model: file} of the lemmatized Docs written by preproc_2.py --save-docs, matched
+      instead of tokenizing the sentences
+    
+    Returns:
+    - dict: {domain: {model: TermResults}}, one entry per domain as returned by find_terms_over_models
+    """
+    if split_cache is None:
+        split_cache = SplitCache()
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    if workers > 1:
+        return _find_terms_parallel(nlp, entries_dict, models_list, domains, split_cache, resources, workers, profiler,
+                                    term_index, doc_paths, matcher_cache)
+
+    if matcher_cache is None:
+        matcher_cache = MatcherCache(nlp)
+    if term_index is None:
+        term_index = TermIndex(nlp)
+
+    term_results = {domain: {} for domain in domains}
+
+    for col in models_list:
+        docs = None
+        if doc_paths is not None:
+            with profiler.stage(f"load docs [{col}]", items=len(entries_dict[col])):
+                docs = load_lemma_docs(doc_paths[col], nlp.vocab, n_rows=len(entries_dict[col]))
+        tf = TermFinder(nlp, entries_dict[col], matcher_cache=matcher_cache, split_cache=split_cache, resources=resources,
+                        profiler=profiler, term_index=term_index, docs=docs)
+
+        print(f"Matching {', '.join(domains)} terms for model: {col}")
+        with profiler.stage(f"match [{col}]", items=len(entries_dict[col])):
+            model_results = tf.find_terms_multi(domains=domains)
+        for domain, term_match in model_results.items():
+            term_results[domain][col] = term_match
+
+    return term_results
+
+
+# State of a worker process, set once by _init_term_worker
+_worker_state = {}
+
+def _init_term_worker(nlp, entries_dict, lang, ngram_path, split_cache_path, profile=False, term_index_data=None,
+                      doc_paths=None, matcher_cache_size=4096):
+    """Load the language resources and caches of a worker process"""
+    resources = get_resources(lang, ngram_path)
+    _worker_state["nlp"] = nlp
+    _worker_state["entries_dict"] = entries_dict
+    _worker_state["resources"] = resources
+    _worker_state["matcher_cache"] = MatcherCache(nlp, maxsize=matcher_cache_size)
+    _worker_state["term_index"] = TermIndex(nlp)
+    if term_index_data is not None:
+        _worker_state["term_index"].from_bytes(term_index_data)
+    _worker_state["split_cache"] = SplitCache(path=split_cache_path)
+    _worker_state["profiler"] = Profiler(enabled=profile)
+    _worker_state["doc_paths"] = doc_paths
+    # Docs of the models seen by this worker, loaded on first use
+    _worker_state["docs"] = {}
+
+
+def _worker_docs(col):
+    """Lemmatized Docs of a model in a worker process, or None without doc_paths"""
+    doc_paths = _worker_state["doc_paths"]
+    if doc_paths is None:
+        return None
+    docs = _worker_state["docs"]
+    if col not in docs:
+        entries = _worker_state["entries_dict"][col]
+        docs[col] = load_lemma_docs(doc_paths[col], _worker_state["nlp"].vocab, n_rows=len(entries))
+    return docs[col]
+
+
+def _find_terms_chunk(col, start, end, domains):
+    """Match the rows start:end of a model in a worker process"""
+    split_cache = _worker_state["split_cache"]
+    matcher_cache = _worker_state["matcher_cache"]
+    term_index = _worker_state["term_index"]
+    profiler = _worker_state["profiler"]
+    known_lemmas = set(term_index.lemmas)
+    hits, misses = split_cache.hits, split_cache.misses
+    matcher_hits, matcher_misses = matcher_cache.hits, matcher_cache.misses
+    docs = _worker_docs(col)
+
+    tf = TermFinder(_worker_state["nlp"], _worker_state["entries_dict"][col][start:end],
+                    matcher_cache=matcher_cache, split_cache=split_cache,
+                    resources=_worker_state["resources"], profiler=profiler, term_index=term_index,
+                    docs=docs[start:end] if docs is not None else None)
+    with profiler.stage(f"match [{col}] (worker time)", items=end - start):
+        chunk_results = tf.find_terms_multi(domains=domains)
+
+    # Stages of this chunk only, the parent process adds up the chunks
+    profile = profiler.to_dict() if profiler.enabled else None
+    profiler.reset()
+
+    new_lemmas = {term: lemmatized for term, lemmatized in term_index.lemmas.items() if term not in known_lemmas}
+
+    matcher_counts = (matcher_cache.hits - matcher_hits, matcher_cache.misses - matcher_misses)
+
+    return chunk_results, split_cache.pop_new(), split_cache.hits - hits, split_cache.misses - misses, profile, new_lemmas, \
+        matcher_counts
+
+
+def _find_terms_parallel(nlp, entries_dict, models_list, domains, split_cache, resources, workers, profiler, term_index=None,
+                         doc_paths=None, matcher_cache=None):
+    """Process-pool version of find_terms_multi_over_models, splitting every model into row chunks"""
+    if resources is None:
+        resources = get_resources()
+
+    # About four chunks per worker, so uneven chunks still keep every worker busy
+    n_rows = max((len(entries_dict[col]) for col in models_list), default=0)
+    chunk_size = max(1, math.ceil(n_rows * len(models_list) / (workers * 4)))
+    tasks = [(col, start, min(start + chunk_size, len(entries_dict[col])))
+             for col in models_list
+             for start in range(0, len(entries_dict[col]), chunk_size)]
+
+    print(f"Matching {', '.join(domains)} terms for {len(models_list)} models in {len(tasks)} chunks on {workers} workers")
+
+    term_results = {domain: {col: TermResults() for col in models_list} for domain in domains}
+    split_cache_path = str(split_cache.path) if split_cache.path is not None and split_cache.path.exists() else None
+    # Every worker starts from a copy of the index, which is completed here with what the workers add to it
+    term_index_data = term_index.to_bytes() if term_index is not None and (len(term_index) or term_index.lemmas) else None
+    matcher_cache_size = matcher_cache.maxsize if matcher_cache is not None else 4096
+    initargs = (nlp, entries_dict, resources.lang, resources.ngram_path, split_cache_path, profiler.enabled, term_index_data,
+                doc_paths, matcher_cache_size)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_term_worker, initargs=initargs) as executor:
+        # map returns the chunks in submission order, so results do not depend on scheduling
+        chunk_results = executor.map(_find_terms_chunk, *zip(*tasks), [domains] * len(tasks))
+        for (col, _, _), (chunk_result, new_splits, hits, misses, profile, new_lemmas, matcher_counts) in zip(tasks, chunk_results):
+            for domain in domains:
+                term_results[domain][col].extend(chunk_result[domain])
+            split_cache.update(new_splits, hits, misses)
+            if profile is not None:
+                profiler.merge(profile)
+            if term_index is not None:
+                term_index.add_lemmas(new_lemmas)
+            if matcher_cache is not None:
+                matcher_cache.hits += matcher_counts[0]
+                matcher_cache.misses += matcher_counts[1]
+
+    if term_index is not None:
+        for col in models_list:
+            TermFinder(nlp, entries_dict[col], resources=resources, term_index=term_index).index_terms(domains)
+
+    return term_results
+
+
+
+def save_term_results(term_results, filename, output_dir="./data/results", fmt="csv"):
     """
     Convert term results dictionary to a combined DataFrame and save to CSV.
     
     Parameters:
-    - term_results (dict): Dictionary with column names as keys and 
-                          {sentence: list_of_matches} dicts as values
+    - term_results (dict): Dictionary with column names as keys and TermResults as values
     - output_dir (str): Directory where the CSV will be saved (default: "data")
+    - fmt (str): "csv", or "parquet" to store the matches of every model as a list<string> column
     
     Returns:
     - pd.DataFrame: The combined DataFrame that was saved
     """
     
-    term_results_dfs = {}
-    
-    # Convert each result to a DataFrame
-    for col, result in term_results.items():
-        # result is a dict: {sentence: list_of_matches}
-        data = []
-        
-        for sentence, matches in result.items():
-            # Extract matched text spans (as strings)
-            match_texts = [span.text for span in matches]
-            data.append({"matches": match_texts})
-        
-        # Create a DataFrame for this column
-        term_results_dfs[col] = pd.DataFrame(data)
-    
-    # Initialize with the sentences from the first column
-    base_col = list(term_results_dfs.keys())[0]
-    combined_df = term_results_dfs[base_col][["matches"]].copy()
-    combined_df.rename(columns={"matches": base_col}, inplace=True)
-    
-    # Add each match column under its corresponding translation name
-    for col_name, df_match in term_results_dfs.items():
-        if col_name != base_col:
-            combined_df[col_name] = df_match["matches"].values
+    # One column per translation model, one row per test set row, each cell the list of matched texts
+    combined_df = pd.DataFrame({col: result.match_texts() for col, result in term_results.items()})
     
     os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"{filename}.csv")
-    combined_df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    output_path = os.path.join(output_dir, f"{filename}.{fmt}")
+    if fmt == "parquet":
+        write_match_lists(combined_df.to_dict("list"), output_path)
+    else:
+        combined_df.to_csv(output_path, index=False, encoding="utf-8-sig")
     print(f"Results saved to: {output_path}")
     return combined_df
     
@@ -88,11 +279,16 @@ def calculate_success_rate(data_dict):
     Calculate the percentage of full (non-empty) lists in a dictionary.
 
     Args:
-        data_dict (dict): A dictionary where values are lists.
+        data_dict (dict or TermResults): A dictionary where values are lists, or the TermResults of a model.
 
     Returns:
         float: Percentage of full lists against total lists.
     """
+    if isinstance(data_dict, TermResults):
+        if len(data_dict) == 0:
+            return 0.0
+        return data_dict.hit_rows().mean() * 100
+
     total_lists = len(data_dict)
     full_lists = sum(1 for v in data_dict.values() if isinstance(v, list) and v)
 
@@ -102,24 +298,56 @@ def calculate_success_rate(data_dict):
     return (full_lists / total_lists) * 100
 
 
-def print_success_rate(term_results, category_name, output_dir="./data/results_analysis", filename="term_accuracy_rates", clear_file=False):
+def success_rates(term_results):
     """
-    Calculate and save the percentage of non-empty lists ('matches') for each column.
+    Calculate the success rate of each model, rounded to two decimals.
 
     Args:
-        term_results_dfs (dict): Dict of DataFrames, each with a 'matches' column.
-        output_dir (str): Directory to save the summary CSV.
-        filename (str): Name of the output CSV (without extension).
-    """
+        term_results (dict): Dict of TermResults, one per model.
 
+    Returns:
+        dict: {model: rate}
+    """
     # Calculate success percentages for each dataframe
     full_percentage_results = {}
 
     for model_name, result_dict in term_results.items():
-        # Here, result_dict is a dict: {sentence: list_of_matches}
+        # Here, result_dict is the TermResults of the model
         percentage = calculate_success_rate(result_dict)
         full_percentage_results[model_name] = round(percentage, 2)
 
+    return full_percentage_results
+
+
+def print_success_rate(term_results, category_name, output_dir="./data/results_analysis", filename="term_accuracy_rates", clear_file=False):
+    """
+    Calculate and save the percentage of non-empty lists ('matches') for each column.
+
+    Args:
+        term_results (dict): Dict of TermResults, one per model.
+        category_name (str): Heading written above the rates.
+        output_dir (str): Directory to save the summary CSV.
+        filename (str): Name of the output CSV (without extension).
+    """
+
+    full_percentage_results = success_rates(term_results)
+
+    write_success_rate(full_percentage_results, category_name, output_dir, filename, clear_file)
+
+    return full_percentage_results
+
+
+def write_success_rate(full_percentage_results, category_name, output_dir="./data/results_analysis", filename="term_accuracy_rates", clear_file=False):
+    """
+    Write the success rate of each model under a category heading.
+
+    Args:
+        full_percentage_results (dict): {model: rate}
+        category_name (str): Heading written above the rates.
+        output_dir (str): Directory of the summary file.
+        filename (str): Name of the summary file.
+        clear_file (bool): Overwrite the file instead of appending to it.
+    """
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, filename)
 
@@ -130,5 +358,3 @@ def print_success_rate(term_results, category_name, output_dir="./data/results_a
         f.write(f"\n{category_name}:\n")
         for model, rate in full_percentage_results.items():
             f.write(f"{model}: {rate:.2f}%\n")
-
-    return full_percentage_results
\ No newline at end of file
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .preproc_utils import read_translations, read_translation_file, lemmatize_sentences, clean_translations, \
+    load_pipeline, SPACY_MODELS
+from .term_finder_utils import create_entries, TermFinder, MatcherCache, SplitCache, TermIndex, get_resources
+from .results_utils import find_terms_multi_over_models, success_rates, CATEGORY_NAMES
+from .model_cache import spacy_model_id, TERM_COLUMNS
+from .lemma_cache import TokenLemmaCache
+from .suite_utils import TESTSETS
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def data_file_path(data_dir, file):
+    """
+    Path of a translation file named by a request, which must be inside the data directory of the service.
+
+    Args:
+        data_dir: Resolved data directory, None if requests may not name files
+        file: Path relative to data_dir
+
+    Returns:
+        Resolved path, raises ValueError for paths outside data_dir
+    """
+    if data_dir is None:
+        raise ValueError("Reading files is disabled, send 'sentences' or start the service with --data-dir")
+    if not isinstance(file, str):
+        raise ValueError("'file' must be a path relative to the data directory")
+    # Resolved with symbolic links, so neither '..', an absolute path nor a link leads out of the data directory
+    path = os.path.realpath(os.path.join(data_dir, file))
+    if os.path.commonpath([path, data_dir]) != data_dir:
+        raise ValueError(f"{file} is outside the data directory")
+    return path
+
+
+# Evaluates translations of one test set on demand, keeping the models, caches and term index loaded
+class EvaluationService:
+
+    def __init__(self, lang="de", hom=False, testset=None, pipeline="full", batch_size=1000, ngram_path=None,
+                 split_cache_dir=None, lemma_cache_dir=None, max_batch=32, batch_wait=0.01, data_dir=None):
+        """
+        Initialize the EvaluationService class.
+
+        Loads the lemmatization pipeline, the language resources (with the ngram probabilities for German)
+        and the test set, and indexes all its terms, so a request only pays for lemmatizing and matching.
+
+        Args:
+            lang: Target language, "de" or "it".
+            hom: Whether the test set is the homonym one, which adds the homonym domain.
+            testset: ';'-separated test set CSV, defaults to the bundled one of the homonym flag.
+            pipeline: "full" or "lemma", see preproc_utils.load_pipeline.
+            batch_size: Number of sentences lemmatized together.
+            ngram_path: Optional path of the ngram probabilities, see TermFinderResources.
+            split_cache_dir: Optional directory where compound splits are kept between runs.
+            lemma_cache_dir: Optional directory of the TokenLemmaCache of the pipeline.
+            max_batch: Maximum number of requests evaluated together.
+            batch_wait: Seconds a batch waits for concurrent requests to join it.
+            data_dir: Optional directory the translation files of requests are read from, paths outside it are
+                      rejected. Without it requests must send their sentences.
+        """
+        if lang not in SPACY_MODELS:
+            raise ValueError(f"Unsupported language {lang!r}, choose 'de' or 'it'")
+
+        self.lang = lang
+        self.hom = hom
+        self.testset = testset or TESTSETS[hom][0]
+        self.batch_size = batch_size
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.data_dir = os.path.realpath(data_dir) if data_dir is not None else None
+        self.domains = ["South-Tyrol", "other_tyrol", "other_systems"] + (["homonym"] if hom else [])
+
+        self.model = load_pipeline(SPACY_MODELS[lang], profile=pipeline)
+        self.resources = get_resources(lang, ngram_path)
+        self.nlp = self.resources.nlp
+        if lang == "de":
+            # Loaded now rather than by the first request that needs the compound splitter
+            self.resources.ngram_probs
+
+        self.lemma_cache = None
+        if lemma_cache_dir:
+            self.lemma_cache = TokenLemmaCache.for_model(lemma_cache_dir, self.model, spacy_model_id(self.model))
+        if split_cache_dir and lang == "de":
+            self.split_cache = SplitCache.for_ngrams(split_cache_dir, self.resources.ngram_hash)
+        else:
+            self.split_cache = SplitCache()
+        self.matcher_cache = MatcherCache(self.nlp)
+        self.term_index = TermIndex(self.nlp)
+
+        # Raw test set, every batch adds its translations and cleans it like preproc_2.py
+        self.terms = read_translations(self.testset, [])
+        term_table = clean_translations(self.terms.copy(), [])
+        TermFinder(self.nlp, create_entries(term_table, TERM_COLUMNS[:1], homonym=hom)[TERM_COLUMNS[0]],
+                   resources=self.resources, term_index=self.term_index).index_terms(self.domains)
+
+        self.requests = 0
+        self.batches = 0
+        self._queue = None
+        # spaCy and the caches are used by one thread only, the event loop keeps accepting requests meanwhile
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+
+    @property
+    def n_rows(self):
+        return len(self.terms)
+
+
+    def evaluate_batch(self, requests):
+        """
+        Lemmatize and match the translations of several requests together.
+
+        Args:
+            requests: List of (model name, sentences), one sentence per test set row
+
+        Returns:
+            List with one dict per request: model, rates {domain: rate} and matches {domain: matched texts per row}
+        """
+        columns = [f"request_{self.requests + i}" for i in range(len(requests))]
+        df = self.terms.copy()
+
+        # All sentences go through the pipeline in one pass
+        sentences = pd.Series([sentence for _, model_sentences in requests for sentence in model_sentences], dtype=object)
+        lemmatized = lemmatize_sentences(sentences, self.model, batch_size=self.batch_size,
+                                         lemma_cache=self.lemma_cache).to_numpy()
+        for i, col in enumerate(columns):
+            df[col] = lemmatized[i * self.n_rows:(i + 1) * self.n_rows]
+        df = clean_translations(df, columns)
+
+        entries_dict = create_entries(df, columns, homonym=self.hom)
+        domain_results = find_terms_multi_over_models(self.nlp, entries_dict, columns, self.domains, self.matcher_cache,
+                                                      self.split_cache, self.resources, term_index=self.term_index)
+        rates = {domain: success_rates(domain_results[domain]) for domain in self.domains}
+
+        self.requests += len(requests)
+        self.batches += 1
+        return [{"model": name,
+                 "rates": {domain: rates[domain][col] for domain in self.domains},
+                 "matches": {domain: domain_results[domain][col].match_texts() for domain in self.domains}}
+                for (name, _), col in zip(requests, columns)]
+
+
+    def _sentences(self, payload):
+        """Sentences of an evaluate request, read from its file in data_dir or its sentence list"""
+        if "file" in payload:
+            sentences = read_translation_file(data_file_path(self.data_dir, payload["file"]))
+        elif "sentences" in payload:
+            sentences = payload["sentences"]
+            if not isinstance(sentences, list):
+                raise ValueError("'sentences' must be a list")
+            # Cleaned like the lines of a translation file, None stays a missing translation
+            sentences = [sentence.strip().replace("\n", "") if isinstance(sentence, str) else None
+                         for sentence in sentences]
+        else:
+            raise ValueError("Request needs 'sentences' or 'file'")
+        if len(sentences) != self.n_rows:
+            raise ValueError(f"Got {len(sentences)} sentences, the test set has {self.n_rows} rows")
+        return sentences
+
+
+    async def evaluate(self, sentences, model="model"):
+        """Queue the translations of one model, batched with the concurrent requests, and return its result"""
+        if self._queue is None:
+            raise RuntimeError("Service is not started")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((model, sentences, future))
+        return await future
+
+
+    async def _batcher(self):
+        """Evaluate the queued requests, all requests that arrive while a batch runs form the next one"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.batch_wait)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                results = await loop.run_in_executor(self._executor, self.evaluate_batch,
+                                                     [(model, sentences) for model, sentences, _ in batch])
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+    async def _route(self, method, path, body):
+        """Answer one HTTP request, returning the status and the JSON payload"""
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": "Use GET"}
+            return 200, {"status": "ok", "lang": self.lang, "hom": self.hom, "rows": self.n_rows,
+                         "domains": {domain: CATEGORY_NAMES[domain] for domain in self.domains},
+                         "indexed_terms": len(self.term_index), "requests": self.requests, "batches": self.batches}
+
+        if path == "/evaluate":
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object")
+            sentences = self._sentences(payload)
+            start = time.perf_counter()
+            result = await self.evaluate(sentences, model=str(payload.get("model", "model")))
+            if not payload.get("matches", True):
+                result = {key: value for key, value in result.items() if key != "matches"}
+            return 200, dict(result, seconds=round(time.perf_counter() - start, 3))
+
+        return 404, {"error": f"Unknown path {path}, use /evaluate or /health"}
+
+
+    async def _handle(self, reader, writer):
+        """Read one HTTP request from a connection and write the JSON answer"""
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            if len(request_line) < 2:
+                raise ValueError("Malformed request line")
+            method, path = request_line[0], request_line[1]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, payload = await self._route(method, path.split("?")[0], body)
+        except (ValueError, OSError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+    async def start(self, host="127.0.0.1", port=8765, socket_path=None):
+        """
+        Start the batcher and the HTTP server, on a Unix socket if socket_path is given.
+
+        Returns:
+            asyncio Server, close it to stop accepting requests
+        """
+        self._queue = asyncio.Queue()
+        self._batcher_task = asyncio.create_task(self._batcher())
+        if socket_path:
+            return await asyncio.start_unix_server(self._handle, path=socket_path)
+        return await asyncio.start_server(self._handle, host, port)
+
+
+    async def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        """Serve requests until cancelled"""
+        server = await self.start(host, port, socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._batcher_task.cancel()
+
+
+    def close(self):
+        """Write the split and lemma caches to their files and stop the evaluation thread"""
+        self._executor.shutdown(wait=True)
+        self.split_cache.save()
+        if self.lemma_cache is not None:
+            self.lemma_cache.save()
+
+
+async def call_service(path, payload=None, host="127.0.0.1", port=8765, socket_path=None):
+    """
+    Send one request to a running EvaluationService.
+
+    Args:
+        path: "/evaluate" (POST with payload) or "/health" (GET without payload)
+        payload: Optional JSON-serializable dict, e.g. {"model": "m1", "sentences": [...]}, or with "file" a path
+                 relative to the data directory of the service
+        host, port, socket_path: Address of the service, see EvaluationService.start
+
+    Returns:
+        (HTTP status, decoded JSON answer)
+    """
+    if socket_path:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    method = "POST" if payload is not None else "GET"
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    return status, json.loads(data)
@@ -0,0 +1,234 @@
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .table_io import with_format, read_preprocessed, ParquetChunkWriter, _import_pyarrow, _nan_for_missing
+
+
+def parse_shard(value):
+    """
+    Parses a shard given as "i/N", the i-th of N shards counting from 0 (e.g. $SLURM_ARRAY_TASK_ID/N).
+
+    Returns:
+        (index, count)
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}, expected i/N, e.g. 0/8") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}, i must be between 0 and N-1")
+    return index, count
+
+
+def shard_range(n_rows, index, count):
+    """Contiguous rows start:end of a shard, the shards of n_rows rows differ by at most one row"""
+    return n_rows * index // count, n_rows * (index + 1) // count
+
+
+def shard_path(path, index, count):
+    """File of one shard next to the file of a single-node run, e.g. data/x.shard-0-of-8.csv"""
+    base, extension = os.path.splitext(path)
+    return f"{base}.shard-{index}-of-{count}{extension}"
+
+
+# Byte offsets of the lines of a text file, so any range of lines is read with one seek
+class LineIndex:
+
+    def __init__(self, path, cache=True):
+        """
+        Initialize the LineIndex class.
+
+        Lines end like with readlines in text mode: at '\\n', '\\r\\n' or a single '\\r'. Only byte values are
+        compared, which holds for ISO-8859-1 and UTF-8 files.
+
+        Args:
+            path: Text file.
+            cache: Keep the offsets in '<path>.lines.npy', checked against the size and modification time
+                   of the file, so the other shards do not scan it again.
+        """
+        self.path = path
+        self.cache_path = f"{path}.lines.npy" if cache else None
+        stat = os.stat(path)
+        self._stamp = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        self.offsets = self._load()
+        if self.offsets is None:
+            self.offsets = self._scan()
+            self._save()
+
+
+    def _scan(self):
+        """Start of every line followed by the file size"""
+        size = int(self._stamp[0])
+        if size == 0:
+            return np.zeros(1, dtype=np.int64)
+        data = np.memmap(self.path, dtype=np.uint8, mode="r")
+        newline = data == ord("\n")
+        # A '\r' ends a line unless a '\n' follows it
+        carriage_return = data == ord("\r")
+        carriage_return[:-1] &= ~newline[1:]
+        ends = np.flatnonzero(newline | carriage_return) + 1
+        del data
+        if len(ends) and ends[-1] == size:
+            ends = ends[:-1]
+        return np.concatenate([[0], ends, [size]]).astype(np.int64)
+
+
+    def _load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return None
+        cached = np.load(self.cache_path)
+        if not np.array_equal(cached[:2], self._stamp):
+            return None
+        return cached[2:]
+
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        # Shards may build the same index at once, each writes its own file and renames it
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.concatenate([self._stamp, self.offsets]))
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            # A read-only data folder only costs the scan
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+    def read(self, start, end):
+        """Raw bytes of the lines start:end, each with its line ending"""
+        start, end = max(0, start), min(end, len(self))
+        if start >= end:
+            return []
+        offsets = self.offsets[start:end + 1] - self.offsets[start]
+        with open(self.path, "rb") as f:
+            f.seek(int(self.offsets[start]))
+            data = f.read(int(offsets[-1]))
+        return [data[offsets[i]:offsets[i + 1]] for i in range(end - start)]
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def read_translation_shard(testset_file, translation_files, index, count):
+    """
+    Reads the rows of one shard of the test set and of every translation file, like preproc_utils.read_translations.
+
+    The translation files are read through a LineIndex, so only the lines of the shard are read. The test set
+    is parsed whole, so its column types are the ones of a single-node run.
+
+    Returns:
+        pandas DataFrame of the rows of the shard
+    """
+    df = pd.read_csv(testset_file, delimiter=';', encoding='utf-8-sig')
+    n_rows = len(df)
+    start, end = shard_range(n_rows, index, count)
+    df = df.iloc[start:end].copy()
+
+    for file_path in translation_files:
+        column_name = os.path.splitext(os.path.basename(file_path))[0]
+        line_index = LineIndex(file_path)
+        if len(line_index) != n_rows:
+            raise ValueError(f"{column_name} has {len(line_index)} lines but the test set has {n_rows} rows")
+        df[column_name] = [line.decode("ISO-8859-1").strip() for line in line_index.read(start, end)]
+
+    # Replace any leftover newlines (in case)
+    return df.replace(to_replace=r'\n', value='', regex=True)
+
+
+def read_preprocessed_shard(path, fmt, index, count):
+    """
+    Reads the rows of one shard of the preprocessed data written by a single-node run.
+
+    A CSV is read through a LineIndex: write_preprocessed writes one line per row, since the newlines of the
+    translations were removed.
+
+    Returns:
+        pandas DataFrame of the rows of the shard
+    """
+    path = with_format(path, fmt)
+    if fmt == "parquet":
+        df = read_preprocessed(path, fmt)
+        start, end = shard_range(len(df), index, count)
+        return df.iloc[start:end].reset_index(drop=True)
+
+    line_index = LineIndex(path)
+    # The first line is the header
+    start, end = shard_range(len(line_index) - 1, index, count)
+    lines = line_index.read(0, 1) + line_index.read(start + 1, end + 1)
+    return pd.read_csv(io.BytesIO(b"".join(lines)), delimiter=';', encoding='utf-8-sig')
+
+
+def save_shard_counts(counts, path):
+    """Write the counts behind the success rates of a shard, {domain: {model: (rows with a match, rows)}}"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(counts, f, indent=2)
+
+
+def merge_shard_counts(paths):
+    """Add up the counts of save_shard_counts, keeping the order of the domains and models"""
+    counts = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for domain, model_counts in json.load(f).items():
+                merged = counts.setdefault(domain, {})
+                for model, (hits, rows) in model_counts.items():
+                    merged_hits, merged_rows = merged.get(model, (0, 0))
+                    merged[model] = (merged_hits + hits, merged_rows + rows)
+    return counts
+
+
+def merge_tables(paths, output_path, fmt="csv"):
+    """
+    Concatenates the files of the shards, in order, into the file of a single-node run.
+
+    A CSV is copied byte by byte, without the byte order mark and header of the following shards. Parquet
+    shards are appended as row groups.
+
+    Parameters:
+    - paths: list of the shard files
+    - output_path: merged file
+    - fmt: "csv" or "parquet"
+
+    Returns:
+    - Path of the merged file
+    """
+    if fmt == "parquet":
+        pa = _import_pyarrow()
+        with ParquetChunkWriter(output_path) as writer:
+            for path in paths:
+                table = pa.parquet.read_table(path)
+                if any(pa.types.is_list(field.type) for field in table.schema):
+                    # Term results, every shard has the same list<string> columns
+                    writer.write(table)
+                else:
+                    writer.write(_nan_for_missing(table.to_pandas()))
+        return output_path
+
+    with open(output_path, "wb") as output:
+        for i, path in enumerate(paths):
+            with open(path, "rb") as f:
+                if i > 0:
+                    f.readline()
+                while True:
+                    block = f.read(1 << 24)
+                    if not block:
+                        break
+                    output.write(block)
+    return output_path
+
+
+def missing_shards(paths):
+    """Shard files that do not exist, so a merge fails before writing anything"""
+    return [path for path in paths if not os.path.exists(path)]
@@ -0,0 +1,196 @@
+import itertools
+import os
+
+import pandas as pd
+
+from .preproc_utils import lemmatize_translations
+from .term_finder_utils import create_entries, TermFinder
+from .results_utils import write_success_rate
+from .profiling import Profiler
+from .table_io import with_format, iter_preprocessed, match_table, ParquetChunkWriter
+
+
+def append_csv(df, path, header, **kwargs):
+    """
+    Write a chunk of a CSV file: the first chunk (with header) creates the file, the others are appended.
+
+    Parameters:
+    - df: pandas DataFrame of the chunk
+    - path: output file
+    - header: bool, True for the first chunk
+    - kwargs: passed to DataFrame.to_csv
+    """
+    # Only the start of the file gets the byte order mark
+    mode, encoding = ("w", "utf-8-sig") if header else ("a", "utf-8")
+    with open(path, mode, encoding=encoding) as f:
+        df.to_csv(f, index=False, header=header, **kwargs)
+
+
+def iter_translation_chunks(testset_path, translation_files, chunk_size):
+    """
+    Reads the test set and the translation files in aligned chunks.
+
+    Parameters:
+    - testset_path: ';'-separated test set CSV
+    - translation_files: list of .txt files, one translation per line
+    - chunk_size: int, number of rows per chunk
+
+    Yields:
+    - pandas DataFrame of chunk_size test set rows, with one column per translation file
+    """
+    columns = [os.path.splitext(os.path.basename(file_path))[0] for file_path in translation_files]
+    handles = [open(file_path, 'r', encoding="ISO-8859-1") for file_path in translation_files]
+
+    try:
+        for chunk in pd.read_csv(testset_path, delimiter=';', encoding='utf-8-sig', chunksize=chunk_size):
+            for column, handle in zip(columns, handles):
+                translations = [line.strip() for line in itertools.islice(handle, len(chunk))]
+                if len(translations) != len(chunk):
+                    raise ValueError(f"{column} has fewer lines than the test set")
+                chunk[column] = translations
+
+            # Replace any leftover newlines (in case)
+            yield chunk.replace(to_replace=r'\n', value='', regex=True)
+
+        for column, handle in zip(columns, handles):
+            if handle.readline():
+                raise ValueError(f"{column} has more lines than the test set")
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def stream_preprocess(chunks, model, translation_columns, output_path, batch_size=1000, n_process=1, fmt="csv", profiler=None,
+                      lemma_cache=None):
+    """
+    Lemmatizes chunks of the test set and appends them to the preprocessed CSV.
+
+    Parameters:
+    - chunks: iterable of DataFrames, e.g. from iter_translation_chunks
+    - model: loaded spaCy pipeline
+    - translation_columns: list of the translation column names
+    - output_path: preprocessed ';'-separated CSV, the extension is replaced by the one of the format
+    - batch_size, n_process, lemma_cache: passed to lemmatize_sentences
+    - fmt: "csv" or "parquet"
+    - profiler: optional Profiler, see lemmatize_translations
+
+    Returns:
+    - Number of rows written
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    output_path = with_format(output_path, fmt)
+    parquet_writer = ParquetChunkWriter(output_path) if fmt == "parquet" else None
+
+    n_rows = 0
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk = lemmatize_translations(chunk, model, translation_columns, batch_size=batch_size, n_process=n_process,
+                                           profiler=profiler, lemma_cache=lemma_cache)
+            with profiler.stage("write chunk", items=len(chunk)):
+                if parquet_writer is not None:
+                    parquet_writer.write(chunk)
+                else:
+                    append_csv(chunk, output_path, header=(i == 0), sep=";")
+            n_rows += len(chunk)
+            print(f"Preprocessed {n_rows} rows")
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+    return n_rows
+
+
+def stream_find_terms(preprocessed_path, models_list, domains, output_files, nlp=None, homonym=False, chunk_size=10000,
+                      matcher_cache=None, split_cache=None, resources=None, output_dir="./data/results", fmt="csv",
+                      profiler=None, term_index=None, hit_rows=None):
+    """
+    Matches the terms of a preprocessed CSV chunk by chunk, appending to one results CSV per domain.
+
+    Parameters:
+    - preprocessed_path: preprocessed ';'-separated CSV
+    - models_list (list): List of model/column names to process
+    - domains (list): Domains to search in ("South-Tyrol", "other_tyrol", "other_systems", "homonym")
+    - output_files (dict): {domain: file name without extension}, as in save_term_results
+    - nlp: spaCy NLP model, defaults to the blank pipeline of the resources
+    - homonym (bool): Whether the test set has the 'OPTIONS' column
+    - chunk_size (int): Number of rows per chunk
+    - matcher_cache, split_cache, resources, term_index: Optional shared caches, language resources and term index, see TermFinder
+    - output_dir (str): Directory where the CSVs are saved
+    - fmt (str): "csv" or "parquet", for both the preprocessed input and the results
+    - profiler (Profiler): Optional profiler, gets the matching time of every model and the TermFinder stages
+    - hit_rows (dict): Optional, gets {domain: {model: list}} with the TermResults.hit_rows of every chunk, e.g. for
+      analytics.hit_matrix after concatenating them
+
+    Returns:
+    - dict: {domain: {model: (rows with a match, rows)}}, the counts behind the success rates
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    # The first TermFinder creates whatever was not passed, the following ones share it
+    tf = TermFinder(nlp, [], matcher_cache=matcher_cache, split_cache=split_cache, resources=resources, profiler=profiler,
+                    term_index=term_index)
+    counts = {domain: {col: (0, 0) for col in models_list} for domain in domains}
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_paths = {domain: os.path.join(output_dir, f"{output_files[domain]}.{fmt}") for domain in domains}
+    parquet_writers = {domain: ParquetChunkWriter(output_paths[domain]) for domain in domains} if fmt == "parquet" else {}
+
+    n_rows = 0
+    try:
+        for i, chunk in enumerate(iter_preprocessed(preprocessed_path, fmt, chunk_size)):
+            entries_dict = create_entries(chunk, models_list, homonym=homonym)
+
+            chunk_results = {domain: {} for domain in domains}
+            for col in models_list:
+                tf = TermFinder(tf.nlp, entries_dict[col], matcher_cache=tf.matcher_cache, split_cache=tf.split_cache,
+                                resources=tf.resources, profiler=profiler, term_index=tf.term_index)
+                with profiler.stage(f"match [{col}]", items=len(chunk)):
+                    model_results = tf.find_terms_multi(domains=domains)
+                for domain, result in model_results.items():
+                    chunk_results[domain][col] = result
+                    chunk_hits = result.hit_rows()
+                    hits, rows = counts[domain][col]
+                    counts[domain][col] = (hits + int(chunk_hits.sum()), rows + len(result))
+                    if hit_rows is not None:
+                        hit_rows.setdefault(domain, {}).setdefault(col, []).append(chunk_hits)
+
+            with profiler.stage("write results", items=len(chunk)):
+                for domain in domains:
+                    match_lists = {col: result.match_texts() for col, result in chunk_results[domain].items()}
+                    if fmt == "parquet":
+                        parquet_writers[domain].write(match_table(match_lists))
+                    else:
+                        append_csv(pd.DataFrame(match_lists), output_paths[domain], header=(i == 0))
+
+            n_rows += len(chunk)
+            print(f"Matched {n_rows} rows")
+    finally:
+        for writer in parquet_writers.values():
+            writer.close()
+
+    for domain in domains:
+        print(f"Results saved to: {output_paths[domain]}")
+
+    return counts
+
+
+def write_stream_success_rates(counts, category_names, output_dir="./data/results_analysis", filename="term_accuracy_rates"):
+    """
+    Writes the success rates of stream_find_terms, in the same format as print_success_rate.
+
+    Parameters:
+    - counts (dict): {domain: {model: (rows with a match, rows)}}
+    - category_names (dict): {domain: heading written above the rates}
+
+    Returns:
+    - dict: {domain: {model: rate}}
+    """
+    rates = {}
+    for i, (domain, model_counts) in enumerate(counts.items()):
+        rates[domain] = {model: round(hits / rows * 100 if rows else 0.0, 2) for model, (hits, rows) in model_counts.items()}
+        write_success_rate(rates[domain], category_names[domain], output_dir, filename, clear_file=(i == 0))
+
+    return rates
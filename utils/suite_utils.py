@@ -0,0 +1,253 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+
+from .preproc_utils import read_translations, lemmatize_translations, load_pipeline, SPACY_MODELS
+from .term_finder_utils import create_entries, MatcherCache, SplitCache, TermIndex, get_resources
+from .results_utils import find_terms_multi_over_models, save_term_results, print_success_rate, RESULT_FILES, CATEGORY_NAMES
+from .table_io import check_format, write_preprocessed, read_preprocessed
+
+# Test set and translation folder of the bundled suites, by homonym flag
+TESTSETS = {
+    True: ("./data/homonyms/1_testset_omonimi.csv", "./data/homonyms"),
+    False: ("./data/simple_terms/testset_simple_terms.csv", "./data/simple_terms"),
+}
+
+STAGES = ("preprocess", "find_terms")
+
+
+# One test set evaluated in one language, read from a section of the manifest
+class Suite:
+
+    def __init__(self, name, lang="de", hom=False, testset=None, translations=None, pattern="*.txt", output_dir=None,
+                 stages=STAGES, fmt="csv", pipeline="full", batch_size=1000):
+        """
+        Initialize the Suite class.
+
+        Args:
+            name: Name of the suite, the section of the manifest.
+            lang: Target language, "de" or "it".
+            hom: Whether the suite is a homonym test set, which adds the homonym domain.
+            testset: ';'-separated test set CSV, defaults to the bundled one of the homonym flag.
+            translations: Folder of the translation files, defaults to the bundled one of the homonym flag.
+            pattern: Glob pattern of the translation files in the folder, one model per file.
+            output_dir: Folder of the preprocessed data, results and rates, defaults to data/suites/<name>.
+            stages: Stages to run among "preprocess" and "find_terms".
+            fmt: "csv" or "parquet", format of the preprocessed data and of the results.
+            pipeline: "full" or "lemma", see preproc_utils.load_pipeline.
+            batch_size: Number of sentences lemmatized together.
+        """
+        if lang not in SPACY_MODELS:
+            raise ValueError(f"Suite {name}: unsupported language {lang!r}, choose 'de' or 'it'")
+        unknown = [stage for stage in stages if stage not in STAGES]
+        if unknown:
+            raise ValueError(f"Suite {name}: unknown stages {unknown}, choose among {STAGES}")
+        check_format(fmt)
+
+        self.name = name
+        self.lang = lang
+        self.hom = hom
+        self.testset = testset or TESTSETS[hom][0]
+        self.translations = translations or TESTSETS[hom][1]
+        self.pattern = pattern
+        self.output_dir = output_dir or os.path.join("data", "suites", name)
+        self.stages = tuple(stages)
+        self.fmt = fmt
+        self.pipeline = pipeline
+        self.batch_size = batch_size
+
+
+    @classmethod
+    def from_section(cls, name, section):
+        """Create a suite from a ConfigParser section, see load_manifest"""
+        return cls(
+            name,
+            lang=section.get("lang", "de"),
+            hom=section.getboolean("hom", False),
+            testset=section.get("testset"),
+            translations=section.get("translations"),
+            pattern=section.get("pattern", "*.txt"),
+            output_dir=section.get("output_dir"),
+            stages=[stage.strip() for stage in section.get("stages", ",".join(STAGES)).split(",") if stage.strip()],
+            fmt=section.get("format", "csv"),
+            pipeline=section.get("pipeline", "full"),
+            batch_size=section.getint("batch_size", 1000),
+        )
+
+
+    @property
+    def preprocessed_file(self):
+        return os.path.join(self.output_dir, "preprocessed_data.csv")
+
+
+    @property
+    def domains(self):
+        return ["South-Tyrol", "other_tyrol", "other_systems"] + (["homonym"] if self.hom else [])
+
+
+    def translation_files(self):
+        return glob.glob(os.path.join(self.translations, self.pattern))
+
+
+    def models(self):
+        """Model names, the translation file names without extension"""
+        return [os.path.splitext(os.path.basename(file_path))[0] for file_path in self.translation_files()]
+
+
+def load_manifest(path):
+    """
+    Reads the suites of a manifest, an INI file with one section per suite.
+
+    Keys of a section (all optional): lang, hom, testset, translations, pattern, output_dir,
+    stages, format, pipeline and batch_size, see Suite. A [DEFAULT] section sets them for all suites.
+
+    Returns:
+        List of Suite, in the order of the manifest
+    """
+    manifest = ConfigParser()
+    if not manifest.read(path, encoding="utf-8"):
+        raise FileNotFoundError(f"File not found: {path}")
+    return [Suite.from_section(name, manifest[name]) for name in manifest.sections()]
+
+
+# Runs suites in one process, loading every model and ngram table once
+class SuiteRunner:
+
+    def __init__(self, ngram_path=None, split_cache_dir=None, workers=1):
+        """
+        Initialize the SuiteRunner class.
+
+        Args:
+            ngram_path: Optional path of the ngram probabilities, see TermFinderResources.
+            split_cache_dir: Optional directory where compound splits are kept between runs.
+            workers: Number of worker processes used for matching each suite.
+        """
+        self.ngram_path = ngram_path
+        self.split_cache_dir = split_cache_dir
+        self.workers = workers
+        self._pipelines = {}
+        self._matcher_caches = {}
+        self._split_caches = {}
+
+
+    def pipeline(self, lang, profile="full"):
+        """spaCy lemmatization pipeline of a language, loaded on first use"""
+        key = (lang, profile)
+        if key not in self._pipelines:
+            self._pipelines[key] = load_pipeline(SPACY_MODELS[lang], profile=profile)
+        return self._pipelines[key]
+
+
+    def _caches(self, lang):
+        """Matcher and split caches of a language, shared by its suites"""
+        if lang not in self._matcher_caches:
+            resources = get_resources(lang, self.ngram_path)
+            self._matcher_caches[lang] = MatcherCache(resources.nlp)
+            if self.split_cache_dir and lang == "de":
+                self._split_caches[lang] = SplitCache.for_ngrams(self.split_cache_dir, resources.ngram_hash)
+            else:
+                self._split_caches[lang] = SplitCache()
+        return self._matcher_caches[lang], self._split_caches[lang]
+
+
+    def preprocess(self, suite):
+        """Lemmatize the translations of a suite and write its preprocessed data"""
+        models = suite.models()
+        df = read_translations(suite.testset, suite.translation_files())
+        df = lemmatize_translations(df, self.pipeline(suite.lang, suite.pipeline), models, batch_size=suite.batch_size)
+        os.makedirs(suite.output_dir, exist_ok=True)
+        return write_preprocessed(df, suite.preprocessed_file, suite.fmt)
+
+
+    def find_terms(self, suite):
+        """
+        Match the terms of a suite in its preprocessed data, writing the results and the success rates.
+
+        Returns:
+            dict: {domain: {model: rate}}
+        """
+        resources = get_resources(suite.lang, self.ngram_path)
+        matcher_cache, split_cache = self._caches(suite.lang)
+        models = suite.models()
+
+        df = read_preprocessed(suite.preprocessed_file, suite.fmt)
+        entries_dict = create_entries(df, models, homonym=suite.hom)
+        domain_results = find_terms_multi_over_models(resources.nlp, entries_dict, models, suite.domains, matcher_cache,
+                                                      split_cache, resources, workers=self.workers,
+                                                      term_index=TermIndex(resources.nlp))
+
+        results_dir = os.path.join(suite.output_dir, "results")
+        analysis_dir = os.path.join(suite.output_dir, "results_analysis")
+        rates = {}
+        for i, domain in enumerate(suite.domains):
+            save_term_results(domain_results[domain], filename=RESULT_FILES[domain], output_dir=results_dir, fmt=suite.fmt)
+            rates[domain] = print_success_rate(domain_results[domain], category_name=CATEGORY_NAMES[domain],
+                                               output_dir=analysis_dir, clear_file=(i == 0))
+        return rates
+
+
+    def run(self, suite):
+        """
+        Run the stages of a suite.
+
+        Returns:
+            dict with the seconds of every stage and the success rates (None without the find_terms stage)
+        """
+        print(f"Running suite {suite.name} ({suite.lang}, {'homonyms' if suite.hom else 'simple terms'})")
+        summary = {"lang": suite.lang, "hom": suite.hom, "output_dir": suite.output_dir, "seconds": {}, "rates": None}
+        for stage in suite.stages:
+            start = time.perf_counter()
+            if stage == "preprocess":
+                self.preprocess(suite)
+            else:
+                summary["rates"] = self.find_terms(suite)
+            summary["seconds"][stage] = round(time.perf_counter() - start, 3)
+        return summary
+
+
+    def close(self):
+        """Write the compound splits to the split cache files"""
+        for split_cache in self._split_caches.values():
+            split_cache.save()
+
+
+def _run_group(suites, runner_options):
+    """Run suites of one language with one runner, in a worker process of run_suites"""
+    runner = SuiteRunner(**runner_options)
+    try:
+        return {suite.name: runner.run(suite) for suite in suites}
+    finally:
+        runner.close()
+
+
+def run_suites(suites, jobs=1, **runner_options):
+    """
+    Run suites, each language in one process so its models are loaded once.
+
+    Args:
+        suites: List of Suite, e.g. from load_manifest
+        jobs: Number of processes, languages run concurrently when greater than 1
+        runner_options: Passed to SuiteRunner
+
+    Returns:
+        dict: {suite name: summary from SuiteRunner.run}, in the order of suites
+    """
+    names = [suite.name for suite in suites]
+    if len(set(names)) != len(names):
+        raise ValueError("Suite names must be unique")
+
+    groups = {}
+    for suite in suites:
+        groups.setdefault(suite.lang, []).append(suite)
+
+    if jobs > 1 and len(groups) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(groups))) as executor:
+            summaries = {}
+            for group_summary in executor.map(_run_group, groups.values(), [runner_options] * len(groups)):
+                summaries.update(group_summary)
+    else:
+        summaries = _run_group(suites, runner_options)
+
+    return {name: summaries[name] for name in names}
@@ -0,0 +1,184 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Formats of the preprocessed data and of the term results, CSV is the default
+OUTPUT_FORMATS = ("csv", "parquet")
+
+
+def _import_pyarrow():
+    """Import pyarrow, which is only needed for the parquet format"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The parquet format needs pyarrow, install it with 'pip install pyarrow'") from None
+    return pyarrow
+
+
+def check_format(fmt):
+    """Fail early, before any work is done, when the format cannot be written"""
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {OUTPUT_FORMATS}")
+    if fmt == "parquet":
+        _import_pyarrow()
+
+
+def with_format(path, fmt):
+    """Replace the extension of path with the one of the format"""
+    return f"{os.path.splitext(path)[0]}.{fmt}"
+
+
+def _nan_for_missing(df):
+    """Missing strings come back from parquet as None, the CSV reader gives NaN"""
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def _stream_schema(pa, table):
+    """Schema of the first chunk, widened so that the following chunks fit it"""
+    fields = []
+    for field in table.schema:
+        if pa.types.is_null(field.type):
+            # Column without any value in the first chunk
+            field = field.with_type(pa.string())
+        elif pa.types.is_integer(field.type):
+            # A later chunk may have missing values, which pandas stores as float
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def write_preprocessed(df, path, fmt="csv"):
+    """
+    Writes the preprocessed test set.
+
+    Parameters:
+    - df: pandas DataFrame of the test set with the lemmatized translations
+    - path: output file, the extension is replaced by the one of the format
+    - fmt: "csv" (';'-separated) or "parquet"
+
+    Returns:
+    - Path of the written file
+    """
+    path = with_format(path, fmt)
+    if fmt == "parquet":
+        _import_pyarrow()
+        df.to_parquet(path, index=False)
+    else:
+        with open(path, 'w', encoding='utf-8-sig') as f:
+            df.to_csv(f, index=False, sep=";")
+    return path
+
+
+def read_preprocessed(path, fmt="csv", columns=None):
+    """
+    Reads the preprocessed test set written by write_preprocessed.
+
+    Parameters:
+    - path: preprocessed file, the extension is replaced by the one of the format
+    - fmt: "csv" or "parquet"
+    - columns: optional list of the columns to read, default is all
+
+    Returns:
+    - pandas DataFrame, with NaN for missing values in both formats
+    """
+    path = with_format(path, fmt)
+    if fmt == "parquet":
+        _import_pyarrow()
+        return _nan_for_missing(pd.read_parquet(path, columns=columns))
+    return pd.read_csv(path, delimiter=';', encoding='utf-8-sig', usecols=columns)
+
+
+def iter_preprocessed(path, fmt="csv", chunk_size=10000):
+    """
+    Reads the preprocessed test set in chunks.
+
+    Parameters:
+    - path: preprocessed file, the extension is replaced by the one of the format
+    - fmt: "csv" or "parquet"
+    - chunk_size: int, number of rows per chunk
+
+    Yields:
+    - pandas DataFrame of up to chunk_size rows
+    """
+    path = with_format(path, fmt)
+    if fmt == "parquet":
+        pa = _import_pyarrow()
+        parquet_file = pa.parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield _nan_for_missing(batch.to_pandas())
+    else:
+        yield from pd.read_csv(path, delimiter=';', encoding='utf-8-sig', chunksize=chunk_size)
+
+
+def match_table(match_lists):
+    """
+    Arrow table of term results, one list<string> column per model.
+
+    Parameters:
+    - match_lists (dict): {model: list of the matched texts of every row}
+
+    Returns:
+    - pyarrow.Table
+    """
+    pa = _import_pyarrow()
+    return pa.table({col: pa.array(lists, type=pa.list_(pa.string())) for col, lists in match_lists.items()})
+
+
+def write_match_lists(match_lists, path):
+    """Write term results to parquet, see match_table"""
+    pa = _import_pyarrow()
+    pa.parquet.write_table(match_table(match_lists), path)
+
+
+# Appends DataFrame chunks to one parquet file, every chunk becomes a row group
+class ParquetChunkWriter:
+
+    def __init__(self, path, schema=None):
+        """
+        Initialize the ParquetChunkWriter class.
+
+        Args:
+            path: Output parquet file.
+            schema: Optional pyarrow schema, by default the widened schema of the first chunk.
+        """
+        self.pa = _import_pyarrow()
+        self.path = path
+        self.schema = schema
+        self._writer = None
+
+
+    def write(self, chunk):
+        """Append a DataFrame, or a pyarrow.Table, to the file"""
+        pa = self.pa
+        if isinstance(chunk, pd.DataFrame):
+            if self.schema is None:
+                self.schema = _stream_schema(pa, pa.Table.from_pandas(chunk, preserve_index=False))
+            table = pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False)
+        else:
+            table = chunk if self.schema is None else chunk.cast(self.schema)
+            self.schema = table.schema
+
+        # from_pandas stores pandas metadata, drop it so every chunk has the same schema
+        table = table.replace_schema_metadata(None)
+        if self._writer is None:
+            self._writer = pa.parquet.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,50 +1,640 @@
 import pandas
 import spacy
 import re
+import os
 from pathlib import Path
 import json
-from typing import List, Tuple
+import hashlib
+from typing import List, Tuple, NamedTuple
 from functools import wraps
+from collections import OrderedDict
+from array import array
+from bisect import bisect_left, bisect_right
 from utils.config.config import get_lang
+from utils.ngram_store import load_ngram_store, ngram_max_len
+from utils.lemma_cache import _context_free_pipeline
 
-
-# Load the spacy model
-
+import numpy as np
+import srsly
 from spacy.matcher import PhraseMatcher
-from spacy.lang.de import German
+from spacy.tokens import DocBin, Span
 
-nlp_de = German()
-matcher_de = PhraseMatcher(nlp_de.vocab, attr="LOWER")
 
 def language_check(lang_code):
     def decorator(func):
         @wraps(func)
-        def wrapper(*args, **kwargs):
-            if get_lang() != lang_code:
+        def wrapper(self, *args, **kwargs):
+            if self.resources.lang != lang_code:
                 return []  # skip and return empty list
-            return func(*args, **kwargs)
+            return func(self, *args, **kwargs)
         return wrapper
     return decorator
 
 
-#import external file with probabilities
-# Handling imports and environment variable for the upload of the external file with compound splitter probabilities
-lang = get_lang()
-print(f"Current language in term_finder_utils: {lang}")
-if lang == "de":
-    NGRAM_PATH = Path.cwd() / "ngram_probs.json"  # Use current working directory
+# Language objects and compound splitter probabilities, loaded on first use and shared by all TermFinders
+class TermFinderResources:
+
+    def __init__(self, lang, ngram_path=None):
+        """
+        Initialize the TermFinderResources class. Nothing is loaded until it is needed.
+
+        Args:
+            lang: Target language, "de" or "it".
+            ngram_path: Optional path of ngram_probs.json or of a store converted with utils/ngram_store.py.
+                        By default the working directory and then the repository root are searched.
+        """
+        if lang not in ("de", "it"):
+            raise ValueError("Unsupported language. Choose 'de' or 'it'.")
+        self.lang = lang
+        self.ngram_path = Path(ngram_path) if ngram_path is not None else None
+        self._nlp = None
+        self._ngram_probs = None
+        self._ngram_hash = None
+        self._infix_max_len = None
+
+
+    @property
+    def nlp(self):
+        """Blank spaCy pipeline of the target language, used for tokenization"""
+        if self._nlp is None:
+            if self.lang == "de":
+                from spacy.lang.de import German
+                self._nlp = German()
+            else:
+                from spacy.lang.it import Italian
+                self._nlp = Italian()
+        return self._nlp
+
+
+    def _find_ngram_path(self):
+        """Return the ngram store or JSON to load, preferring the converted store"""
+        if self.ngram_path is not None:
+            if not self.ngram_path.exists():
+                raise FileNotFoundError(f"File not found: {self.ngram_path}")
+            return self.ngram_path
+
+        # Working directory first, then the repository root
+        for search_dir in (Path.cwd(), Path(__file__).resolve().parent.parent):
+            for name in ("ngram_probs.marisa", "ngram_probs.json"):
+                path = search_dir / name
+                if path.exists():
+                    return path
+
+        raise FileNotFoundError(f"File not found: {Path.cwd() / 'ngram_probs.json'}")
+
+
+    def _load_ngrams(self):
+        if self.lang != "de":
+            raise ValueError("No ngram probabilities needed for Italian.")
+
+        path = self._find_ngram_path()
+        if path.is_dir():
+            # Memory-mapped, so worker processes share one copy of the tables
+            self._ngram_probs, self._ngram_hash = load_ngram_store(path)
+        else:
+            with open(path, "rb") as f:
+                ngram_bytes = f.read()
+            # The hash identifies the table, so cached splits are never reused with different probabilities
+            self._ngram_hash = hashlib.sha1(ngram_bytes).hexdigest()[:16]
+            self._ngram_probs = json.loads(ngram_bytes)
+
+        # Longer ngrams can never be found in the infix table
+        self._infix_max_len = ngram_max_len(self._ngram_probs["infix"])
+
+
+    @property
+    def ngram_probs(self):
+        """Compound splitter probabilities, a dict of "prefix", "infix" and "suffix" tables"""
+        if self._ngram_probs is None:
+            self._load_ngrams()
+        return self._ngram_probs
+
+
+    @property
+    def ngram_hash(self):
+        """Hash of the ngram_probs JSON file, computed without parsing the tables"""
+        if self._ngram_hash is None:
+            if self.lang != "de":
+                raise ValueError("No ngram probabilities needed for Italian.")
+            path = self._find_ngram_path()
+            if path.is_dir():
+                with open(path / "meta.json", encoding="utf-8") as f:
+                    self._ngram_hash = json.load(f)["source_hash"]
+            else:
+                with open(path, "rb") as f:
+                    self._ngram_hash = hashlib.sha1(f.read()).hexdigest()[:16]
+        return self._ngram_hash
+
+
+    @property
+    def infix_max_len(self):
+        """Length of the longest key of the infix table"""
+        if self._ngram_probs is None:
+            self._load_ngrams()
+        return self._infix_max_len
+
+
+_RESOURCES = {}
+
+def get_resources(lang=None, ngram_path=None):
+    """
+    Return the shared TermFinderResources for a language, creating them on first use.
+
+    Args:
+        lang: Target language, defaults to the one set with utils.config.config.set_lang.
+        ngram_path: Optional path of the ngram probabilities, see TermFinderResources.
+    """
+    lang = lang or get_lang()
+    key = (lang, str(ngram_path) if ngram_path is not None else None)
+    if key not in _RESOURCES:
+        _RESOURCES[key] = TermFinderResources(lang, ngram_path)
+    return _RESOURCES[key]
+
+
+# Term categories searched in the translations
+DOMAINS = ("South-Tyrol", "other_tyrol", "other_systems", "homonym")
+
+# Endings of a Fugen-S, cut off before looking up compound parts
+FUGEN_S = ('ts', 'gs', 'ks', 'hls', 'ns')
+
+
+# Matched term detached from its Doc, so results can be sent between processes
+class TermMatch(NamedTuple):
+    start: int
+    end: int
+    text: str
+    term_id: int
+
+
+def to_term_matches(spans, label_ids):
+    """
+    Convert matched spans to TermMatch tuples.
+
+    Args:
+        spans: Spans returned by a matcher of MatcherCache
+        label_ids: Dictionary {label hash: term position} from MatcherCache.label_ids
 
-    if not NGRAM_PATH.exists():
-        raise FileNotFoundError(f"File not found: {NGRAM_PATH}")
+    Returns:
+        List of TermMatch, term_id is the position of the matched term in its term list (-1 if unknown)
+    """
+    return [TermMatch(span.start, span.end, span.text, label_ids.get(span.label, -1)) for span in spans]
 
-    with open(NGRAM_PATH) as f:
-        ngram_probs = json.load(f)
 
-    print("Loaded ngram_probs successfully!")
+# Matches of one model in one domain, stored as flat columns indexed by row position
+class TermResults:
 
-else:
-    print("No ngram probabilities needed for Italian.")
+    def __init__(self, n_rows=0):
+        """
+        Initialize the TermResults class.
 
+        Args:
+            n_rows: Number of rows already covered, all without matches.
+        """
+        self.n_rows = n_rows
+        self.rows = array("l")
+        self.starts = array("l")
+        self.ends = array("l")
+        self.term_ids = array("l")
+        self.texts = []
+
+
+    def add_row(self, matches):
+        """Append the next row with its list of TermMatch"""
+        for match in matches:
+            self.rows.append(self.n_rows)
+            self.starts.append(match.start)
+            self.ends.append(match.end)
+            self.term_ids.append(match.term_id)
+            self.texts.append(match.text)
+        self.n_rows += 1
+
+
+    def extend(self, other):
+        """Append all rows of another TermResults, e.g. a chunk computed in a worker process"""
+        self.rows.extend(row + self.n_rows for row in other.rows)
+        self.starts.extend(other.starts)
+        self.ends.extend(other.ends)
+        self.term_ids.extend(other.term_ids)
+        self.texts.extend(other.texts)
+        self.n_rows += other.n_rows
+
+
+    def row_matches(self, row):
+        """Return the list of TermMatch of a row"""
+        # Rows are appended in order, so the matches of a row are contiguous
+        lo = bisect_left(self.rows, row)
+        hi = bisect_right(self.rows, row, lo)
+        return [TermMatch(self.starts[i], self.ends[i], self.texts[i], self.term_ids[i]) for i in range(lo, hi)]
+
+
+    def match_texts(self):
+        """Return the matched texts of every row, as one list per row"""
+        texts = [[] for _ in range(self.n_rows)]
+        for row, text in zip(self.rows, self.texts):
+            texts[row].append(text)
+        return texts
+
+
+    def hit_rows(self):
+        """Return a boolean array, True for the rows with at least one match"""
+        return np.bincount(np.frombuffer(self.rows, dtype=self.rows.typecode), minlength=self.n_rows) > 0
+
+
+    def to_dict(self):
+        """Return the columns as plain lists, e.g. to save them as JSON"""
+        return {
+            "n_rows": self.n_rows,
+            "rows": self.rows.tolist(),
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+            "term_ids": self.term_ids.tolist(),
+            "texts": list(self.texts),
+        }
+
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a TermResults saved with to_dict"""
+        results = cls(data["n_rows"])
+        results.rows.extend(data["rows"])
+        results.starts.extend(data["starts"])
+        results.ends.extend(data["ends"])
+        results.term_ids.extend(data["term_ids"])
+        results.texts.extend(data["texts"])
+        return results
+
+
+    def __len__(self):
+        return self.n_rows
+
+
+    def __getitem__(self, row):
+        return self.row_matches(row)
+
+
+    def __iter__(self):
+        return (self.row_matches(row) for row in range(self.n_rows))
+
+
+# Cache of compiled PhraseMatchers, so the same term list is only turned into patterns once
+class MatcherCache:
+
+    def __init__(self, nlp_model, maxsize=4096):
+        """
+        Least-recently-used cache of PhraseMatchers keyed by the normalized term tuple.
+
+        Args:
+            nlp_model: A SpaCy language model instance whose vocab and tokenizer build the patterns.
+            maxsize: Maximum number of matchers kept in memory.
+        """
+        self.nlp = nlp_model
+        self.maxsize = max(1, maxsize)
+        # key -> (matcher, {term: label hash}), the labels of a term list are evicted together with its matcher
+        self._matchers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def normalize(list_of_terms):
+        """Drop empty or invalid terms and return the rest as a sorted, duplicate-free tuple"""
+        return tuple(sorted({term for term in list_of_terms if term and isinstance(term, str) and term.strip()}))
+
+
+    def get(self, list_of_terms):
+        """
+        Return the PhraseMatcher for a list of terms, compiling it on first use.
+
+        Args:
+            list_of_terms: List of terms to search for
+
+        Returns:
+            PhraseMatcher, or None if there is no valid term
+        """
+        key = self.normalize(list_of_terms)
+        if not key:
+            return None
+
+        entry = self._matchers.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._matchers.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+        # LOWER attribute for case-insensitive matching
+        matcher = PhraseMatcher(self.nlp.vocab, attr="LOWER")
+        labels = {}
+        for term in key:
+            pattern = self.nlp.make_doc(term)
+            # Terms with the same lowercase tokens are the same pattern and share a label,
+            # so they still produce a single match
+            label = " ".join(token.lower_ for token in pattern)
+            matcher.add(label, [pattern])
+            labels[term] = self.nlp.vocab.strings[label]
+
+        self._matchers[key] = (matcher, labels)
+        if len(self._matchers) > self.maxsize:
+            self._matchers.popitem(last=False)
+
+        return matcher
+
+
+    def label_ids(self, list_of_terms):
+        """
+        Map the match labels of a term list, as compiled by get(), to the position of the first term with that label.
+
+        Args:
+            list_of_terms: List of terms passed to get(), compiled again if its matcher was evicted
+
+        Returns:
+            Dictionary {label hash: term position}
+        """
+        key = self.normalize(list_of_terms)
+        if not key:
+            return {}
+        if key not in self._matchers:
+            self.get(list_of_terms)
+        labels = self._matchers[key][1]
+
+        label_ids = {}
+        for term_id, term in enumerate(list_of_terms):
+            label = labels.get(term) if isinstance(term, str) else None
+            if label is not None:
+                label_ids.setdefault(label, term_id)
+        return label_ids
+
+
+    def __len__(self):
+        return len(self._matchers)
+
+
+# One PhraseMatcher over every term of the test set, so each sentence is scanned once for all rows and domains
+class TermIndex:
+
+    def __init__(self, nlp_model, path=None):
+        """
+        Initialize the TermIndex class.
+
+        Terms are compiled like in MatcherCache: lowercase token patterns, and terms with the same
+        lowercase tokens share a label. Matches of the whole index are filtered down to the labels
+        of a row's term list, which gives the matches of a matcher compiled for that list only.
+
+        Args:
+            nlp_model: A SpaCy language model instance whose vocab and tokenizer build the patterns.
+            path: Optional file the pattern Docs, term labels and lemmatized terms are loaded from and saved to.
+        """
+        self.nlp = nlp_model
+        self.path = Path(path) if path is not None else None
+        self.matcher = PhraseMatcher(nlp_model.vocab, attr="LOWER")
+        self._labels = {}
+        self._patterns = set()
+        self._docs = {}
+        self._tokens = {}
+        # Split, lemmatized form of every term seen by the compound-split fallback, see TermFinder._lemmatize_term
+        self.lemmas = {}
+        # Increased whenever patterns are added, so matches computed before can be recognized as stale
+        self.version = 0
+
+        if self.path is not None and self.path.exists():
+            self._load()
+        self._saved = self._state()
+
+
+    @classmethod
+    def for_test_set(cls, nlp_model, cache_dir, key):
+        """
+        Return an index persisted in cache_dir under a file name tied to key, which should combine the
+        hashes of the test set terms and of the ngram_probs table and the identity of the pipeline.
+        """
+        return cls(nlp_model, path=Path(cache_dir) / f"term_index_{key}.msgpack")
+
+
+    def _add_pattern(self, label, pattern):
+        self.matcher.add(label, [pattern])
+        self._patterns.add(label)
+        self._docs[self.nlp.vocab.strings[label]] = pattern
+        self.version += 1
+
+
+    def add(self, list_of_terms):
+        """Add the valid terms of a list that are not indexed yet"""
+        for term in list_of_terms:
+            if term in self._labels or not (term and isinstance(term, str) and term.strip()):
+                continue
+            pattern = self.nlp.make_doc(term)
+            label = " ".join(token.lower_ for token in pattern)
+            if label not in self._patterns:
+                self._add_pattern(label, pattern)
+            self._labels[term] = self.nlp.vocab.strings[label]
+
+
+    def add_lemmas(self, lemmas):
+        """Add lemmatized terms computed by another index, e.g. in a worker process, and their patterns"""
+        self.lemmas.update(lemmas)
+        self.add(lemmas.values())
+
+
+    def pattern_tokens(self, term):
+        """Lowercase tokens of the pattern of a term"""
+        tokens = self._tokens.get(term)
+        if tokens is None:
+            label = self._labels.get(term)
+            pattern = self._docs[label] if label is not None else self.nlp.make_doc(term)
+            tokens = frozenset(token.lower_ for token in pattern)
+            self._tokens[term] = tokens
+        return tokens
+
+
+    def label_ids(self, list_of_terms):
+        """
+        Map the labels of a term list to the position of the first term with that label, indexing new terms first.
+
+        Args:
+            list_of_terms: List of terms to search for
+
+        Returns:
+            Dictionary {label hash: term position}, empty if there is no valid term
+        """
+        self.add(list_of_terms)
+        label_ids = {}
+        for term_id, term in enumerate(list_of_terms):
+            label = self._labels.get(term) if isinstance(term, str) else None
+            if label is not None:
+                label_ids.setdefault(label, term_id)
+        return label_ids
+
+
+    def __call__(self, doc):
+        """All (label hash, start, end) matches of the indexed terms in a Doc, or in a Span relative to its start"""
+        matches = self.matcher(doc)
+        if isinstance(doc, Span) and doc.start:
+            offset = doc.start
+            matches = [(label, start - offset, end - offset) for label, start, end in matches]
+        return matches
+
+
+    @staticmethod
+    def select(doc, matches, label_ids):
+        """
+        Keep the matches of one term list.
+
+        Args:
+            doc: Doc or Span the matches were found in
+            matches: Matches of the whole index, from __call__
+            label_ids: Labels of the term list, from label_ids
+
+        Returns:
+            List of TermMatch, in the order of the matches
+        """
+        return [TermMatch(start, end, doc[start:end].text, label_ids[label])
+                for label, start, end in matches if label in label_ids]
+
+
+    def _state(self):
+        return len(self._labels), len(self.lemmas)
+
+
+    def _load(self):
+        self.from_bytes(self.path.read_bytes())
+
+
+    def from_bytes(self, data):
+        """Add the patterns, term labels and lemmatized terms of to_bytes, without tokenizing any term"""
+        data = srsly.msgpack_loads(data)
+        patterns = DocBin().from_bytes(data["patterns"]).get_docs(self.nlp.vocab)
+        for label, pattern in zip(data["labels"], patterns):
+            if label not in self._patterns:
+                self._add_pattern(label, pattern)
+        hashes = [self.nlp.vocab.strings[label] for label in data["labels"]]
+        self._labels.update({term: hashes[i] for term, i in data["terms"].items()})
+        self.lemmas.update(data["lemmas"])
+        return self
+
+
+    def to_bytes(self):
+        """The pattern Docs, term labels and lemmatized terms, e.g. to send the index to a worker process"""
+        labels = list(self._docs)
+        positions = {label: i for i, label in enumerate(labels)}
+        patterns = DocBin(attrs=["ORTH"])
+        for label in labels:
+            patterns.add(self._docs[label])
+        return srsly.msgpack_dumps({
+            "patterns": patterns.to_bytes(),
+            "labels": [self.nlp.vocab.strings[label] for label in labels],
+            "terms": {term: positions[label] for term, label in self._labels.items()},
+            "lemmas": self.lemmas,
+        })
+
+
+    def save(self):
+        """Write the index to its file, if there is one and terms were added since it was loaded"""
+        if self.path is None or self._state() == self._saved:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file of this process first, so an interrupted run never leaves a truncated index
+        # and shards running at once never write into the same file
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(self.to_bytes())
+        os.replace(tmp_path, self.path)
+        self._saved = self._state()
+
+
+    def __len__(self):
+        return len(self._patterns)
+
+
+# Cache of compound splits, since the same legal vocabulary recurs in every sentence and every run
+class SplitCache:
+
+    def __init__(self, maxsize=100000, path=None):
+        """
+        Least-recently-used cache of split_compound results, optionally persisted as JSON.
+
+        Args:
+            maxsize: Maximum number of words kept in memory.
+            path: Optional JSON file the cache is loaded from and saved to.
+        """
+        self.maxsize = maxsize
+        self.path = Path(path) if path is not None else None
+        self._splits = OrderedDict()
+        self._new_splits = {}
+        self.hits = 0
+        self.misses = 0
+
+        if self.path is not None and self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for word, splits in json.load(f).items():
+                    self._splits[word] = [tuple(split) for split in splits]
+            while len(self._splits) > self.maxsize:
+                self._splits.popitem(last=False)
+
+
+    @classmethod
+    def for_ngrams(cls, cache_dir, ngram_hash, maxsize=100000):
+        """Return a cache persisted in cache_dir under a file name tied to the ngram_probs table"""
+        return cls(maxsize=maxsize, path=Path(cache_dir) / f"split_compound_{ngram_hash}.json")
+
+
+    def get(self, word, split_function):
+        """
+        Return the splits of a word, calling split_function only on a miss.
+
+        Args:
+            word: Word to be split
+            split_function: Function computing the splits of a word
+
+        Returns:
+            List of all splits, best first
+        """
+        key = word.lower()
+        splits = self._splits.get(key)
+        if splits is not None:
+            self.hits += 1
+            self._splits.move_to_end(key)
+            return splits
+
+        self.misses += 1
+        splits = split_function(key)
+        self._splits[key] = splits
+        self._new_splits[key] = splits
+        if len(self._splits) > self.maxsize:
+            self._splits.popitem(last=False)
+
+        return splits
+
+
+    def pop_new(self):
+        """Return the splits computed since the last call, e.g. to send them back from a worker process"""
+        new_splits, self._new_splits = self._new_splits, {}
+        return new_splits
+
+
+    def update(self, splits, hits=0, misses=0):
+        """Add splits and counts collected by another cache, e.g. in a worker process"""
+        for word, word_splits in splits.items():
+            self._splits[word] = word_splits
+            self._splits.move_to_end(word)
+        while len(self._splits) > self.maxsize:
+            self._splits.popitem(last=False)
+        self.hits += hits
+        self.misses += misses
+
+
+    def save(self):
+        """Write the cached splits to the cache file, if there is one"""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Shards running at once may save the same cache, the last complete file wins
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._splits, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+    def __len__(self):
+        return len(self._splits)
 
 
 # This function restructures the data as a tuple with four elements: string, string, list or nan, list or nan
@@ -86,15 +676,40 @@ def create_entries(table, translation_columns, homonym = False):
 
 class TermFinder:
 
-    def __init__(self, nlp_model, entry_list):
+    def __init__(self, nlp_model, entry_list, matcher_cache=None, split_cache=None, resources=None, profiler=None,
+                 term_index=None, docs=None, fallback_precheck=True):
         """
         Initialize the TermMatcher class.
 
         Args:
-            nlp_model: A SpaCy language model instance.
+            nlp_model: A SpaCy language model instance, defaults to the blank pipeline of the resources.
+            entry_list: List of entries created by create_entries.
+            matcher_cache: Optional MatcherCache shared between TermFinder instances.
+            split_cache: Optional SplitCache shared between TermFinder instances.
+            resources: Optional TermFinderResources, defaults to the shared resources of the current language.
+            profiler: Optional Profiler recording the time of every matching step and the match counters.
+            term_index: Optional TermIndex shared between TermFinder instances, used by find_terms. It also keeps
+                        the lemmatized terms of the compound-split fallback.
+            docs: Optional Docs or Spans of the lemmatized sentences, one per entry (see doc_store.load_lemma_docs),
+                  matched by find_terms instead of tokenizing the sentences. Vocab must be the one of nlp_model.
+            fallback_precheck: Skip the compound-split fallback for sentences no term can match, see _fallback_candidate.
+                               Only used when the lemmas of nlp_model do not depend on the context.
         """
-        self.nlp = nlp_model
+        self.resources = resources if resources is not None else get_resources()
+        self.nlp = nlp_model if nlp_model is not None else self.resources.nlp
         self.entry_list = entry_list
+        if docs is not None and len(docs) != len(entry_list):
+            raise ValueError(f"Got {len(docs)} Docs for {len(entry_list)} entries")
+        self.docs = docs
+        self.matcher_cache = matcher_cache if matcher_cache is not None else MatcherCache(self.nlp)
+        self.split_cache = split_cache if split_cache is not None else SplitCache()
+        self.term_index = term_index if term_index is not None else TermIndex(self.nlp)
+        # Only an enabled profiler is kept, so without profiling the matching loop only checks for None
+        self.profiler = profiler if profiler is not None and profiler.enabled else None
+        self._split_doc = None
+        self._split_matches = None
+        # Tokens each word contributes to the split, lemmatized sentence, None if lemmas depend on context
+        self._word_tokens = {} if fallback_precheck and _context_free_pipeline(self.nlp) else None
 
 
     def check_type(self, terms_list):
@@ -103,6 +718,14 @@ class TermFinder:
 
 
     def split_compound(self, word: str) -> List[Tuple[float, str, str]]:
+        """Return list of possible splits, best first, memoized in the split cache.
+        :param word: Word to be split
+        :return: List of all splits
+        """
+        return self.split_cache.get(word, self._split_compound)
+
+
+    def _split_compound(self, word: str) -> List[Tuple[float, str, str]]:
         """Return list of possible splits, best first.
         :param word: Word to be split
         :return: List of all splits
@@ -113,67 +736,53 @@ class TermFinder:
         if '-' in word:
             return [(1., re.search('(.*)-', word.title()).group(1), re.sub('.*-', '', word.title()))]
 
+        ngram_probs = self.resources.ngram_probs
+        suffix_probs = ngram_probs["suffix"]
+        infix_probs = ngram_probs["infix"]
+        prefix_probs = ngram_probs["prefix"]
+        infix_max_len = self.resources.infix_max_len
+        length = len(word)
+
         scores = list() # Score for each possible split position
 
         # Iterate through characters, start at forth character, go to 3rd last
-        for n in range(3, len(word)-2):
+        for n in range(3, length-2):
             pre_slice = word[:n]
 
             # Cut of Fugen-S
-            if pre_slice.endswith('ts') or pre_slice.endswith('gs') or pre_slice.endswith('ks') \
-                    or pre_slice.endswith('hls') or pre_slice.endswith('ns'):
-                if len(word[:n-1]) > 2: pre_slice = word[:n-1]
-
-            # Start, in, and end probabilities
-            pre_slice_prob = list()
-            in_slice_prob = list()
-            start_slice_prob = list()
-
-            # Extract all ngrams
-            for k in range(len(word)+1, 2, -1):
-
-                # Probability of first compound, given by its ending prob
-                if not pre_slice_prob and k <= len(pre_slice):
-                    # The line above deviates from the description in the thesis;
-                    # it only considers word[:n] as the pre_slice.
-                    # This improves accuracy on GermEval and increases speed.
-                    # Use the line below to replicate the original implementation:
-                    # if k <= len(pre_slice):
-                    end_ngram = pre_slice[-k:]  # Look backwards
-                    pre_slice_prob.append(ngram_probs["suffix"].get(end_ngram, -1))   # Punish unlikely pre_slice end_ngram
-
-                # Probability of ngram in word, if high, split unlikely
-                in_ngram = word[n:n+k]
-                in_slice_prob.append(ngram_probs["infix"].get(in_ngram, 1)) # Favor ngrams not occurring within words
-
-                # Probability of word starting
-                # The condition below deviates from the description in the thesis (see above comments);
-                # Remove the condition to restore the original implementation.
-                if not start_slice_prob:
-                    ngram = word[n:n+k]
-                    # Cut Fugen-S
-                    if ngram.endswith('ts') or ngram.endswith('gs') or ngram.endswith('ks') \
-                            or ngram.endswith('hls') or ngram.endswith('ns'):
-                        if len(ngram[:-1]) > 2:
-                            ngram = ngram[:-1]
-
-                    start_slice_prob.append(ngram_probs["prefix"].get(ngram, -1))
-
-            if not pre_slice_prob or not start_slice_prob:
-                continue
+            if pre_slice.endswith(FUGEN_S) and n-1 > 2:
+                pre_slice = word[:n-1]
+
+            # Probability of first compound, given by its ending prob.
+            # Only the longest ngram, i.e. the whole pre_slice, is considered (deviates from the thesis,
+            # but improves accuracy on GermEval and increases speed).
+            pre_slice_prob = suffix_probs.get(pre_slice, -1)   # Punish unlikely pre_slice end_ngram
+
+            # Probability of ngrams in word, if high, split unlikely.
+            # Ngrams longer than the longest infix key always miss and score 1; every ngram
+            # longer than the rest of the word is the rest of the word itself.
+            rest = length - n
+            in_slice_prob = min([infix_probs.get(word[n:n+k], 1) for k in range(3, min(rest, infix_max_len) + 1)],
+                                default=1)
+            if rest > infix_max_len:
+                in_slice_prob = min(in_slice_prob, 1) # Favor ngrams not occurring within words
+
+            # Probability of word starting, again only for the longest ngram
+            ngram = word[n:]
+            # Cut Fugen-S
+            if ngram.endswith(FUGEN_S) and rest-1 > 2:
+                ngram = ngram[:-1]
+            start_slice_prob = prefix_probs.get(ngram, -1)
 
-            start_slice_prob = max(start_slice_prob)
-            pre_slice_prob = max(pre_slice_prob)  # Highest, best pre_slice
-            in_slice_prob = min(in_slice_prob)  # Lowest, punish splitting of good in_grams
             score = start_slice_prob - in_slice_prob + pre_slice_prob
             scores.append((score, word[:n].title(), word[n:].title()))
 
-        scores.sort(reverse=True)
-
         if not scores:
             scores = [[0, word.title(), word.title()]]
 
-        return sorted(scores, reverse = True)
+        scores.sort(reverse=True)
+
+        return scores
 
 
     def phrase_matcher(self, sentence, list_of_terms):
@@ -187,20 +796,12 @@ class TermFinder:
         Returns:
             List of matched spans
         """
-        # Create a fresh matcher with LOWER attribute for case-insensitive matching
-        matcher = PhraseMatcher(self.nlp.vocab, attr="LOWER")
+        # Reuse the compiled matcher for this term list
+        matcher = self.matcher_cache.get(list_of_terms)
 
-        # Filter out empty or invalid terms
-        valid_terms = [term for term in list_of_terms if term and isinstance(term, str) and term.strip()]
-        
-        if not valid_terms:
+        if matcher is None:
             return []
 
-        pattern_de = [self.nlp.make_doc(term) for term in valid_terms]
-        match_id_str = "TERM_MATCH"
-
-        matcher.add(match_id_str, pattern_de)
-
         doc = self.nlp(sentence)
         matches = matcher(doc, as_spans=True)
 
@@ -218,23 +819,15 @@ class TermFinder:
         Returns:
             List of matched spans
         """
-        # Create a fresh matcher with LOWER attribute for case-insensitive matching
-        matcher = PhraseMatcher(self.nlp.vocab, attr="LOWER")
+        # Reuse the compiled matcher for this term list
+        matcher = self.matcher_cache.get(list_of_terms)
 
-        # Filter out empty or invalid terms
-        valid_terms = [term for term in list_of_terms if term and isinstance(term, str) and term.strip()]
-        
-        if not valid_terms:
+        if matcher is None:
             return []
 
-        pattern_de = [self.nlp.make_doc(term) for term in valid_terms]
-        match_id_str = "TERM_MATCH"
-
-        matcher.add(match_id_str, pattern_de)
-
         doc = self.nlp(sentence)
 
-        matches = matcher(doc, as_spans=True)  
+        matches = matcher(doc)
 
         # Extract spans from matches 
         result = []
@@ -245,29 +838,134 @@ class TermFinder:
         return result
 
 
+    def _split_text(self, text):
+        """Split the compounds of every word in a text"""
+        return " ".join(
+            " ".join(self.split_compound(word)[0][1:]) for word in text.split()
+        )
+
+
+    def _split_sentence_doc(self, sent):
+        """
+        Return the Doc of the compound-split, lemmatized sentence.
+
+        The last sentence is remembered, so the fallback of every domain reuses the same Doc.
+        """
+        if self._split_doc is None or self._split_doc[0] != sent:
+            lemmatized_sent = " ".join(token.lemma_ for token in self.nlp(self._split_text(sent)))
+            self._split_doc = (sent, self.nlp(lemmatized_sent))
+        return self._split_doc[1]
+
+
+    def _lemmatize_term(self, term):
+        """Split the compounds of a term and lemmatize it, once per term"""
+        lemmatized = self.term_index.lemmas.get(term)
+        if lemmatized is None:
+            lemmatized = " ".join(token.lemma_ for token in self.nlp(self._split_text(term).strip()))
+            self.term_index.lemmas[term] = lemmatized
+        return lemmatized
+
+
+    def _word_lemma_tokens(self, word):
+        """Lowercase tokens one word of a sentence becomes in the split, lemmatized sentence"""
+        tokens = self._word_tokens.get(word)
+        if tokens is None:
+            lemmatized_word = " ".join(token.lemma_ for token in self.nlp(self._split_text(word)))
+            tokens = frozenset(token.lower_ for token in self.nlp.make_doc(lemmatized_word))
+            self._word_tokens[word] = tokens
+        return tokens
+
+
+    def _fallback_candidate(self, sent, lemmatized_terms):
+        """
+        Check whether any lemmatized term could match the split, lemmatized sentence.
+
+        The tokenizer works on each whitespace-separated chunk on its own, and with context-free
+        lemmas every word of the sentence always becomes the same tokens. So a term can only match
+        if all its pattern tokens are among the tokens of the words, which are cached per word.
+
+        Args:
+            sent: The original sentence
+            lemmatized_terms: Terms as returned by _lemmatize_term
+
+        Returns:
+            False if no term can match, so the whole sentence does not need to be split and lemmatized
+        """
+        if self._word_tokens is None:
+            return True
+
+        sent_tokens = set()
+        for word in sent.split():
+            sent_tokens.update(self._word_lemma_tokens(word))
+
+        for term in MatcherCache.normalize(lemmatized_terms):
+            tokens = self.term_index.pattern_tokens(term)
+            # Empty lemmas leave whitespace tokens, which depend on the neighbouring words
+            if tokens <= sent_tokens or any(token.isspace() for token in tokens):
+                return True
+        return False
+
+
     @language_check("de")
     def _compound_split_matcher(self, sent: str, terms_list: list[str]):
-        # Split compounds in sentence and terms
-        split_sent = " ".join(
-            " ".join(self.split_compound(word)[0][1:]) for word in sent.split()
-        )
-        split_terms = [
-            " ".join(" ".join(self.split_compound(word)[0][1:]) for word in t.split())
-            for t in terms_list
-        ]
+        # Split compounds in terms and lemmatize
+        lemmatized_terms = [self._lemmatize_term(t) for t in terms_list]
 
-        # Lemmatize
-        lemmatized_sent = " ".join(token.lemma_ for token in self.nlp(split_sent))
-        lemmatized_terms = [
-            " ".join(token.lemma_ for token in self.nlp(split_term.strip()))
-            for split_term in split_terms
-        ]
+        label_ids = self.term_index.label_ids(lemmatized_terms)
+        if not label_ids:
+            return []
+
+        # Skip splitting and lemmatizing the sentence when no term can be in it
+        if not self._fallback_candidate(sent, lemmatized_terms):
+            if self.profiler is not None:
+                self.profiler.count("fallback skipped by precheck")
+            return []
 
-        # Match again
-        split_match = self.phrase_matcher(lemmatized_sent, lemmatized_terms)
+        # Match again on the split, lemmatized sentence, scanned by the index once for all domains
+        doc = self._split_sentence_doc(sent)
+        if self._split_matches is None or self._split_matches[0] is not doc or self._split_matches[1] != self.term_index.version:
+            self._split_matches = (doc, self.term_index.version, self.term_index(doc))
 
-        return split_match
-    
+        return TermIndex.select(doc, self._split_matches[2], label_ids)
+
+
+    def domain_terms(self, domain, term, other_term_list, other_system_list, homonym_list):
+        """
+        Return the list of terms of an entry to search for in a domain.
+
+        Args:
+            domain: One of "South-Tyrol", "other_tyrol", "other_systems" or "homonym"
+            term, other_term_list, other_system_list, homonym_list: Fields of an entry from create_entries
+
+        Returns:
+            List of terms, empty if the entry has none for the domain
+        """
+        if domain == "South-Tyrol":
+            if self.check_type(term):
+                return list(term)
+            return []
+
+        elif domain == "other_tyrol":
+            if self.check_type(other_term_list):
+                return other_term_list
+            return []
+
+        elif domain == "other_systems":
+            if self.check_type(other_system_list):
+                return other_system_list
+            return []
+
+        #Further check to keep only the wrong homonym among the term options
+        elif domain == "homonym":
+            if self.check_type(homonym_list):
+                raw_terms_list = homonym_list[0]
+
+                term_str = term if isinstance(term, str) else str(term)
+                return [h for h in raw_terms_list if h not in term_str]
+            return []
+
+        else:
+            raise Exception("Invalid argument. You must choose a domain among 'South-Tyrol', 'other_tyrol', 'other_systems' or 'homonym'")
 
 
     def find_terms(self, domain, homonym=False):
@@ -278,67 +976,113 @@ class TermFinder:
             domain: One of "South-Tyrol", "other_tyrol", "other_systems" or "homonym"
             
         Returns:
-            Dictionary mapping sentences to their matched terms
+            TermResults with the matched terms of every row of entry_list
         """
-        results = {}
-        for sent, term, other_term_list, other_system_list, *homonym_list in self.entry_list:      
+        return self.find_terms_multi([domain])[domain]
 
-                # Skip if sentence is None or empty
-            if not sent or not isinstance(sent, str):
-                    results[sent] = []
-                    continue
 
-            # Determine which terms list to use based on domain
-            if domain == "South-Tyrol":
-                if self.check_type(term):
-                    terms_list = list(term)
-                else:
-                    terms_list = []
+    def index_terms(self, domains=DOMAINS):
+        """Add the terms of every entry in the given domains to the TermIndex"""
+        for sent, term, other_term_list, other_system_list, *homonym_list in self.entry_list:
+            for domain in domains:
+                terms_list = self.domain_terms(domain, term, other_term_list, other_system_list, homonym_list)
+                if terms_list:
+                    self.term_index.add(terms_list)
 
-            elif domain == "other_tyrol":
-                if self.check_type(other_term_list):
-                    terms_list = other_term_list
-                else:
-                    terms_list = []
-                    
-            elif domain == "other_systems":
-                if self.check_type(other_system_list):
-                    terms_list = other_system_list
-                else:
-                    terms_list = []
 
-            #Further check to keep only the wrong homonym among the term options
-            elif domain == "homonym":
-                if self.check_type(homonym_list):
-                    raw_terms_list = homonym_list[0]
+    def find_terms_rows(self, domains=DOMAINS):
+        """
+        Find terms of several domains in one pass over the sentences, keeping one result per row.
 
-                    term_str = term if isinstance(term, str) else str(term)
-                    terms_list = [h for h in raw_terms_list if h not in term_str]
+        Each sentence is tokenized (or taken from docs) and scanned by the TermIndex once, and the matches of every
+        domain are the hits of its terms. The compound-split fallback Doc is built and scanned at
+        most once per sentence.
 
-                else:
-                    terms_list = []
-                    
-            else:
+        Args:
+            domains: List of domains among "South-Tyrol", "other_tyrol", "other_systems" and "homonym"
+
+        Yields:
+            Dictionary mapping each domain to the list of TermMatch of the row, in entry_list order.
+            Matches found after compound splitting index the tokens of the split, lemmatized sentence.
+        """
+        for domain in domains:
+            if domain not in DOMAINS:
                 raise Exception("Invalid argument. You must choose a domain among 'South-Tyrol', 'other_tyrol', 'other_systems' or 'homonym'")
-    
-            # If terms_list is empty or contains only invalid values, skip
-            if not terms_list:
-                results[sent] = []
+
+        prof = self.profiler
+        if prof is not None:
+            prof.lap()
+        self.index_terms(domains)
+        if prof is not None:
+            prof.lap("build term index")
+
+        for row_id, (sent, term, other_term_list, other_system_list, *homonym_list) in enumerate(self.entry_list):
+
+            # Skip if sentence is None or empty
+            if not sent or not isinstance(sent, str):
+                yield {domain: [] for domain in domains}
                 continue
-            
-            # Try to find terms with spacy
-            pattern_match = self.phrase_matcher(sent, terms_list)
-            #print(f"Sentence: {sent[:50]}... | Terms: {terms_list} | Matches: {[m.text for m in pattern_match]}")
-            
-            if len(pattern_match) == 0:  # if no match found, try again with compound split
-                
 
-                split_pattern_match = self._compound_split_matcher(sent, terms_list)
-                results[sent] = split_pattern_match  # term found after compound splitting
+            if prof is not None:
+                prof.lap()
+
+            row = {}
+            doc = None
+            matches = None
+            index_version = None
+            for domain in domains:
+                terms_list = self.domain_terms(domain, term, other_term_list, other_system_list, homonym_list)
+
+                # If terms_list is empty or contains only invalid values, skip
+                label_ids = self.term_index.label_ids(terms_list) if terms_list else {}
+                if prof is not None:
+                    prof.lap("term lists")
+                if not label_ids:
+                    row[domain] = []
+                    continue
 
-            else:
-                results[sent] = pattern_match  # term found after normal spacy matching
+                # Try to find terms with spacy, tokenizing and scanning the sentence only once
+                if doc is None:
+                    doc = self.nlp(sent) if self.docs is None else self.docs[row_id]
+                    if prof is not None:
+                        prof.lap("tokenize")
+                if matches is None or index_version != self.term_index.version:
+                    matches = self.term_index(doc)
+                    index_version = self.term_index.version
+                    if prof is not None:
+                        prof.lap("index scan")
+                pattern_match = TermIndex.select(doc, matches, label_ids)
+                if prof is not None:
+                    prof.lap(f"exact match [{domain}]")
+
+                if len(pattern_match) == 0:  # if no match found, try again with compound split
+                    row[domain] = self._compound_split_matcher(sent, terms_list)  # term found after compound splitting
+                    if prof is not None:
+                        prof.lap(f"compound-split fallback [{domain}]")
+                        prof.count(f"{domain}: fallback calls")
+                        prof.count(f"{domain}: fallback hits", bool(row[domain]))
+                else:
+                    # term found after normal spacy matching
+                    row[domain] = pattern_match
+                    if prof is not None:
+                        prof.count(f"{domain}: exact hits")
 
-        return results
-    
+            yield row
 
+
+    def find_terms_multi(self, domains=DOMAINS):
+        """
+        Find terms of several domains in one pass over the sentences, see find_terms_rows.
+
+        Args:
+            domains: List of domains among "South-Tyrol", "other_tyrol", "other_systems" and "homonym"
+
+        Returns:
+            Dictionary mapping each domain to a TermResults with one row per entry
+        """
+        results = {domain: TermResults() for domain in domains}
+        for row in self.find_terms_rows(domains):
+            for domain in domains:
+                results[domain].add_row(row[domain])
+
+        return results